@@ -0,0 +1,64 @@
+"""
+Measures the cold start cost paid by every fresh worker process.
+Each module is imported in a new interpreter, the best of a few runs is reported together with the
+heavy optional dependencies the import pulled in.
+
+    python benchmarks/import_time.py [module ...]
+"""
+import os
+import subprocess
+import sys
+
+DEFAULT_MODULES = [
+    "data.utils",
+    "market.clock",
+    "market.traders",
+    "model.statistics",
+    "model.strategy",
+    "market.drivers",
+    "market.portfolio",
+    "main",
+]
+HEAVY_MODULES = ["scipy", "statsmodels", "matplotlib", "yfinance", "sklearn"]
+RUNS = 5
+
+PROBE = """
+import sys, time
+t = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(elapsed, ",".join(heavy))
+"""
+
+
+def time_import(module, runs=RUNS):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    best = None
+    heavy = ""
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=root,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        elapsed = float(out[0])
+        heavy = out[1] if len(out) > 1 else ""
+        best = elapsed if best is None else min(best, elapsed)
+    return best, heavy
+
+
+def main():
+    modules = sys.argv[1:] or DEFAULT_MODULES
+    print(f"{'module':<20}{'import (ms)':>12}  heavy dependencies loaded")
+    for module in modules:
+        best, heavy = time_import(module)
+        print(f"{module:<20}{best * 1000:>12.1f}  {heavy or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+from loguru import logger as log
+
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+
+
+def _frame_nbytes(data: pd.DataFrame) -> int:
+    return int(data.memory_usage(index=True, deep=True).sum())
+
+
+class BarCache(object):
+    """
+    Process-wide LRU cache of bar DataFrames bounded by a byte budget.
+    Entries are keyed on (folder, symbol, interval, start, end, provider key). Cached frames are
+    shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key) -> pd.DataFrame | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, data: pd.DataFrame):
+        nbytes = _frame_nbytes(data)
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                log.trace(f"Not caching {key}: {nbytes} bytes exceeds budget {self.max_bytes}")
+                return
+            self._entries[key] = (data, nbytes)
+            self.current_bytes += nbytes
+            self._evict()
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._entries:
+            key, (_, nbytes) = self._entries.popitem(last=False)
+            self.current_bytes -= nbytes
+            self.evictions += 1
+            log.trace(f"Evicted {key} from bar cache")
+
+    def resize(self, max_bytes: int):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def invalidate(self, symbol=None, folder=None):
+        """
+        Drops every entry matching the given symbol and/or folder. With no arguments the cache is cleared.
+        """
+        with self._lock:
+            keys = [
+                k
+                for k in self._entries
+                if (symbol is None or k[1] == symbol) and (folder is None or k[0] == folder)
+            ]
+            for key in keys:
+                self.current_bytes -= self._entries.pop(key)[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
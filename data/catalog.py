@@ -0,0 +1,214 @@
+import contextlib
+import json
+import os
+import threading
+
+from loguru import logger as log
+
+
+class Catalog(object):
+    """
+    On-disk manifest of which symbols are stored in which `<interval>$<start>$<end>` folder.
+    The manifest lives next to the folders it describes and is rebuilt from a directory scan
+    the first time it is opened, later opens rescan only the folders changed since it was written
+    (e.g. by `python -m data.store migrate`). Lookups are dictionary operations and never touch the disk.
+    It also records the date ranges already fetched into the per-symbol series layout, which
+    cannot be recovered from the files themselves.
+    """
+
+    _open_catalogs = dict()
+    _open_lock = threading.Lock()
+
+    def __init__(self, data_folder, extension):
+        self.data_folder = data_folder
+        self.extension = extension
+        self.file_path = os.path.join(data_folder, f".catalog{extension}.json")
+        self.folders: dict[str, set[str]] = dict()
+        self.ranges: dict[str, set[tuple]] = dict()
+        self.coverage: dict[str, dict[str, list[list[str]]]] = dict()
+        self._lock = threading.RLock()
+        self._mtime = None
+        if os.path.exists(self.file_path):
+            self._load()
+            self._rescan_changed()
+        else:
+            self.rebuild()
+
+    @classmethod
+    def open(cls, data_folder, extension) -> "Catalog":
+        """
+        Returns the catalog shared by every fetcher in this process using the same folder and storage.
+        """
+        key = (os.path.abspath(data_folder), extension)
+        with cls._open_lock:
+            if key not in cls._open_catalogs:
+                cls._open_catalogs[key] = cls(data_folder, extension)
+            return cls._open_catalogs[key]
+
+    @staticmethod
+    def _parse_folder(folder):
+        parts = folder.split("$")
+        if len(parts) != 3:
+            return None
+        [interval, start, end] = parts
+        return interval, start, None if end == "None" else end
+
+    def _index(self, folder, symbol):
+        self.folders.setdefault(folder, set()).add(symbol)
+        self.ranges.setdefault(symbol, set()).add(folder)
+
+    def _load(self):
+        with open(self.file_path, "r") as f:
+            manifest = json.load(f)
+        self._mtime = os.path.getmtime(self.file_path)
+        for folder, symbols in manifest["folders"].items():
+            for symbol in symbols:
+                self._index(folder, symbol)
+        for interval, symbols in manifest.get("coverage", {}).items():
+            for symbol, spans in symbols.items():
+                for [start, end] in spans:
+                    self._cover(interval, symbol, start, end)
+
+    @contextlib.contextmanager
+    def _manifest_lock(self):
+        """
+        Holds an exclusive lock on the manifest across processes (fetcher workers) while it is updated
+        """
+        import fcntl
+
+        with open(f"{self.file_path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _flush(self, merge=True):
+        with self._manifest_lock():
+            # Merge with whatever other processes wrote since we last loaded
+            if merge and os.path.exists(self.file_path) and os.path.getmtime(self.file_path) != self._mtime:
+                self._load()
+            manifest = {
+                "folders": {folder: sorted(symbols) for folder, symbols in self.folders.items()},
+                "coverage": self.coverage,
+            }
+            tmp_path = f"{self.file_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, self.file_path)
+            self._mtime = os.path.getmtime(self.file_path)
+
+    def _bar_folders(self) -> list[str]:
+        if not os.path.exists(self.data_folder):
+            return []
+        return [
+            folder
+            for folder in os.listdir(self.data_folder)
+            if os.path.isdir(os.path.join(self.data_folder, folder)) and self._parse_folder(folder) is not None
+        ]
+
+    def _scan(self, folder):
+        for symbol in self.folders.pop(folder, ()):
+            self.ranges[symbol].discard(folder)
+        self.folders[folder] = set()
+        n = len(self.extension)
+        for f in os.listdir(os.path.join(self.data_folder, folder)):
+            if f.endswith(self.extension):
+                self._index(folder, f[:-n])
+
+    def _rescan_changed(self):
+        # Adding or removing a file updates the folder's mtime, files written by DataFetcher are flushed after it
+        changed = [
+            folder
+            for folder in self._bar_folders()
+            if os.path.getmtime(os.path.join(self.data_folder, folder)) > self._mtime
+        ]
+        if len(changed) == 0:
+            return
+        with self._lock:
+            for folder in changed:
+                self._scan(folder)
+            log.trace(f"Rescanned {changed} changed since catalog {self.file_path} was written")
+            self._flush()
+
+    def rebuild(self):
+        """
+        Rescans every folder below data_folder. Use this if files were added or removed by hand.
+        """
+        with self._lock:
+            self.folders = dict()
+            self.ranges = dict()
+            for folder in self._bar_folders():
+                self._scan(folder)
+            log.trace(f"Rebuilt catalog {self.file_path} with {len(self.ranges)} symbols")
+            self._flush(merge=False)
+
+    def add(self, folder, symbols: list[str], flush=True):
+        with self._lock:
+            for symbol in symbols:
+                self._index(folder, symbol)
+            if flush:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def has(self, folder, symbol) -> bool:
+        return symbol in self.folders.get(folder, ())
+
+    def symbols(self, folder) -> list[str]:
+        return list(self.folders.get(folder, ()))
+
+    def find_covering(self, symbol, interval, start, end) -> str | None:
+        """
+        Returns a folder holding the symbol at the same interval over a timeframe at least as broad
+        as [start, end], or None. Open-ended folders are never considered since their end is unknown.
+        """
+        for folder in sorted(self.ranges.get(symbol, ())):
+            [f_interval, f_start, f_end] = self._parse_folder(folder)
+            if f_end is None or f_interval != interval:
+                continue
+            # ISO dates compare correctly as strings
+            if f_start <= start and f_end >= end:
+                return folder
+        return None
+
+    def _cover(self, interval, symbol, start, end):
+        spans = self.coverage.setdefault(interval, dict()).setdefault(symbol, [])
+        spans.append([start, end])
+        spans.sort()
+        merged = [spans[0]]
+        for [s, e] in spans[1:]:
+            if s <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], e)
+            else:
+                merged.append([s, e])
+        spans[:] = merged
+
+    def add_coverage(self, interval, symbol, start, end, flush=True):
+        """
+        Marks [start, end) as fetched for the symbol in the series layout.
+        """
+        with self._lock:
+            self._cover(interval, symbol, start, end)
+            if flush:
+                self._flush()
+
+    def missing_coverage(self, interval, symbol, start, end) -> list[tuple[str, str]]:
+        """
+        Returns the sub-ranges of [start, end) that have not been fetched for the symbol yet.
+        """
+        missing = []
+        cursor = start
+        for [s, e] in self.coverage.get(interval, {}).get(symbol, []):
+            if e <= cursor:
+                continue
+            if s >= end:
+                break
+            if s > cursor:
+                missing.append((cursor, s))
+            cursor = max(cursor, e)
+        if cursor < end:
+            missing.append((cursor, end))
+        return missing
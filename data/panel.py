@@ -0,0 +1,117 @@
+import json
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from data.utils import DataFetcher, to_np
+
+PANEL_FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+# Column position of each field in the array returned by to_np
+TO_NP_COLUMNS = {"Datetime": 0, "Open": 1, "High": 2, "Low": 3, "Close": 4, "Volume": 5}
+
+
+@dataclass
+class Panel:
+    """
+    Bars of many symbols aligned on one shared time axis.
+    values has shape (symbols, bars, fields) and is NaN wherever a symbol has no bar,
+    mask[i, t] is True when symbols[i] has a complete bar at times[t] (int64 unix seconds).
+    """
+
+    symbols: list[str]
+    fields: list[str]
+    times: np.ndarray
+    values: np.ndarray
+    mask: np.ndarray
+
+    def row(self, symbol) -> int:
+        return self.symbols.index(symbol)
+
+    def field(self, name) -> np.ndarray:
+        """
+        Returns a (symbols, bars) view of one field
+        """
+        return self.values[:, :, self.fields.index(name)]
+
+    def series(self, symbol, name) -> np.ndarray:
+        return self.values[self.row(symbol), :, self.fields.index(name)]
+
+    def common_mask(self, symbols=None) -> np.ndarray:
+        """
+        Returns the bars at which every given symbol (all by default) has data
+        """
+        if symbols is None:
+            return self.mask.all(axis=0)
+        rows = [self.row(s) for s in symbols]
+        return self.mask[rows].all(axis=0)
+
+    def position(self, timestamp) -> int:
+        """
+        Returns the index of timestamp on the time axis, or -1 if it is not a bar of the panel
+        """
+        ind = np.searchsorted(self.times, timestamp)
+        if ind < len(self.times) and self.times[ind] == timestamp:
+            return int(ind)
+        return -1
+
+    def until(self, timestamp) -> "Panel":
+        """
+        Returns a view of the panel up to and including timestamp
+        """
+        end = np.searchsorted(self.times, timestamp, side="right")
+        return Panel(self.symbols, self.fields, self.times[:end], self.values[:, :end], self.mask[:, :end])
+
+    @classmethod
+    def open(cls, path) -> "Panel":
+        """
+        Memory-maps a panel previously written by build_panel(..., path=path)
+        """
+        with open(os.path.join(path, "panel.json"), "r") as f:
+            meta = json.load(f)
+        values = np.load(os.path.join(path, "values.npy"), mmap_mode="r")
+        times = np.load(os.path.join(path, "times.npy"))
+        mask = ~np.isnan(values).any(axis=2)
+        return cls(meta["symbols"], meta["fields"], times, values, mask)
+
+
+def build_panel(frames: dict[str, pd.DataFrame], fields=PANEL_FIELDS, path=None) -> Panel:
+    """
+    Aligns the frames (symbol -> bars as returned by DataFetcher.get_bars) into one contiguous Panel.
+    The time axis is the union of every frame's bars. If path is given the values are written to a
+    memory-mapped file in that folder which can be reopened later with Panel.open.
+    """
+    symbols = list(frames.keys())
+    arrays = [to_np(frames[s]) for s in symbols]
+    times = np.unique(np.concatenate([a[:, 0] for a in arrays] + [np.empty(0)])).astype(np.int64)
+    shape = (len(symbols), len(times), len(fields))
+
+    if path is None:
+        values = np.full(shape, np.nan, dtype=np.float64)
+    else:
+        os.makedirs(path, exist_ok=True)
+        values = np.lib.format.open_memmap(os.path.join(path, "values.npy"), mode="w+", dtype=np.float64, shape=shape)
+        values[:] = np.nan
+
+    columns = [TO_NP_COLUMNS[f] for f in fields]
+    for i, a in enumerate(arrays):
+        positions = np.searchsorted(times, a[:, 0].astype(np.int64))
+        values[i, positions] = a[:, columns]
+    mask = ~np.isnan(values).any(axis=2)
+
+    if path is not None:
+        values.flush()
+        np.save(os.path.join(path, "times.npy"), times)
+        with open(os.path.join(path, "panel.json"), "w") as f:
+            json.dump({"symbols": symbols, "fields": list(fields)}, f)
+    return Panel(symbols, list(fields), times, values, mask)
+
+
+def load_panel(fetcher: DataFetcher, symbols: list[str], fields=PANEL_FIELDS, path=None, max_workers=None) -> Panel:
+    """
+    Loads the symbols concurrently through the fetcher and aligns them. Symbols without data are left out.
+    """
+    frames = {r.symbol: r.bars for r in fetcher.get_many(symbols, max_workers=max_workers) if r.error is None}
+    ordered = {s: frames[s] for s in symbols if s in frames}
+    return build_panel(ordered, fields, path)
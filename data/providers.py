@@ -0,0 +1,227 @@
+import zlib
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+from loguru import logger as log
+
+from data.store import STORES, normalize_index, slice_bars
+
+MARKET_OPEN = "09:30"
+MARKET_CLOSE = "16:00"
+
+
+class DataProvider(ABC):
+    """
+    Source of historical bars behind a DataFetcher.
+    history returns a DataFrame indexed by "Datetime" with at least Open, High, Low, Close and Volume
+    for [start, end), or None if the symbol is unknown.
+    """
+
+    @abstractmethod
+    def history(self, symbol, interval, start, end) -> pd.DataFrame | None:
+        pass
+
+    @abstractmethod
+    def download(self, symbols: list[str], interval, start, end) -> dict[str, pd.DataFrame]:
+        """
+        Fetches many symbols at once. Symbols that could not be fetched map to an empty DataFrame.
+        """
+
+    @abstractmethod
+    def cache_key(self) -> tuple:
+        """
+        Identifies the bars this provider serves, fetchers share cached bars only between equal keys
+        """
+
+    def namespace(self) -> str | None:
+        """
+        Folder below a fetcher's data folder holding the bars of this provider, so bars of different
+        providers never mix on disk. None stores them in the data folder itself, which is kept for real market data.
+        """
+        return f"{type(self).__name__}-{zlib.crc32(repr(self.cache_key()).encode()):08x}"
+
+    def _download_each(self, symbols: list[str], interval, start, end) -> dict[str, pd.DataFrame]:
+        # download for providers without a bulk api: one history call per symbol
+        histories = dict()
+        for symbol in symbols:
+            history = self.history(symbol, interval, start, end)
+            histories[symbol] = pd.DataFrame() if history is None else history
+        return histories
+
+
+class YFinanceProvider(DataProvider):
+    """
+    Fetches bars from the yfinance api
+    """
+
+    def cache_key(self) -> tuple:
+        return (type(self).__name__,)
+
+    def namespace(self) -> str | None:
+        return None
+
+    def history(self, symbol, interval, start, end) -> pd.DataFrame | None:
+        import yfinance as yf
+
+        yf_ticker = yf.Ticker(symbol)
+        history = yf_ticker.history(interval=interval, start=start, end=end)
+
+        # Retry once since api is flakey
+        if history.empty:
+            log.info(f"{symbol} not found. Retrying once...")
+            history = yf_ticker.history(interval=interval, start=start, end=end)
+            if history.empty:
+                log.warning(f"Could not find {symbol}")
+                return None
+
+        history.index = history.index.tz_localize(None)
+        if history.index.name == "Datetime":
+            history.reset_index(inplace=True)
+            history.rename(columns={"Date": "Datetime"}, inplace=True)
+            history.set_index("Datetime", inplace=True)
+        return history
+
+    def download(self, symbols: list[str], interval, start, end) -> dict[str, pd.DataFrame]:
+        import yfinance as yf
+
+        histories = yf.download(
+            symbols,
+            start=start,
+            end=end,
+            interval=interval,
+            ignore_tz=True,
+            group_by="ticker",
+        )
+        return {symbol: histories[symbol] for symbol in histories.columns.unique(level="Ticker")}
+
+
+def market_timestamps(interval, start, end) -> pd.DatetimeIndex:
+    """
+    Bar open times of regular US market sessions (weekdays, 09:30 to 16:00) in [start, end).
+    Holidays are not modelled.
+    """
+    days = pd.bdate_range(start, end, inclusive="left")
+    if interval.endswith("d"):
+        return days
+    step = pd.Timedelta(interval.replace("m", "min"))
+    offsets = np.arange(pd.Timedelta(MARKET_OPEN + ":00"), pd.Timedelta(MARKET_CLOSE + ":00"), step)
+    times = days.values[:, np.newaxis] + offsets[np.newaxis, :]
+    return pd.DatetimeIndex(times.ravel())
+
+
+class SyntheticProvider(DataProvider):
+    """
+    Deterministic generator of bars for offline runs and benchmarks.
+    Every symbol gets its own path seeded by (seed, symbol) and generated from origin onwards, so any
+    [start, end) request is a slice of the same series no matter how the requests are split.
+        COI<i>X / COI<i>Y: a cointegrated pair, Y = alpha + beta * X + mean reverting noise
+        anything else: a geometric random walk
+    With gap_prob > 0 bars are dropped at random to mimic missing data.
+    """
+
+    def __init__(self, seed=0, origin="2020-01-01", volatility=0.004, gap_prob=0.0):
+        self.seed = seed
+        self.origin = origin
+        self.volatility = volatility
+        self.gap_prob = gap_prob
+
+    def cache_key(self) -> tuple:
+        return (type(self).__name__, self.seed, self.origin, self.volatility, self.gap_prob)
+
+    def download(self, symbols: list[str], interval, start, end) -> dict[str, pd.DataFrame]:
+        return self._download_each(symbols, interval, start, end)
+
+    @staticmethod
+    def universe(n_walks=0, n_pairs=0) -> list[str]:
+        walks = [f"SYN{i:04d}" for i in range(n_walks)]
+        pairs = [f"COI{i:04d}{leg}" for i in range(n_pairs) for leg in ["X", "Y"]]
+        return walks + pairs
+
+    @staticmethod
+    def pairs(n_pairs) -> list[tuple[str, str]]:
+        return [(f"COI{i:04d}X", f"COI{i:04d}Y") for i in range(n_pairs)]
+
+    def _rng(self, key) -> np.random.Generator:
+        return np.random.default_rng([self.seed, zlib.crc32(key.encode())])
+
+    def _walk(self, key, n) -> np.ndarray:
+        rng = self._rng(key)
+        start_price = rng.uniform(10, 200)
+        steps = rng.normal(0, self.volatility, n)
+        steps[0] = 0
+        return start_price * np.exp(np.cumsum(steps))
+
+    def _prices(self, symbol, n) -> np.ndarray:
+        if len(symbol) == 8 and symbol.startswith("COI") and symbol[-1] in "XY":
+            from scipy.signal import lfilter
+
+            x = self._walk(symbol[:-1], n)
+            if symbol[-1] == "X":
+                return x
+            rng = self._rng(symbol)
+            beta = rng.uniform(0.5, 1.5)
+            alpha = rng.uniform(0.05, 0.2) * x[0]
+            # AR(1) noise so the spread mean reverts
+            phi = 0.95
+            noise = rng.normal(0, 0.01 * x[0] * np.sqrt(1 - phi**2), n)
+            spread = lfilter([1.0], [1.0, -phi], noise)
+            return alpha + beta * x + spread
+        return self._walk(symbol, n)
+
+    def history(self, symbol, interval, start, end) -> pd.DataFrame | None:
+        if end is None:
+            end = pd.Timestamp.today().strftime("%Y-%m-%d")
+        times = market_timestamps(interval, self.origin, end)
+        n = len(times)
+        if n == 0:
+            return None
+
+        # One generator per component keeps every draw independent of n
+        opens = self._prices(symbol, n + 1)
+        closes = opens[1:]
+        opens = opens[:-1]
+        wick = np.abs(self._rng(f"{symbol}#wick").normal(0, self.volatility / 2, (n, 2)))
+        data = pd.DataFrame(
+            {
+                "Open": opens,
+                "High": np.maximum(opens, closes) * (1 + wick[:, 0]),
+                "Low": np.minimum(opens, closes) * (1 - wick[:, 1]),
+                "Close": closes,
+                "Volume": np.floor(self._rng(f"{symbol}#volume").lognormal(12, 1, n)),
+            },
+            index=pd.DatetimeIndex(times, name="Datetime"),
+        )
+        if self.gap_prob > 0:
+            data = data[self._rng(f"{symbol}#gaps").random(n) >= self.gap_prob]
+
+        data = data.loc[(data.index >= pd.Timestamp(start)) & (data.index < pd.Timestamp(end))]
+        if data.empty:
+            return None
+        return data
+
+
+class ReplayProvider(DataProvider):
+    """
+    Serves bars previously recorded to a folder in one of the bar storage formats (see data.store)
+    """
+
+    def __init__(self, folder, storage="csv"):
+        self.folder = folder
+        self.store = STORES[storage]()
+
+    def cache_key(self) -> tuple:
+        return (type(self).__name__, self.folder, type(self.store).__name__)
+
+    def download(self, symbols: list[str], interval, start, end) -> dict[str, pd.DataFrame]:
+        return self._download_each(symbols, interval, start, end)
+
+    def history(self, symbol, interval, start, end) -> pd.DataFrame | None:
+        if not self.store.has(self.folder, symbol):
+            log.warning(f"No recording of {symbol} in {self.folder}")
+            return None
+        data = normalize_index(self.store.read(self.folder, symbol)).sort_index()
+        data = slice_bars(data, start, end)
+        if data.empty:
+            return None
+        return data
@@ -0,0 +1,238 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from loguru import logger as log
+
+BAR_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+EPOCH = pd.Timestamp("1970-01-01")
+
+
+def to_unix(value) -> int:
+    """
+    Converts a single datetime (string, datetime or unix seconds) to unix seconds
+    """
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return int((pd.Timestamp(value) - EPOCH) // pd.Timedelta("1s"))
+
+
+def fmt_datetime(timestamp) -> str:
+    """
+    Formats unix seconds as "%Y-%m-%d %H:%M:%S", only meant for display and storage edges
+    """
+    return time.strftime(DATETIME_FORMAT, time.gmtime(int(timestamp)))
+
+
+def to_unix_seconds(index) -> np.ndarray:
+    if pd.api.types.is_integer_dtype(index):
+        return np.asarray(index, dtype=np.int64)
+    return ((pd.to_datetime(index) - EPOCH) // pd.Timedelta("1s")).to_numpy(dtype=np.int64)
+
+
+def format_unix_seconds(timestamps: np.ndarray) -> pd.Index:
+    return pd.Index(pd.to_datetime(timestamps, unit="s").strftime(DATETIME_FORMAT), name="Datetime")
+
+
+def normalize_index(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Indexes bars by int64 unix seconds named "Datetime", whatever datetime representation they came with.
+    """
+    if data.index.dtype == np.int64 and data.index.name == "Datetime":
+        return data
+    data = data.copy()
+    data.index = pd.Index(to_unix_seconds(data.index), name="Datetime")
+    return data
+
+
+def merge_bars(existing: pd.DataFrame | None, new: pd.DataFrame) -> pd.DataFrame:
+    """
+    Merges new bars into existing ones, sorted by time. Bars present in both keep the new values.
+    """
+    new = normalize_index(new)
+    if existing is None or existing.empty:
+        merged = new
+    else:
+        existing = normalize_index(existing)
+        merged = pd.concat([existing, new[existing.columns.intersection(new.columns)]])
+    merged = merged[~merged.index.duplicated(keep="last")]
+    return merged.sort_index()
+
+
+def slice_bars(data: pd.DataFrame, start, end) -> pd.DataFrame:
+    """
+    Returns the bars in [start, end) of data indexed by unix seconds, start and end are "%Y-%m-%d" dates.
+    """
+    ind_start = data.index.searchsorted(to_unix(start), side="left")
+    ind_end = len(data) if end is None else data.index.searchsorted(to_unix(end), side="left")
+    return data.iloc[ind_start:ind_end]
+
+
+class CsvBarStore(object):
+    """
+    Original storage format: one `<SYMBOL>.csv` per symbol with the datetime as the first column.
+    Datetimes are stored as text and bars are read back with the text index, DataFetcher converts it.
+    """
+
+    extension = ".csv"
+
+    def path(self, folder, symbol) -> str:
+        return os.path.join(folder, f"{symbol}{self.extension}")
+
+    def symbols(self, folder) -> list[str]:
+        n = len(self.extension)
+        return [f[:-n] for f in os.listdir(folder) if f.endswith(self.extension)]
+
+    def has(self, folder, symbol) -> bool:
+        return os.path.exists(self.path(folder, symbol))
+
+    def read(self, folder, symbol) -> pd.DataFrame:
+        data = pd.read_csv(self.path(folder, symbol))
+        data = data.rename(columns={data.columns[0]: "Datetime"})
+        data.set_index("Datetime", inplace=True)
+        return data
+
+    def write(self, folder, symbol, data: pd.DataFrame):
+        if pd.api.types.is_integer_dtype(data.index):
+            data = data.set_axis(format_unix_seconds(data.index))
+        # Write then rename so readers in other workers never see a partially written file
+        file_path = self.path(folder, symbol)
+        tmp_path = f"{file_path}.{os.getpid()}.tmp"
+        data.to_csv(tmp_path)
+        os.replace(tmp_path, file_path)
+
+
+class ColumnarBarStore(object):
+    """
+    Binary storage format with one `<SYMBOL>.bars` file per symbol laid out as:
+        64 byte header: magic, number of bars
+        int64[n] unix seconds, followed by float64[n] for each of Open, High, Low, Close, Volume
+    Every column is contiguous so a file can be memory-mapped and sliced without parsing.
+    """
+
+    extension = ".bars"
+    magic = b"ALGOBAR1"
+    header_bytes = 64
+
+    def path(self, folder, symbol) -> str:
+        return os.path.join(folder, f"{symbol}{self.extension}")
+
+    def symbols(self, folder) -> list[str]:
+        n = len(self.extension)
+        return [f[:-n] for f in os.listdir(folder) if f.endswith(self.extension)]
+
+    def has(self, folder, symbol) -> bool:
+        return os.path.exists(self.path(folder, symbol))
+
+    def _map(self, folder, symbol) -> np.memmap | None:
+        """
+        Memory-maps the file as one read-only (1 + len(BAR_COLUMNS), n) float64 block, None when it holds no bars.
+        """
+        file_path = self.path(folder, symbol)
+        with open(file_path, "rb") as f:
+            header = f.read(16)
+        assert header[:8] == self.magic, f"{file_path} is not a bar file"
+        n = int(np.frombuffer(header, dtype=np.int64, count=1, offset=8)[0])
+        if n == 0:
+            return None
+        return np.memmap(file_path, dtype=np.float64, mode="r", offset=self.header_bytes, shape=(len(BAR_COLUMNS) + 1, n))
+
+    def read_columns(self, folder, symbol) -> dict[str, np.ndarray]:
+        """
+        Memory-maps the file and returns read-only views of every column, keyed by column name.
+        """
+        mm = self._map(folder, symbol)
+        if mm is None:
+            columns = {"Datetime": np.empty(0, dtype=np.int64)}
+            columns.update({c: np.empty(0, dtype=np.float64) for c in BAR_COLUMNS})
+            return columns
+        columns = {"Datetime": mm[0].view(np.int64)}
+        for i, c in enumerate(BAR_COLUMNS):
+            columns[c] = mm[i + 1]
+        return columns
+
+    def read(self, folder, symbol) -> pd.DataFrame:
+        """
+        Returns the bars in a DataFrame backed by the memory-mapped file, the columns are not copied.
+        """
+        mm = self._map(folder, symbol)
+        if mm is None:
+            return pd.DataFrame(columns=BAR_COLUMNS, index=pd.Index([], dtype=np.int64, name="Datetime"), dtype=np.float64)
+        index = pd.Index(mm[0].view(np.int64), name="Datetime")
+        # The transposed bar rows are the frame's single float64 block
+        return pd.DataFrame(mm[1:].T, columns=BAR_COLUMNS, index=index, copy=False)
+
+    def write(self, folder, symbol, data: pd.DataFrame):
+        n = len(data)
+        block = np.empty((len(BAR_COLUMNS) + 1, n), dtype=np.float64)
+        block[0].view(np.int64)[:] = to_unix_seconds(data.index)
+        for i, c in enumerate(BAR_COLUMNS):
+            block[i + 1] = data[c].to_numpy(dtype=np.float64)
+
+        header = bytearray(self.header_bytes)
+        header[:8] = self.magic
+        header[8:16] = np.int64(n).tobytes()
+        # Write then rename so readers never map a partially written file
+        file_path = self.path(folder, symbol)
+        tmp_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            f.write(block.tobytes())
+        os.replace(tmp_path, file_path)
+
+
+STORES = {
+    "csv": CsvBarStore,
+    "columnar": ColumnarBarStore,
+}
+
+
+def migrate_csv_folder(folder, remove_csv=False) -> list[str]:
+    """
+    Converts every `<SYMBOL>.csv` in the folder into the columnar format.
+    Returns the list of converted symbols.
+    """
+    csv_store = CsvBarStore()
+    bar_store = ColumnarBarStore()
+    converted = []
+    for symbol in csv_store.symbols(folder):
+        data = csv_store.read(folder, symbol)
+        missing = [c for c in BAR_COLUMNS if c not in data.columns]
+        if len(missing) > 0:
+            log.warning(f"Missing key metrics {missing} for {symbol} in {folder}...Skipping")
+            continue
+        bar_store.write(folder, symbol, data)
+        if remove_csv:
+            os.remove(csv_store.path(folder, symbol))
+        converted.append(symbol)
+    log.info(f"Converted {len(converted)} symbols in {folder}")
+    return converted
+
+
+def migrate_csv_tree(data_folder, remove_csv=False) -> dict[str, list[str]]:
+    """
+    Converts every `<interval>$<start>$<end>` folder below data_folder.
+    """
+    converted = dict()
+    for folder in sorted(os.listdir(data_folder)):
+        folder_path = os.path.join(data_folder, folder)
+        if os.path.isdir(folder_path):
+            converted[folder] = migrate_csv_folder(folder_path, remove_csv)
+    return converted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bar storage utilities")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="Convert CSV bar folders to the columnar format")
+    migrate_parser.add_argument("data_folder", nargs="?", default=os.path.join(".", "data", "historical"))
+    migrate_parser.add_argument("--remove-csv", action="store_true", help="Delete the CSV files once converted")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrate_csv_tree(args.data_folder, args.remove_csv)
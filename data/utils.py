@@ -1,80 +1,140 @@
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Iterator
 
 import numpy as np
 import pandas as pd
-import yfinance as yf
-from loguru import logger as log
 from datetime import datetime
-
-def _convert_to_datetime_unix(datetimes):
-    timestamp_start = "1970-01-01"
-    # Dirty check for "%Y-%m-%d %H:%M:%S"
-    if len(datetimes[0]) == 17:
-        timestamp_start += " 00:00:00"
-    return ((pd.to_datetime(datetimes) - pd.Timestamp(timestamp_start)) // pd.Timedelta("1s")).to_numpy()
+from loguru import logger as log
+from data.cache import BarCache
+from data.catalog import Catalog
+from data.providers import DataProvider, YFinanceProvider
+from data.store import STORES, fmt_datetime, merge_bars, normalize_index, slice_bars, to_unix, to_unix_seconds
 
 def find_nearest_indices(datetimes_to_insert, datetimes):
-    insert_unix_s = _convert_to_datetime_unix(datetimes_to_insert)
-    dt_unix_s = _convert_to_datetime_unix(datetimes)
+    insert_unix_s = to_unix_seconds(datetimes_to_insert)
+    dt_unix_s = to_unix_seconds(datetimes)
     inds = np.searchsorted(dt_unix_s, insert_unix_s, side='left')
     return inds
     
 
+@dataclass
+class FetchResult:
+    symbol: str
+    bars: pd.DataFrame | None
+    error: str | None = None
+
+
+def _fetch_in_process(fetcher_args: tuple, fetcher_kwargs: dict, symbol: str) -> pd.DataFrame | None:
+    return DataFetcher(*fetcher_args, **fetcher_kwargs).get_bars(symbol)
+
+
 class DataFetcher(object):
     """
     DataFetcher is a concrete class that abstracts the retrieval of
     ticker information. If the fetcher has the data on disk it retrieves
-    it from there, otherwise it interfaces with yfinance to get it.
+    it from there, otherwise it asks its provider (yfinance by default) for it.
+    Loaded bars are memoized in a process-wide LRU cache shared by every fetcher.
     """
 
-    def __init__(self, data_folder, interval, start, end):
+    cache = BarCache()
+
+    def __init__(self, data_folder, interval, start, end, storage="csv", layout="range", provider: DataProvider = None):
+        """
+        provider is where missing bars come from, see data.providers. Defaults to yfinance. Other providers
+            keep their bars in their own folder below data_folder (see DataProvider.namespace)
+        storage selects the on-disk format: "csv" or "columnar" (memory-mapped binary, see data.store)
+        layout selects how bars are cached:
+            "range": one `<interval>$<start>$<end>` folder per requested timeframe
+            "series": one file per (symbol, interval) in `series$<interval>`, only missing date ranges
+                are downloaded and merged in, any timeframe is served as a slice
+        """
+        assert storage in STORES
+        assert layout in ["range", "series"]
         self.key_metrics = ["Open", "High", "Low", "Close", "Volume"]
+        self.storage = storage
+        self.store = STORES[storage]()
+        self.layout = layout
+        self.provider = YFinanceProvider() if provider is None else provider
+        self.root_folder = data_folder
         self.interval = interval
         self.start = start
         self.end = end
-        marked_dir = f"{interval}${start}${end}"
-        self.data_folder = os.path.join(data_folder, marked_dir)
+        if layout == "series":
+            self.marked_dir = f"series${interval}"
+        else:
+            self.marked_dir = f"{interval}${start}${end}"
+        namespace = self.provider.namespace()
+        store_folder = data_folder if namespace is None else os.path.join(data_folder, namespace)
+        self.data_folder = os.path.join(store_folder, self.marked_dir)
         if not os.path.exists(self.data_folder):
             os.makedirs(self.data_folder)
+        self.catalog = Catalog.open(store_folder, self.store.extension)
 
     def _get_from_local(self, symbol) -> pd.DataFrame:
         log.trace(f"Getting {symbol} from local")
-        file_path = os.path.join(self.data_folder, f"{symbol}.csv")
-
-        data = pd.read_csv(file_path)
-        data = data.rename(columns={data.columns[0]: 'Datetime'}) 
-        data.set_index("Datetime", inplace=True)
+        data = self.store.read(self.data_folder, symbol)
         return self._filter_history(data)
     
     def _get_from_local_adj(self, symbol, folder) -> pd.DataFrame:
         log.trace(f"Getting {symbol} from local adjacent folder {folder}")
-        file_path = os.path.join(folder, f"{symbol}.csv")
+        data = normalize_index(self.store.read(folder, symbol))
+        data = slice_bars(data, self.start, self.end)
+        return self._filter_history(data)
 
-        data = pd.read_csv(file_path)
-        data = data.rename(columns={data.columns[0]: 'Datetime'}) 
-        data.set_index("Datetime", inplace=True)
 
-        [ind_start, ind_end] = find_nearest_indices([self.start, self.end], data.index)
-        data = data.iloc[ind_start:ind_end]
-        return self._filter_history(data)
+    def _get_from_series(self, symbol) -> pd.DataFrame | None:
+        end = self._resolved_end()
+        data = None
+        if self.store.has(self.data_folder, symbol):
+            data = normalize_index(self.store.read(self.data_folder, symbol))
+
+        missing = self.catalog.missing_coverage(self.interval, symbol, self.start, end)
+        # A gap the provider answered is covered even without bars (weekends, holidays, before listing),
+        # only a fetch that raised is asked for again next time
+        answered = []
+        try:
+            for [start, stop] in missing:
+                log.trace(f"Filling {symbol} gap {start} to {stop}")
+                new_data = self._get_from_api(symbol, start, stop)
+                answered.append((start, stop))
+                if new_data is not None and not new_data.empty:
+                    data = merge_bars(data, new_data)
+        finally:
+            if len(answered) > 0:
+                self._save_series(symbol, data, answered)
+        if data is None:
+            return None
+
+        window = slice_bars(data, self.start, self.end)
+        if window.empty:
+            return None
+        return self._filter_history(window)
 
+    def _save_series(self, symbol: str, data: pd.DataFrame, fetched: list[tuple[str, str]], flush_catalog=True):
+        if data is not None:
+            log.trace(f"Saving {symbol} to {self.data_folder}")
+            self.store.write(self.data_folder, symbol, data)
+        for [start, stop] in fetched:
+            self.catalog.add_coverage(self.interval, symbol, start, stop, flush=False)
+        if flush_catalog:
+            self.catalog.flush()
+        DataFetcher.cache.invalidate(symbol=symbol)
 
-    def _get_from_api(self, symbol) -> pd.DataFrame | None:
+    def _resolved_end(self) -> str:
+        # An open ended timeframe runs up to (but excluding) today
+        if self.end is None:
+            return datetime.today().strftime("%Y-%m-%d")
+        return self.end
+
+    def _get_from_api(self, symbol, start=None, end=None) -> pd.DataFrame | None:
         log.trace(f"Getting {symbol} from api")
-        yf_ticker = yf.Ticker(symbol)
-        history = yf_ticker.history(
-            interval=self.interval, start=self.start, end=self.end
-        )
-
-        # Retry once since api is flakey
-        if history.empty:
-            log.info(f"{symbol} not found. Retrying once...")
-            history = yf_ticker.history(
-                interval=self.interval, start=self.start, end=self.end
-            )
-            if history.empty:
-                log.warning(f"Could not find {symbol}")
-                return None
+        start = self.start if start is None else start
+        end = self.end if end is None else end
+        history = self.provider.history(symbol, self.interval, start, end)
+        if history is None:
+            return None
 
         missing_metrics = [
             a for a in self.key_metrics if a not in history.columns.tolist()
@@ -85,62 +145,51 @@ class DataFetcher(object):
             )
             return None
 
-        history.index = history.index.tz_localize(None)
-        if history.index.name == "Datetime":
-            history.reset_index(inplace=True)
-            history.rename(columns={'Date': 'Datetime'}, inplace=True)
-            history.set_index("Datetime", inplace=True)
         return self._filter_history(history)
 
-    def _save_history(self, symbol: str, data: pd.DataFrame):
+    def _save_history(self, symbol: str, data: pd.DataFrame, flush_catalog=True):
         log.trace(f"Saving {symbol} to {self.data_folder}")
-        save_path = os.path.join(self.data_folder, f"{symbol}.csv")
-        data.to_csv(save_path)
+        self.store.write(self.data_folder, symbol, data)
+        self.catalog.add(self.marked_dir, [symbol], flush=flush_catalog)
+        DataFetcher.cache.invalidate(symbol=symbol)
 
     def _filter_history(self, data: pd.DataFrame) -> pd.DataFrame:
-        filtered = data[self.key_metrics]
-        return filtered
+        # Bars are always handed out indexed by int64 unix seconds. Selecting columns copies them,
+        # so frames that already have just the key metrics (memory-mapped columnar reads) are kept as they are
+        if list(data.columns) != self.key_metrics:
+            data = data[self.key_metrics]
+        return normalize_index(data)
 
     def _has_symbol(self, symbol):
-        files = os.listdir(self.data_folder)
-        csv_files = [f for f in files if f.endswith(".csv")]
-        csv_symbols = [f[:-4] for f in csv_files]
-        return symbol in csv_symbols
+        return self.catalog.has(self.marked_dir, symbol)
     
     def _adjacent_folder_with_symbol(self, symbol):
-        parent_data_folder = os.path.dirname(self.data_folder)
-        all_adjacent_folders = os.listdir(parent_data_folder)
-        
         # Can look in folders if they have the same interval and broader (or equal) timeframe
-        compatible_adj_folders = []
-        my_start = datetime.strptime(self.start, "%Y-%m-%d")
-        my_end = datetime.strptime(self.end, "%Y-%m-%d")
-        for folder in all_adjacent_folders:
-            assert len(folder.split("$")) == 3
-            [interval, start, end] = folder.split("$")
-            assert start != "None"
-            if end == "None": continue
-            elif interval != self.interval: continue
-            start_time = datetime.strptime(start, "%Y-%m-%d")
-            end_time = datetime.strptime(end, "%Y-%m-%d")
-            if start_time <= my_start and end_time >= my_end:
-                compatible_adj_folders.append(folder)
-        
-        for folder in compatible_adj_folders:
-            folder_path = os.path.join(parent_data_folder, folder)
-            files = os.listdir(folder_path)
-            csv_files = [f for f in files if f.endswith(".csv")]
-            csv_symbols = [f[:-4] for f in csv_files]
-            if symbol in csv_symbols:
-                return folder_path
-        
-        return None
-        
+        if self.end is None:
+            return None
+        folder = self.catalog.find_covering(symbol, self.interval, self.start, self.end)
+        if folder is None:
+            return None
+        return os.path.join(os.path.dirname(self.data_folder), folder)
 
     def get_bars(self, symbol) -> pd.DataFrame | None:
         """
-        Gets the data for the given symbol and timeframe
+        Gets the data for the given symbol and timeframe, indexed by int64 unix seconds ("Datetime").
+        Use to_unix/fmt_datetime to convert to and from "%Y-%m-%d %H:%M:%S" strings at the edges.
+        The returned DataFrame may be shared with other callers through the cache, do not mutate it.
         """
+        cache_key = self._cache_key(symbol)
+        history = DataFetcher.cache.get(cache_key)
+        if history is not None:
+            return history
+
+        if self.layout == "series":
+            history = self._get_from_series(symbol)
+            if history is None:
+                return None
+            DataFetcher.cache.put(cache_key, history)
+            return history
+
         adj_folder = self._adjacent_folder_with_symbol(symbol)
         if self._has_symbol(symbol):
             history = self._get_from_local(symbol)
@@ -152,8 +201,58 @@ class DataFetcher(object):
                 return None
             self._save_history(symbol, history)
 
+        DataFetcher.cache.put(cache_key, history)
         return history
 
+    def get_many(self, symbols: list[str], max_workers=None, use_processes=False) -> Iterator[FetchResult]:
+        """
+        Loads many symbols concurrently, yielding a FetchResult per symbol in completion order.
+        A symbol that fails is reported through FetchResult.error and does not stop the batch.
+        Threads are used by default since most of the work is file I/O and pandas parsing; use_processes
+        moves parsing to a process pool for CPU bound CSV universes, results are then cached in this process.
+        """
+        if use_processes:
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+            fetcher_args = (self.root_folder, self.interval, self.start, self.end)
+            fetcher_kwargs = {"storage": self.storage, "layout": self.layout, "provider": self.provider}
+            submit = lambda symbol: executor.submit(_fetch_in_process, fetcher_args, fetcher_kwargs, symbol)
+        else:
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+            submit = lambda symbol: executor.submit(self.get_bars, symbol)
+
+        with executor:
+            futures = {submit(symbol): symbol for symbol in symbols}
+            for future in as_completed(futures):
+                symbol = futures[future]
+                try:
+                    bars = future.result()
+                except Exception as e:
+                    log.warning(f"Failed to load {symbol}: {e!r}")
+                    yield FetchResult(symbol, None, repr(e))
+                    continue
+
+                if bars is None:
+                    yield FetchResult(symbol, None, "No data")
+                    continue
+                if use_processes:
+                    DataFetcher.cache.put(self._cache_key(symbol), bars)
+                yield FetchResult(symbol, bars)
+
+    def _cache_key(self, symbol):
+        return (self.data_folder, symbol, self.interval, self.start, self.end, self.provider.cache_key())
+
+    @classmethod
+    def set_cache_budget(cls, max_bytes: int):
+        cls.cache.resize(max_bytes)
+
+    @classmethod
+    def cache_stats(cls) -> dict:
+        return cls.cache.stats()
+
+    @classmethod
+    def invalidate_cache(cls, symbol=None):
+        cls.cache.invalidate(symbol=symbol)
+
     def bulk_download(self, symbols: list[str], _retry=False) -> list[str]:
         """
         Quickly download a bunch of symbols. This is a QOL if you already know what tickers you want to deal with and want to
@@ -163,32 +262,48 @@ class DataFetcher(object):
         Returns the list of symbols successfully downloaded
         """
         # Only download files you don't already have
-        all_files = os.listdir(self.data_folder)
-        existing_symbols = [f.split(".csv")[0] for f in all_files if f.endswith(".csv")]
-        symbols = [f for f in symbols if f not in existing_symbols]
+        if self.layout == "series":
+            end = self._resolved_end()
+            gaps = {f: self.catalog.missing_coverage(self.interval, f, self.start, end) for f in symbols}
+            symbols = [f for f in symbols if gaps[f]]
+        else:
+            symbols = [f for f in symbols if not self._has_symbol(f)]
         if len(symbols) == 0:
             log.trace("Already have all symbols...no download")
             return
         
-        log.trace(f"Downloading {symbols}")
-        histories = yf.download(
-            symbols,
-            start=self.start,
-            end=self.end,
-            interval=self.interval,
-            ignore_tz=True,
-            group_by="ticker",
-        )
-        downloaded_symbols = list(histories.columns.unique(level="Ticker"))
+        if self.layout == "series":
+            # Only the missing sub-ranges are downloaded, symbols missing the same range share one download
+            requests = dict()
+            for symbol in symbols:
+                for gap in gaps[symbol]:
+                    requests.setdefault(gap, []).append(symbol)
+        else:
+            requests = {(self.start, self.end): symbols}
+
         failed_symbols = []
-        for symbol in downloaded_symbols:
-            history = histories[symbol]
-            if history.empty:
-                failed_symbols.append(symbol)
-                continue
+        for [start, stop], range_symbols in requests.items():
+            log.trace(f"Downloading {range_symbols} from {start} to {stop}")
+            histories = self.provider.download(range_symbols, self.interval, start, stop)
+            for symbol, history in histories.items():
+                if history.empty:
+                    # Asked twice without getting bars, the range has none
+                    if _retry and self.layout == "series":
+                        self.catalog.add_coverage(self.interval, symbol, start, stop, flush=False)
+                    if symbol not in failed_symbols:
+                        failed_symbols.append(symbol)
+                    continue
 
-            self._save_history(symbol, history)
+                if self.layout == "series":
+                    existing = None
+                    if self.store.has(self.data_folder, symbol):
+                        existing = self.store.read(self.data_folder, symbol)
+                    merged = merge_bars(existing, history)
+                    self._save_series(symbol, merged, [(start, stop)], flush_catalog=False)
+                else:
+                    self._save_history(symbol, history, flush_catalog=False)
 
+        self.catalog.flush()
         saved_symbols = [s for s in symbols if s not in failed_symbols]
         log.info(f"Successfully downloaded {saved_symbols}")
 
@@ -212,9 +327,7 @@ def to_np(data: pd.DataFrame) -> np.ndarray:
     Date is in UNIX seconds, not milliseconds
     """
     copy = data.reset_index()
-    copy["Datetime"] = (
-        pd.to_datetime(copy["Datetime"]) - pd.Timestamp("1970-01-01")
-    ) // pd.Timedelta("1s")
+    copy["Datetime"] = to_unix_seconds(copy["Datetime"])
     # Guarantee ordering
     copy = copy[["Datetime", "Open", "High", "Low", "Close", "Volume"]]
     data_np = copy.to_numpy(dtype=np.float64)
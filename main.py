@@ -6,11 +6,9 @@ from data import utils
 from market.portfolio import Portfolio, get_industries_tickers
 from pipelines import pairs_trading_pipeline as ptp
 from model.strategy import PairsStrategy, DSStrategy
-from market.drivers import PairsDriver, DSDriver
+from market.drivers import PairsDriver, DSDriver, DSBatchDriver
 from market.traders import SimulatedTrader
-import matplotlib.pyplot as plt
-import yfinance as yf
-from datetime import datetime
+from market.sweep import PairsSweep
 import numpy as np
 from market.portfolio import Portfolio
 
@@ -18,6 +16,8 @@ def fmt_float(num):
     return "{:2f}".format(num)
 
 def run_ptp():
+    import yfinance as yf
+
     # 1. Collect time series data
     data_folder = os.path.join(".", "data", "historical")
     interval = "1h"
@@ -45,6 +45,8 @@ def run_ptp():
     pipeline.run()
 
 def run_pairs_driver():
+    import matplotlib.pyplot as plt
+
     # log.remove()
     # log.add(sys.stderr, level="TRACE")
     log.info("In main")
@@ -77,10 +79,10 @@ def run_pairs_driver():
             if error:
                 continue
 
-            bound_date = datetime.strptime("2024-10-01 09:30:00", '%Y-%m-%d %H:%M:%S')
-            # selected_date = datetime.strptime(date[i], '%Y-%m-%d %H:%M:%S')
+            bound_date = utils.to_unix("2024-10-01 09:30:00")
             [all_dates, all_capital] = list(zip(*strategy.record))
-            recs = [d for d in strategy.record if datetime.strptime(d[0], '%Y-%m-%d %H:%M:%S') > bound_date]
+            all_dates = [utils.fmt_datetime(d) for d in all_dates]
+            recs = [d for d in strategy.record if d[0] > bound_date]
             recall = {
                 "symbolx": symbolx,
                 "symboly": symboly,
@@ -113,6 +115,15 @@ def run_pairs_driver():
         for item in all_recalls:
             f.write(str(item) + '\n')
 
+def run_pairs_sweep():
+    fetcher = utils.DataFetcher(os.path.join(".", "data", "historical"), "1h", "2024-06-03", "2024-11-01")
+    pairs = [('T', 'FYBR'), ('YUM', 'SHAK'), ('EAT', 'CAKE'), ('INMD', 'FNA')]
+    sweep = PairsSweep(fetcher, "2024-06-03 09:30:00", "2024-10-01 09:30:00")
+    results = sweep.run(pairs, z_enters=[1, 1.5, 2, 2.5], z_exits=[0.25, 0.5, 0.75], max_dd_pcts=[None, 5, 10], window_sizes=[105, 210])
+    output_path = os.path.join(".", "sim-results", "pairs-sweep.csv")
+    results.to_csv(output_path, index=False)
+    log.info(f"Saved {len(results)} sweep results to {output_path}")
+
 def process_recalls(recalls_file):
     with open(recalls_file, 'r') as f:
         recalls = []
@@ -176,6 +187,15 @@ def run_dss_driver():
         count += 1
         print(f"running_results: {end_results}")
 
+def run_dss_batch():
+    fetcher = utils.DataFetcher(os.path.join(".", "data", "historical"), "1h", "2024-01-01", "2024-11-01")
+    tickers = [ticker for tickers in get_industries_tickers().values() for ticker in tickers]
+    driver = DSBatchDriver(tickers, "2024-01-02 09:30:00", fetcher, 1000, update_interval=16, num_intervals=50)
+    results = driver.simulate()
+    end_results = results["final_capital"][~results["error"]]
+    log.critical(f"Gains of {(end_results - 1000).sum()} on {len(end_results)} stocks")
+    print(f"running_results: {end_results.to_list()}")
+
 def sharpe_ratio(arr: np.ndarray):
     end_capitals = np.array([np.float64(1052.3576189747612), np.float64(1176.8386961827725), np.float64(1114.7226694895528), np.float64(1349.6616717787392), np.float64(1144.3370177319348), np.float64(899.9008240395574), np.float64(820.6114949626235), np.float64(1181.726268647786), np.float64(1213.4967770978496), np.float64(840.2209839764671), np.float64(1168.1431933621354), np.float64(796.5768202812783), np.float64(1209.3511001444012), np.float64(1183.3483664423338), np.float64(1129.3428020484369), np.float64(1305.2347243939444), np.float64(1165.6488251644523), np.float64(884.3147951638878), np.float64(878.3325366346444), np.float64(1117.7371412034151), np.float64(1113.6497661310598), np.float64(832.4324529219641), np.float64(567.1983429897978), np.float64(1464.4089752867553), np.float64(721.4442691355925), np.float64(1008.2344135135979), np.float64(2480.3637834431315), np.float64(772.3684466714378), np.float64(967.0247917757251), np.float64(1069.1981753537411), np.float64(478.4785515132037), np.float64(607.6342318138811), np.float64(1173.3113651862652), np.float64(1360.3701788932576), np.float64(1303.1272711193092), np.float64(1833.3880567055053), np.float64(1412.8688010053825), np.float64(1604.65255386935), np.float64(1566.7384222267124), np.float64(1344.8016085759177), np.float64(1187.294030167473), np.float64(1144.4606855897396), np.float64(1422.8146218100796), np.float64(1299.3022797887302), np.float64(1555.227198525251), np.float64(1008.5636778050882), np.float64(1554.4178057011413), np.float64(1161.7536051711834), np.float64(998.6222371664253), np.float64(1248.6536299299069), np.float64(1248.0891987885238), np.float64(1097.3838219336362), np.float64(856.9265954719533), np.float64(1156.5885903635358), np.float64(1508.9057890684066), np.float64(1249.715687311273), np.float64(744.3355424142612), np.float64(1069.7630187877194), np.float64(953.8483111219016), np.float64(965.1986725346892), np.float64(1001.8942937475704), np.float64(644.5569481806649), np.float64(1347.9842719937255), np.float64(808.1374287684796), np.float64(2067.092566420597), np.float64(466.44377946606164), np.float64(825.9490017579938), np.float64(784.2443728831522), np.float64(701.3295236834933), np.float64(885.1971036401435), np.float64(638.4784652318181), np.float64(1137.7925883753453), np.float64(925.7023790857932), np.float64(506.64462361595497), np.float64(1008.6657585390756), np.float64(1940.90094008487), np.float64(1326.0768913292063), np.float64(791.7218987235626), np.float64(857.8436435806507), np.float64(1227.6472741124585), np.float64(984.1271122241953), np.float64(1060.8402270605998), np.float64(1327.9941942781147), np.float64(1470.9052444884733), np.float64(287.78612931212024), np.float64(942.1498196577456), np.float64(1531.2312145765754), np.float64(2670.3403589004934), np.float64(1113.252248560844), np.float64(1051.5541773339978), np.float64(501.08053446566237), np.float64(937.9719976254328), np.float64(1097.735713003809), np.float64(510.9411801272295), np.float64(1613.742308330478), np.float64(379.9430094899667), np.float64(652.2106400888515), np.float64(1133.238309814216), np.float64(1149.2097094032983), np.float64(1318.1683749956687), np.float64(1611.6870488742516), np.float64(1541.1366121851038), np.float64(807.6237710085888), np.float64(992.9514143991103), np.float64(1321.173692948133), np.float64(1100.499974032013), np.float64(1490.2483583372632), np.float64(1062.7566895014527), np.float64(1419.782691075593), np.float64(1140.4889554103752), np.float64(1112.637400273503), np.float64(1603.6896109279646), np.float64(1642.5581309495556), np.float64(5747.6868384335985), np.float64(1653.1638675319027), np.float64(1165.48221404688), np.float64(2043.9047497936522), np.float64(1356.7137439868388), np.float64(1028.942292202208), np.float64(1385.7168639330775), np.float64(1459.4070330992695), np.float64(573.7738342828579), np.float64(1393.0466285918706), np.float64(940.7681593848172), np.float64(1395.8213743063807), np.float64(972.3687523961246), np.float64(1265.132156121197), np.float64(1419.2299709398017), np.float64(1083.0245268713109), np.float64(1009.7202683818937), np.float64(1304.711908670292), np.float64(909.412728770672), np.float64(1216.4623575183396), np.float64(681.6219575059174), np.float64(916.2293653232682), np.float64(1853.260439888284), np.float64(1279.4621936255176), np.float64(1972.8030685953654), np.float64(953.4866357829158), np.float64(729.867629956507), np.float64(1087.3174690334433), np.float64(1740.007075679755), np.float64(725.9850885998117), np.float64(1168.9583197393601), np.float64(1578.9809312938582), np.float64(1117.2429350436464), np.float64(1076.7017575077364), np.float64(1151.443555261772), np.float64(900.8089321523564), np.float64(750.181152330867), np.float64(1171.331845947962), np.float64(918.8209916221772), np.float64(1157.4123367033956), np.float64(1499.992751334276), np.float64(1791.944014473905), np.float64(831.2186805289518), np.float64(1267.768789947033), np.float64(1458.3482361926704), np.float64(1821.1030901844601), np.float64(511.6073037895155), np.float64(1122.2553755028096), np.float64(1246.1022504611046), np.float64(1475.8822184532896), np.float64(1088.0480262731603), np.float64(1350.9714905804653), np.float64(1522.1598782005885), np.float64(1166.7069530024578), np.float64(1511.9083883904113), np.float64(1621.9379837880047), np.float64(1149.9237942538573), np.float64(686.3872201480917), np.float64(622.9421654220159), np.float64(1471.001816922847), np.float64(1309.6646466787215), np.float64(766.1653188507514), np.float64(687.931087525681), np.float64(1098.6417171535934), np.float64(1231.4653716372814), np.float64(1004.1794670466741), np.float64(965.248289395917), np.float64(1058.7005341167032), np.float64(1369.5137542047505), np.float64(852.3045514926785), np.float64(2494.163672976793), np.float64(1412.74400824958), np.float64(651.9086683760947), np.float64(1035.9974826443201), np.float64(2481.163934558659), np.float64(1558.5352727792156), np.float64(2247.050796835434), np.float64(1112.5975840053213), np.float64(1464.728845561035), np.float64(751.437316085736), np.float64(934.2431758300158), np.float64(1015.1086638747097), np.float64(860.4600359918957), np.float64(838.1568167174603), np.float64(1396.6708954189398), np.float64(606.1887585461584), np.float64(1189.8347652239338), np.float64(766.7786148566081), np.float64(1170.6367502983665), np.float64(1207.5745987205405), np.float64(897.4654150274741), np.float64(339.0128882481765), np.float64(1459.5607002359616), np.float64(916.8587592413753), np.float64(1771.2667439025245), np.float64(1616.314036207154), np.float64(1323.6148208471736), np.float64(1707.6168342507503), np.float64(1707.3764853340208), np.float64(1172.0946664716562), np.float64(728.5785297624298), np.float64(1486.3471375812928), np.float64(1148.5509731311586), np.float64(1145.4347142377003), np.float64(1033.1989668246663), np.float64(1003.928148196391), np.float64(791.0706716783325), np.float64(1181.9486427816487), np.float64(1017.1389641626647), np.float64(1332.5268039431294), np.float64(1502.426557390474), np.float64(1214.8202246207925), np.float64(514.8167194500359), np.float64(1310.3032731743697), np.float64(650.6061055769671), np.float64(1039.1415633088143), np.float64(778.3282968688388), np.float64(295.85823407940416), np.float64(613.8266544998082), np.float64(1195.39036183578), np.float64(489.0859305943641), np.float64(1141.321130053407), np.float64(599.2579100145329), np.float64(883.8741851609443), np.float64(1764.0576365508646), np.float64(814.9337334804582), np.float64(1155.76922563589), np.float64(963.8484621522377), np.float64(828.9448472662391), np.float64(1222.9656280627864), np.float64(983.3695529368422), np.float64(803.3484532615537), np.float64(1263.9659690880226), np.float64(1787.523737314399), np.float64(838.4144441470282), np.float64(1155.0710091967326), np.float64(814.6228983241244), np.float64(611.4615214616174), np.float64(979.1599703637369), np.float64(730.4735400104848), np.float64(527.3056823969721), np.float64(872.7189796353994), np.float64(728.0539118599995), np.float64(1142.1971984962377), np.float64(749.161788434541), np.float64(1175.2005927994876), np.float64(1545.9997003944063), np.float64(857.2352621172074), np.float64(927.6551509707112), np.float64(704.7904508094391), np.float64(1085.8563296389054), np.float64(1615.177314746023), np.float64(367.0919543613229), np.float64(1125.0641820358244), np.float64(1091.1643122801909), np.float64(1265.6001411850789), np.float64(1197.5243483925042), np.float64(1361.853800992331), np.float64(1296.7193991899912), np.float64(1090.9536678890393), np.float64(1225.772077282676), np.float64(975.9235607011044), np.float64(1215.0911008316016), np.float64(1234.0515041742656), np.float64(1188.3618753286444), np.float64(1094.2782650950578), np.float64(1232.2159531757588), np.float64(884.2870056936933), np.float64(924.0870271206113), np.float64(1049.892893423736), np.float64(1141.017216742055)])
     initial_investment = 1000 * len(end_capitals)
@@ -192,6 +212,8 @@ def sharpe_ratio(arr: np.ndarray):
 
 
 def main():
+    import yfinance as yf
+
     # Portfolio().find_pairs()
     # print(yf.Sector("basic-materials").top_companies.index)
     # process_recalls('recalls.txt')
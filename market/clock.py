@@ -0,0 +1,165 @@
+import os
+
+import numpy as np
+import pandas as pd
+from loguru import logger as log
+
+from data import utils
+
+MARKET_INFO_FILE = os.path.join(".", "market", "info.csv")
+SECONDS_PER_DAY = 24 * 60 * 60
+SUPPORTED_INTERVALS = ["1h", "1d"]
+
+MARKET_TIMES_FILE = os.path.join(".", "market", "info.npy")
+
+
+def load_market_times(info_file=MARKET_INFO_FILE, times_file=MARKET_TIMES_FILE) -> np.ndarray:
+    """
+    Returns the hourly market bar times of info_file as int64 unix seconds.
+    Parsing the csv is slow so the result is saved next to it in binary form (times_file)
+    and reused for as long as it is newer than the csv.
+    """
+    if os.path.exists(times_file) and os.path.getmtime(times_file) >= os.path.getmtime(info_file):
+        return np.load(times_file)
+    market_datetimes = pd.read_csv(info_file)["market_datetimes"]
+    times = utils.to_unix_seconds(market_datetimes)
+    try:
+        tmp_file = f"{times_file}.{os.getpid()}.tmp.npy"
+        np.save(tmp_file, times)
+        os.replace(tmp_file, times_file)
+    except OSError as e:
+        log.warning(f"Could not cache market times to {times_file}: {e}")
+    return times
+
+
+class MarketCalendar(object):
+    """
+    Bar times (int64 unix seconds) of the market for one interval with precomputed successors:
+        next_bar[i]: index of the bar after bar i
+        next_session[i]: index of the first bar of the session after the one containing bar i
+    An index equal to len(times) means there is no such bar.
+    Calendars are read once from market/info.csv (hourly bars). Daily bars are keyed by session date
+    (midnight), as providers stamp them, and any time within a session is at that session's bar.
+    """
+
+    _calendars = dict()
+
+    def __init__(self, times: np.ndarray, daily=False):
+        self.times = times
+        self.daily = daily
+        n = len(times)
+        self.next_bar = np.arange(1, n + 1)
+        sessions = times // SECONDS_PER_DAY
+        self.next_session = np.searchsorted(sessions, sessions, side="right")
+
+    def __len__(self):
+        return len(self.times)
+
+    @classmethod
+    def get(cls, interval="1h") -> "MarketCalendar":
+        if interval not in SUPPORTED_INTERVALS:
+            log.warning(f"No market calendar for interval {interval}, using hourly bars")
+            interval = "1h"
+        if interval not in cls._calendars:
+            times = load_market_times()
+            if interval == "1d":
+                sessions = np.unique(times // SECONDS_PER_DAY)
+                cls._calendars[interval] = cls(sessions * SECONDS_PER_DAY, daily=True)
+            else:
+                cls._calendars[interval] = cls(times)
+        return cls._calendars[interval]
+
+    def positions(self, times) -> np.ndarray:
+        """
+        Returns the index of the bar at each of times, -1 where a time is not a bar
+        """
+        times = np.asarray(times, dtype=np.int64)
+        if self.daily:
+            times = times // SECONDS_PER_DAY * SECONDS_PER_DAY
+        inds = np.minimum(np.searchsorted(self.times, times), len(self.times) - 1)
+        return np.where(self.times[inds] == times, inds, -1)
+
+    def position(self, timestamp) -> int:
+        """
+        Returns the index of the bar at timestamp, or -1 if timestamp is not a bar
+        """
+        if self.daily:
+            timestamp = timestamp // SECONDS_PER_DAY * SECONDS_PER_DAY
+        ind = np.searchsorted(self.times, timestamp)
+        if ind < len(self.times) and self.times[ind] == timestamp:
+            return int(ind)
+        return -1
+
+
+class MarketClock(object):
+    """
+    Cursor over a MarketCalendar, bounded to bars strictly before end (unix seconds, None for no bound).
+    One clock can be shared by many traders so they simulate in lockstep, in that case only one
+    caller should advance it.
+    """
+
+    def __init__(self, calendar: MarketCalendar, current_datetime, end=None):
+        self.calendar = calendar
+        self.times = calendar.times
+        self.limit = len(self.times) if end is None else int(np.searchsorted(self.times, end, side="left"))
+        self.seek(current_datetime)
+
+    def seek(self, timestamp):
+        """
+        Moves the clock to an arbitrary time, which does not have to be a bar of the calendar
+        """
+        if timestamp is None:
+            self.now = None
+            self.cursor = -1
+            return
+        self.now = utils.to_unix(timestamp)
+        self.cursor = self.calendar.position(self.now)
+
+    def _next_index(self) -> int:
+        if self.cursor >= 0:
+            return self.calendar.next_bar[self.cursor]
+        return int(np.searchsorted(self.times, self.now, side="right"))
+
+    def peek(self):
+        """
+        Returns the time of the next bar, or None if there is none before end
+        """
+        ind = self._next_index()
+        if ind >= len(self.times):
+            log.warning(f"No market bars marked for next timestep following {utils.fmt_datetime(self.now)}")
+            return None
+        elif ind >= self.limit:
+            log.warning(f"Limited market view")
+            return None
+        return int(self.times[ind])
+
+    def advance(self):
+        """
+        Moves to the next bar. Past the last bar before end the clock stops and now becomes None
+        """
+        ind = self._next_index()
+        if ind >= len(self.times):
+            log.warning(f"No market bars marked for next timestep following {utils.fmt_datetime(self.now)}")
+            self.seek(None)
+        elif ind >= self.limit:
+            log.warning(f"Limited market view")
+            self.seek(None)
+        else:
+            self.cursor = int(ind)
+            self.now = int(self.times[ind])
+
+    def advance_session(self):
+        """
+        Moves to the first bar of the next session
+        """
+        if self.cursor >= 0:
+            ind = self.calendar.next_session[self.cursor]
+        else:
+            session_end = (self.now // SECONDS_PER_DAY + 1) * SECONDS_PER_DAY
+            ind = int(np.searchsorted(self.times, session_end, side="left"))
+        if ind >= len(self.times):
+            log.warning(f"No market hours marked for next day following {utils.fmt_datetime(self.now)}")
+            self.seek(None)
+            return
+        self.cursor = int(ind)
+        self.now = int(self.times[ind])
@@ -1,8 +1,9 @@
 from market.traders import SimulatedTrader
 from model.strategy import PairsStrategy, DSStrategy
-from data.utils import DataFetcher
-from pipelines.PairsTrader import PairsTraderStatic
-import matplotlib.pyplot as plt
+from data.utils import DataFetcher, to_unix
+from model.backtest import backtest_ds, backtest_pairs
+from data.panel import Panel, load_panel
+from pipelines.PairsTrader import PairsTraderKalman, PairsTraderStatic
 import numpy as np
 import pandas as pd
 import os
@@ -11,16 +12,49 @@ from loguru import logger as log
 
 MIN_DRAWDOWN_PCT = 1
 MAX_DRAWDOWN_PCT = 50
+ENGINES = ["object", "vectorized"]
+ANALYZERS = {"static": PairsTraderStatic, "kalman": PairsTraderKalman}
+
+def backtest_metrics(record, capital_per_trade):
+    """
+    Returns the sharpe ratio ('NA' with too few trades) and the max drawdown pct, clamped to
+    [MIN_DRAWDOWN_PCT, MAX_DRAWDOWN_PCT], of a PairsStrategy record
+    """
+    [dates, capital] = list(zip(*record))
+    capital = np.array(capital[::2])
+    acc_max = np.maximum.accumulate(capital)
+    drawdowns = capital - acc_max
+    max_dd = drawdowns.min()
+    max_dd_pct = 100.0 * -max_dd/capital_per_trade
+    max_dd_pct = min(MAX_DRAWDOWN_PCT, max(max_dd_pct, MIN_DRAWDOWN_PCT))
+    if len(capital) <= 2:
+        return 'NA', max_dd_pct
+    total_returns = (capital[-1] - capital[0])/capital[0]
+    risk_free_ror = 0.06
+    returns = (capital[1:] - capital[:-1]) / capital_per_trade
+    returns_std = np.std(returns)
+    sharpe_ratio = (total_returns - risk_free_ror)/returns_std
+    return sharpe_ratio, max_dd_pct
 
 class PairsDriver(object):
-    def __init__(self, symbolx, symboly, start_datetime, strategy: PairsStrategy, trader: SimulatedTrader, fetcher: DataFetcher):
+    """
+    Backtests a pair up to start_datetime to size the strategy's max drawdown, then livetests it.
+    engine="vectorized" runs the backtest with model.backtest.backtest_pairs instead of stepping
+    the strategy bar by bar, the outcome is the same.
+    analyzer picks the hedge ratio model, one of ANALYZERS.
+    """
+    def __init__(self, symbolx, symboly, start_datetime, strategy: PairsStrategy, trader: SimulatedTrader, fetcher: DataFetcher, engine="object", analyzer="static"):
+        assert engine in ENGINES, f"Unknown backtest engine {engine}"
+        assert analyzer in ANALYZERS, f"Unknown pairs analyzer {analyzer}"
         self.symbolx = symbolx
         self.symboly = symboly
-        self.start_datetime = start_datetime
+        self.start_datetime = to_unix(start_datetime)
         self.strategy = strategy
         self.trader = trader
         self.fetcher = fetcher
         self.sharpe_ratio = float('-inf')
+        self.engine = engine
+        self.analyzer = analyzer
     
     def simulate(self):
         df1 = self.fetcher.get_bars(self.symbolx)
@@ -34,7 +68,7 @@ class PairsDriver(object):
         # Only introduce the 'test' section of the data
         df1_known = df1.loc[:self.start_datetime]
         df2_known = df2.loc[:self.start_datetime]
-        pairs_analyzer = PairsTraderStatic(df1_known, df2_known)
+        pairs_analyzer = ANALYZERS[self.analyzer](df1_known, df2_known)
 
         sharpe_ratio, max_dd_pct = self.backtest(pairs_analyzer)
         self.sharpe_ratio = sharpe_ratio
@@ -45,6 +79,46 @@ class PairsDriver(object):
 
 
     def backtest(self, pairs_analyzer: PairsTraderStatic):
+        if self.engine == "vectorized":
+            self._run_backtest_engine(pairs_analyzer)
+        else:
+            self._run_backtest_steps(pairs_analyzer)
+        return self._backtest_metrics()
+
+    def _run_backtest_engine(self, pairs_analyzer: PairsTraderStatic):
+        clock = self.trader.clock
+        first = int(np.searchsorted(clock.times, clock.now, side="right"))
+        end = clock.calendar.position(self.start_datetime)
+        assert end >= first, f"{self.start_datetime} is not a market bar after the trader's current time"
+        times = clock.times[first:end]
+
+        z_score = pairs_analyzer.zscores.lookup(times)
+
+        # Backtesting starts at the first z_score and stops at the first missing beta
+        known = np.flatnonzero(~np.isnan(z_score))
+        start = known[0] if len(known) > 0 else len(times)
+        beta = pairs_analyzer.get_betas(times)
+        missing = np.flatnonzero(np.isnan(beta[start:]))
+        stop = start + missing[0] if len(missing) > 0 else len(times)
+
+        price1 = self.trader.get_price_series(self.strategy.symbol1)[first:end]
+        price2 = self.trader.get_price_series(self.strategy.symbol2)[first:end]
+        result = backtest_pairs(
+            times[start:stop],
+            z_score[start:stop],
+            beta[start:stop],
+            price1[start:stop],
+            price2[start:stop],
+            buying_power=self.strategy.buying_power,
+            capital_per_trade=self.strategy.capital_per_trade,
+            z_enter=self.strategy.z_enter,
+            z_exit=self.strategy.z_exit,
+            max_dd_pct=self.strategy.max_dd_pct,
+        )
+        result.apply_to(self.strategy)
+        self.trader.current_datetime = self.start_datetime
+
+    def _run_backtest_steps(self, pairs_analyzer: PairsTraderStatic):
         # Find the first z_score to start backtesting
         while True:
             self.trader.go_next_trading_hour()
@@ -63,35 +137,11 @@ class PairsDriver(object):
             self.strategy.update(z_score, -beta, 1)
             self.trader.go_next_trading_hour()
             datetime = self.trader.current_datetime
-        
-        [dates, capital] = list(zip(*self.strategy.record))
-        capital = np.array(capital[::2])
-        # for i in range(len(capital)): print(f"capital: {capital[i]}")
-        acc_max = np.maximum.accumulate(capital)
-        # for i in range(len(acc_max)): print(f"accmax: {acc_max[i]}")
-        drawdowns = capital - acc_max
-        ind = np.argmin(drawdowns)
-        max_dd = drawdowns[ind]
-        # print(f"max_dd: {max_dd}")
-        # max_dd_date = dates[ind]
-        log.error(f"accmax: {acc_max[ind]}, maxdd: {max_dd}")
-        max_dd_pct = 100.0 * -max_dd/self.strategy.capital_per_trade
-        log.info(f"true backtest max_dd_pct: {max_dd_pct}")
-        max_dd_pct = min(MAX_DRAWDOWN_PCT, max(max_dd_pct, MIN_DRAWDOWN_PCT))
-        if len(capital) <= 2:
-            log.info(f"Not enough trades to create sharpe_ratio")
-            return 'NA', max_dd_pct
-        # print(capital)
-        total_returns = (capital[-1] - capital[0])/capital[0]
-        risk_free_ror = 0.06
-        returns = (capital[1:] - capital[:-1]) / self.strategy.capital_per_trade
-        returns_std = np.std(returns)
-        # print(returns)
-        log.error(f"totaled_returns: {np.sum(returns)}")
-        log.error(f"total_returns: {total_returns}, rfror: {risk_free_ror}, ret_std: {returns_std}")
-        sharpe_ratio = (total_returns - risk_free_ror)/returns_std
-        log.error(f"sharpe_ratio: {sharpe_ratio}")
 
+    def _backtest_metrics(self):
+        sharpe_ratio, max_dd_pct = backtest_metrics(self.strategy.record, self.strategy.capital_per_trade)
+        log.info(f"backtest max_dd_pct: {max_dd_pct}")
+        log.error(f"sharpe_ratio: {sharpe_ratio}")
         return sharpe_ratio, max_dd_pct
 
 
@@ -140,4 +190,63 @@ class DSDriver(object):
             if self.trader._get_next_trading_hour() is None:
                 break
 
-        self.strategy.exit()
\ No newline at end of file
+        self.strategy.exit()
+
+
+class DSBatchDriver(object):
+    """
+    Runs DSStrategy for a whole universe of symbols in one array computation over an aligned Panel,
+    with the same results as one SimulatedTrader, DSStrategy and DSDriver per symbol.
+    """
+    def __init__(self, symbols, start_datetime, fetcher: DataFetcher, buying_power, update_interval=10, num_intervals=10, trade_on="Open", max_workers=None):
+        self.symbols = symbols
+        self.start_datetime = to_unix(start_datetime)
+        self.fetcher = fetcher
+        self.buying_power = buying_power
+        self.update_interval = update_interval
+        self.num_intervals = num_intervals
+        self.trade_on = trade_on
+        self.max_workers = max_workers
+        self.times = None
+        self.panel_symbols = []
+        self.result = None
+
+    def _calendar_prices(self, panel: Panel, times: np.ndarray):
+        """
+        Returns the (symbols, bars) prices of the panel at the given market bars and the index of
+        each symbol's last bar among them (-1 if it is not one of them)
+        """
+        prices = np.full((len(panel.symbols), len(times)), np.nan)
+        if len(panel.times) == 0:
+            return prices, np.full(len(panel.symbols), -1)
+        inds = np.minimum(np.searchsorted(panel.times, times), len(panel.times) - 1)
+        found = panel.times[inds] == times
+        prices[:, found] = panel.field(self.trade_on)[:, inds[found]]
+
+        has_bars = panel.mask.any(axis=1)
+        last_idx = panel.mask.shape[1] - 1 - np.argmax(panel.mask[:, ::-1], axis=1)
+        last_times = panel.times[last_idx]
+        pos = np.searchsorted(times, last_times)
+        on_calendar = has_bars & (pos < len(times))
+        on_calendar[on_calendar] = times[pos[on_calendar]] == last_times[on_calendar]
+        last = np.where(on_calendar, pos, -1)
+        return prices, last
+
+    def simulate(self) -> pd.DataFrame:
+        """
+        Returns the final capital of every symbol, NaN (with error set) where a DSDriver would have failed
+        """
+        clock = SimulatedTrader(self.fetcher, self.start_datetime, self.trade_on).clock
+        assert clock.cursor >= 0, f"{self.start_datetime} is not a market bar"
+        self.times = clock.times[clock.cursor:clock.limit]
+
+        panel = load_panel(self.fetcher, self.symbols, fields=[self.trade_on], max_workers=self.max_workers)
+        prices, last = self._calendar_prices(panel, self.times)
+        self.result = backtest_ds(prices, last, self.buying_power, self.update_interval, self.num_intervals)
+
+        final_capital = pd.Series(np.nan, index=self.symbols)
+        final_capital[panel.symbols] = self.result.final_capital
+        errors = pd.Series(True, index=self.symbols)
+        errors[panel.symbols] = self.result.errors
+        self.panel_symbols = panel.symbols
+        return pd.DataFrame({"final_capital": final_capital, "error": errors})
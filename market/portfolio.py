@@ -1,11 +1,12 @@
 
 from pipelines import pairs_trading_pipeline as ptp
+from model.result_cache import STAT_TEST_CACHE_FILE, StatTestCache
 from data import utils
 from loguru import logger as log
 import os
 import sys
-import yfinance as yf
 import pickle
+import numpy as np
 from typing import Dict, List
 
 ALL_SECTORS = [
@@ -22,6 +23,7 @@ ALL_SECTORS = [
     "utilities",
 ]
 MIN_MARKET_WEIGHT = 0.001
+PAIRS_CUTOFF = utils.to_unix("2024-10-01 09:30:00")
 
 def get_industries_tickers() -> Dict[str, List[str]]:
     industries_file = os.path.join(".", "market", "industries.pkl")
@@ -31,13 +33,18 @@ def get_industries_tickers() -> Dict[str, List[str]]:
 
 class Portfolio(object):
     
-    def __init__(self):
+    def __init__(self, max_workers=None, cache_path=STAT_TEST_CACHE_FILE):
         folder = os.path.join(".", "data", "historical")
         self.fetcher = utils.DataFetcher(folder, "1h", "2023-10-01", None)
+        self.max_workers = max_workers
+        # Stationarity and cointegration results are reused across find_pairs runs, None turns this off
+        self.cache_path = cache_path
         self.industries = dict()
         self.cointegrated_pairs = []
     
     def _retrieve_api_top_companies(self):
+        import yfinance as yf
+
         industries = dict()
         for sector_name in ALL_SECTORS:
             sector = yf.Sector(sector_name)
@@ -63,31 +70,54 @@ class Portfolio(object):
             log.trace(f"Downloading industry {symbol}")
             self.fetcher.bulk_download(top_tickers)
 
-    def find_pairs(self):
+    def _load_pairs_data(self, tickers: List[str]) -> Dict[str, np.ndarray]:
+        loaded = dict()
+        for result in self.fetcher.get_many(tickers, max_workers=self.max_workers):
+            log.info(f"{result.symbol}")
+            if result.error is not None:
+                log.warning(f"Could not load {result.symbol} ({result.error})...skipping")
+                continue
+            df = result.bars
+            if df.isna().to_numpy().any():
+                log.warning(f"Symbol {result.symbol} has na...skipping")
+                continue
+            elif PAIRS_CUTOFF not in df.index:
+                log.warning(f"Not right cutoff for {result.symbol}...skipping")
+                continue
+            loaded[result.symbol] = df.loc[:PAIRS_CUTOFF].to_numpy()
+
+        # Keep the given ordering so pairs come out the same regardless of load order
+        return {symbol: loaded[symbol] for symbol in tickers if symbol in loaded}
+
+    def find_pairs(self, cross_industry=False, neighbours=10, cluster_distance=None):
+        """
+        Searches cointegrated pairs inside every industry, or with cross_industry across all the
+        industries' tickers at once, where only the neighbours most correlated tickers of each
+        ticker are tested (see PairsTradingPipeline candidate_neighbours)
+        """
         self.industries = self._retrieve_local_top_companies()
         self._download_top_companies()
-        data_dict = dict()
 
+        if cross_industry:
+            universe = list(dict.fromkeys(t for top_tickers in self.industries.values() for t in top_tickers))
+            groups = {"all": universe}
+            pipeline_kwargs = {"candidate_neighbours": neighbours, "cluster_distance": cluster_distance}
+        else:
+            groups = self.industries
+            pipeline_kwargs = dict()
+
+        cache = StatTestCache(self.cache_path) if self.cache_path is not None else None
         all_pairs = []
-        for industry, top_tickers in self.industries.items():
+        for industry, top_tickers in groups.items():
             log.trace(f"Industry: {industry}")
-            data_dict = dict()
-            for symbol in top_tickers:
-                log.info(f"{symbol}")
-                df = self.fetcher.get_bars(symbol)
-                if len(df[df.isna().any(axis=1)]):
-                    log.warning(f"Symbol {symbol} has na...skipping")
-                    continue
-                elif "2024-10-01 09:30:00" not in df.index.to_list():
-                    log.warning(f"Not right cutoff for {symbol}...skipping")
-                    continue
-                df = df.loc[:"2024-10-01 09:30:00"]
-                data_dict[symbol] = df.to_numpy()
+            data_dict = self._load_pairs_data(top_tickers)
             
             if len(data_dict) == 0: continue
                 
-            my_ptp = ptp.PairsTradingPipeline(data_dict)
+            my_ptp = ptp.PairsTradingPipeline(data_dict, max_workers=self.max_workers, use_processes=True, cache=cache, **pipeline_kwargs)
             pairs = my_ptp.run()
+            if my_ptp.candidate_report is not None:
+                log.info(f"Candidate report: {my_ptp.candidate_report}")
             if len(pairs) == 0:
                 continue
             
@@ -95,6 +125,9 @@ class Portfolio(object):
             print(all_pairs)
         
         print(all_pairs)
+        if cache is not None:
+            log.info(f"Test cache: {cache.hits} hits, {cache.misses} misses")
+            cache.close()
         return all_pairs
 
 # pairs = [('T', 'FYBR'), ('YUM', 'SHAK'), ('EAT', 'CAKE'), ('PAG', 'CARG'), ('CVNA', 'AN'), ('PAG', 'SAH'), ('HGV', 'PLYA'), ('CZR', 'GDEN'), ('COLM', 'KTB'), ('ROL', 'SCI'), ('MKC', 'CAG'), ('GIS', 'LWAY'), ('BRBR', 'UTZ'), ('MKC', 'CPB'), ('DINO', 'DK'), ('NDAQ', 'TRU'), ('PEN', 'FNA'), ('QDEL', 'AHCO'), ('INMD', 'FNA'), ('CI', 'HUM'), ('ELV', 'OSCR'), ('IMVT', 'ACAD'), ('RPRX', 'BHVN'), ('RVMD', 'RNA'), ('SMMT', 'PCVX'), ('SMMT', 'ADMA'), ('RVMD', 'CRNX'), ('NUVL', 'ACLX'), ('CORT', 'DNLI'), ('SRPT', 'MRUS'), ('UTHR', 'HALO'), ('LH', 'SHC'), ('ICLR', 'MEDP'), ('ISRG', 'BLFS'), ('RMD', 'BLFS'), ('GD', 'ACHR'), ('GE', 'GD'), ('TDG', 'GD'), ('AOS', 'FELE'), ('DOV', 'FLS'), ('AOS', 'MIR'), ('RRX', 'FELE'), ('DCI', 'GTES'), ('IR', 'FELE'), ('CXT', 'TNC'), ('CSL', 'APOG'), ('CMPR', 'SPIR'), ('CTAS', 'ARMK'), ('GATX', 'CAR'), ('AEIS', 'ENS'), ('HAYW', 'POWL'), ('WERN', 'MRTN'), ('NNN', 'FCPT'), ('ADC', 'KRG'), ('O', 'ROIC'), ('KIM', 'ROIC'), ('AVB', 'CPT'), ('EQR', 'CPT'), ('AMH', 'IRT'), ('AMH', 'UMH'), ('AMH', 'VRE'), ('INVH', 'AIV'), ('AMH', 'CPT'), ('WELL', 'CTRE'), ('EPRT', 'GOOD'), ('RHP', 'SHO'), ('MSFT', 'ALTR'), ('IT', 'BR'), ('MSI', 'BDC'), ('CAMT', 'VECO'), ('ANET', 'STX'), ('DELL', 'WDC'), ('JBL', 'DAKT'), ('FE', 'EVRG'), ('PPL', 'EVRG'), ('PCG', 'NWE'), ('EIX', 'CMS'), ('D', 'PPL'), ('EIX', 'EVRG'), ('FE', 'CMS'), ('EIX', 'FE'), ('PPL', 'CMS'), ('CMS', 'ETR'), ('NWN', 'SPH'), ('NJR', 'BKH'), ('NI', 'NFE'), ('NJR', 'SR')]
\ No newline at end of file
@@ -0,0 +1,170 @@
+import itertools
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from loguru import logger as log
+
+from data.utils import DataFetcher, to_unix
+from market.drivers import backtest_metrics
+from market.traders import SimulatedTrader
+from model.backtest import backtest_pairs
+from pipelines.PairsTrader import PairsTraderStatic
+
+
+@dataclass
+class PairsFit:
+    """
+    Everything a PairsDriver run derives from the data before any threshold comes into play:
+    the hedge ratio fitted on bars up to start_datetime and the z-score and price series
+    of the backtest bars (before start_datetime) and the livetest bars (from start_datetime on).
+    """
+
+    symbolx: str
+    symboly: str
+    window_size: int
+    beta: float
+    backtest_times: np.ndarray
+    backtest_z: np.ndarray
+    backtest_prices: np.ndarray
+    live_times: np.ndarray
+    live_z: np.ndarray
+    live_prices: np.ndarray
+
+
+class PairsSweep(object):
+    """
+    Evaluates grids of PairsStrategy thresholds (z_enter x z_exit x max_dd_pct) the way PairsDriver
+    would run each combination, but fits every (pair, window_size) only once and runs each
+    combination with the vectorized backtest engine.
+    A max_dd_pct of None uses the drawdown measured in the backtest, as PairsDriver does.
+    Livetest z-scores are computed in one rolling pass instead of bar by bar, they may differ from
+    PairsTraderStatic.update in the last bits.
+    """
+
+    def __init__(self, fetcher: DataFetcher, trader_start, start_datetime, buying_power=1000):
+        self.fetcher = fetcher
+        self.trader_start = to_unix(trader_start)
+        self.start_datetime = to_unix(start_datetime)
+        self.buying_power = buying_power
+        # Only used for its clock and its per-symbol price vectors, which are shared by every fit
+        self.trader = SimulatedTrader(fetcher, self.trader_start)
+
+    def fit(self, symbolx, symboly, window_size=210) -> PairsFit | None:
+        df1 = self.fetcher.get_bars(symbolx)
+        df2 = self.fetcher.get_bars(symboly)
+        if df1 is None or df2 is None:
+            log.error(f"No bars for {symbolx} {symboly}")
+            return None
+        if not df1.index.equals(df2.index):
+            log.error(f"Mismatched indices for {symbolx} {symboly}")
+            return None
+
+        df1_known = df1.loc[:self.start_datetime]
+        df2_known = df2.loc[:self.start_datetime]
+        pairs_analyzer = PairsTraderStatic(df1_known, df2_known, window_size)
+
+        clock = self.trader.clock
+        first = int(np.searchsorted(clock.times, self.trader_start, side="right"))
+        live_start = clock.calendar.position(self.start_datetime)
+        assert live_start >= first, f"{self.start_datetime} is not a market bar after {self.trader_start}"
+        prices = np.stack([self.trader.get_price_series(symbolx), self.trader.get_price_series(symboly)], axis=1)
+
+        backtest_times = clock.times[first:live_start]
+        backtest_z = pairs_analyzer.zscores.lookup(backtest_times)
+        known = np.flatnonzero(~np.isnan(backtest_z))
+        skip = known[0] if len(known) > 0 and not np.isnan(pairs_analyzer.beta) else len(backtest_times)
+
+        # The livetest appends every bar from start_datetime on (start_datetime itself again) to the spread
+        # and takes the z-score of the latest window, except at start_datetime where the fitted one is found first
+        live_times = clock.times[live_start:clock.limit]
+        key = pairs_analyzer.key
+        live_x = df1[key].reindex(live_times).to_numpy()
+        live_y = df2[key].reindex(live_times).to_numpy()
+        live_spread = live_y - pairs_analyzer.alpha - pairs_analyzer.beta * live_x
+        spread = pd.Series(np.concatenate([pairs_analyzer.spread.to_numpy(dtype=np.float64), live_spread]))
+        zscore = (spread - spread.rolling(window=window_size).mean()) / spread.rolling(window=window_size).std()
+        live_z = zscore.to_numpy()[len(pairs_analyzer.spread):]
+        if len(live_z) > 0:
+            live_z[0] = pairs_analyzer.zscores.lookup(live_times[:1])[0]
+
+        return PairsFit(
+            symbolx=symbolx,
+            symboly=symboly,
+            window_size=window_size,
+            beta=pairs_analyzer.beta,
+            backtest_times=backtest_times[skip:],
+            backtest_z=backtest_z[skip:],
+            backtest_prices=prices[first:live_start][skip:],
+            live_times=live_times,
+            live_z=live_z,
+            live_prices=prices[live_start:clock.limit],
+        )
+
+    def evaluate(self, fit: PairsFit, z_enters, z_exits, max_dd_pcts=(None,)) -> list[dict]:
+        """
+        Returns one row per combination of thresholds
+        """
+        rows = []
+        for z_enter, z_exit in itertools.product(z_enters, z_exits):
+            backtest = backtest_pairs(
+                fit.backtest_times,
+                fit.backtest_z,
+                fit.beta,
+                fit.backtest_prices[:, 0],
+                fit.backtest_prices[:, 1],
+                buying_power=self.buying_power,
+                z_enter=z_enter,
+                z_exit=z_exit,
+            )
+            if len(backtest.record) == 0:
+                sharpe_ratio, measured_dd_pct = 'NA', np.nan
+            else:
+                sharpe_ratio, measured_dd_pct = backtest_metrics(backtest.record, self.buying_power)
+
+            for max_dd_pct in max_dd_pcts:
+                live_dd_pct = measured_dd_pct if max_dd_pct is None else max_dd_pct
+                live = backtest_pairs(
+                    fit.live_times,
+                    fit.live_z,
+                    fit.beta,
+                    fit.live_prices[:, 0],
+                    fit.live_prices[:, 1],
+                    capital_per_trade=self.buying_power,
+                    z_enter=z_enter,
+                    z_exit=z_exit,
+                    max_dd_pct=100 if np.isnan(live_dd_pct) else live_dd_pct,
+                    resume=backtest,
+                )
+                live_capital = [c for (d, c) in live.record if d > self.start_datetime]
+                rows.append(
+                    {
+                        "symbolx": fit.symbolx,
+                        "symboly": fit.symboly,
+                        "window_size": fit.window_size,
+                        "z_enter": z_enter,
+                        "z_exit": z_exit,
+                        "max_dd_pct": max_dd_pct,
+                        "live_max_dd_pct": live_dd_pct,
+                        "sharpe_ratio": sharpe_ratio,
+                        "backtest_trades": len(backtest.entries),
+                        "live_trades": len(live.entries),
+                        "profit": live_capital[-1] - live_capital[0] if len(live_capital) > 0 else np.nan,
+                        "buying_power": live.buying_power,
+                        "has_position": live.has_position,
+                        "stopped_out": live.stopped_out,
+                    }
+                )
+        return rows
+
+    def run(self, pairs, z_enters, z_exits, max_dd_pcts=(None,), window_sizes=(210,)) -> pd.DataFrame:
+        """
+        Sweeps every pair and window size over the threshold grid, returns one row per combination
+        """
+        rows = []
+        for (symbolx, symboly), window_size in itertools.product(pairs, window_sizes):
+            fit = self.fit(symbolx, symboly, window_size)
+            if fit is None:
+                continue
+            rows.extend(self.evaluate(fit, z_enters, z_exits, max_dd_pcts))
+        return pd.DataFrame(rows)
@@ -3,32 +3,41 @@ import os
 import pandas as pd
 import numpy as np
 from loguru import logger as log
-import yfinance as yf
-from datetime import datetime
+from market.clock import MarketCalendar, MarketClock
 
 ALLOWED_POSITIVE_ACTIONS = ["Buy", "Sell"]
 ALLOWED_NEGATIVE_ACTIONS = ["Buy to Cover", "Sell Short"]
 ALLOWED_ACTIONS = ALLOWED_POSITIVE_ACTIONS + ALLOWED_NEGATIVE_ACTIONS
-MARKET_DATETIMES = pd.read_csv('./market/info.csv')["market_datetimes"].to_list()
-MARKET_UNIX_S = ((pd.to_datetime(MARKET_DATETIMES) - pd.Timestamp("1970-01-01")) // pd.Timedelta("1s")).to_numpy()
 
 def fmt(num):
     return "{:.2f}".format(num)
 
 class SimulatedTrader(object):
     """
-    Simulates market trades on historical markets
+    Simulates market trades on historical markets.
+    Time is tracked as int64 unix seconds by a MarketClock, current_datetime may be given as a string.
+    Pass a shared clock to simulate several traders in lockstep.
+    Prices are looked up in per-symbol vectors aligned to the market calendar, built on first use,
+    so a price is a single array index at the current bar.
     """
-    def __init__(self, fetcher: utils.DataFetcher, current_datetime, trade_on="Open"):
-        self.current_datetime = current_datetime
+    def __init__(self, fetcher: utils.DataFetcher, current_datetime, trade_on="Open", clock: MarketClock = None):
+        self._price_vectors = dict()
         self.positions = dict()
         self.trade_on = trade_on
         self.fetcher = fetcher
         self.interval = self.fetcher.interval
-        if self.fetcher.end is None:
-            self.last_datetime = MARKET_DATETIMES[-1]
+        if clock is None:
+            calendar = MarketCalendar.get(self.interval)
+            if self.fetcher.end is None:
+                self.last_datetime = calendar.times[-1]
+            else:
+                self.last_datetime = utils.to_unix(self.fetcher.end)
+            clock = MarketClock(calendar, current_datetime, self.last_datetime)
         else:
-            self.last_datetime = datetime.strptime(self.fetcher.end, '%Y-%m-%d')
+            self.last_datetime = clock.times[clock.limit] if clock.limit < len(clock.times) else clock.times[-1]
+            # A shared clock is driven by its owner, seeking it here would rewind the other traders
+            assert clock.now == utils.to_unix(current_datetime), f"Shared clock is not at {current_datetime}"
+        self.clock = clock
     
     def trade(self, symbol, action, quantity):
         assert action in ALLOWED_ACTIONS
@@ -50,49 +59,106 @@ class SimulatedTrader(object):
             self.positions[symbol] -= quantity
         
         log.info(f"{action} {fmt(quantity)} shares of {symbol} performed at a cost of {fmt(cost)}")
-        log.info(f"Position now at {fmt(self.positions[symbol])} shares at {self.current_datetime}")
+        log.info(f"Position now at {fmt(self.positions[symbol])} shares at {utils.fmt_datetime(self.current_datetime)}")
         return cost
 
-    def _get_next_trading_hour(self):
-        unix_off = pd.to_datetime([self.current_datetime]) - pd.Timestamp("1970-01-01")
-        unix_off_s = (unix_off // pd.Timedelta("1s")).to_numpy()
-        [ind] = np.searchsorted(MARKET_UNIX_S, unix_off_s, side='right')
-        if ind >= len(MARKET_DATETIMES):
-            log.warning(f"No market bars marked for next timestep following {self.current_datetime}") 
-            return None
-        elif datetime.strptime(MARKET_DATETIMES[ind], '%Y-%m-%d %H:%M:%S') >= self.last_datetime:
-            log.warning(f"Limited market view")
-            return None
+    @property
+    def current_datetime(self):
+        return self.clock.now
 
-        return MARKET_DATETIMES[ind]
+    @current_datetime.setter
+    def current_datetime(self, value):
+        self.clock.seek(value)
+
+    def _get_next_trading_hour(self):
+        return self.clock.peek()
 
     def go_next_trading_hour(self):
-        self.current_datetime = self._get_next_trading_hour()
+        self.clock.advance()
     
     def go_next_trading_day(self):
-        unix_off = pd.to_datetime([self.current_datetime]) - pd.Timestamp("1970-01-01")
-        unix_off_s = (unix_off // pd.Timedelta("1s")).to_numpy() + 60*60*7 # 7hrs, next trading day at least
-        [ind] = np.searchsorted(MARKET_UNIX_S, unix_off_s, side='right')
-        if ind >= len(MARKET_DATETIMES):
-            log.warning(f"No market hours marked for next day following {self.current_datetime}") 
-            self.current_datetime = None
-            return
-        self.current_datetime = MARKET_DATETIMES[ind]
+        self.clock.advance_session()
+
+    def _price_vector(self, symbol):
+        """
+        Returns (prices, has_bar, bars) aligned to the market calendar, or None without data
+        """
+        if symbol in self._price_vectors:
+            return self._price_vectors[symbol]
 
-    def get_price(self, symbol):
         df = self.fetcher.get_bars(symbol)
         if df is None:
+            return None
+        market_times = self.clock.times
+        bar_times = df.index.to_numpy()
+        bar_prices = df[self.trade_on].to_numpy(dtype=np.float64)
+        prices = np.full(len(market_times), np.nan)
+        has_bar = np.zeros(len(market_times), dtype=bool)
+        inds = np.searchsorted(market_times, bar_times)
+        on_calendar = inds < len(market_times)
+        on_calendar[on_calendar] = market_times[inds[on_calendar]] == bar_times[on_calendar]
+        prices[inds[on_calendar]] = bar_prices[on_calendar]
+        has_bar[inds[on_calendar]] = True
+
+        vector = (prices, has_bar, df)
+        self._price_vectors[symbol] = vector
+        return vector
+
+    def get_price(self, symbol):
+        vector = self._price_vector(symbol)
+        if vector is None:
             log.error(f"Failed to get price of {symbol}: No data")
             return None
-        
-        if not self.current_datetime in df.index.to_list():
-            log.warning(f"{self.current_datetime} not in bars of {symbol}")
+
+        [prices, has_bar, df] = vector
+        cursor = self.clock.cursor
+        if cursor >= 0:
+            if has_bar[cursor]:
+                return prices[cursor]
+        elif self.current_datetime in df.index:
+            # Off the market calendar, fall back to the bars themselves
+            return df.at[self.current_datetime, self.trade_on]
+
+        log.warning(f"{utils.fmt_datetime(self.current_datetime)} not in bars of {symbol}")
+        return None
+
+    def get_price_series(self, symbol) -> np.ndarray | None:
+        """
+        Returns the prices of symbol at every bar of the market calendar (clock.times), NaN where it has no bar
+        """
+        vector = self._price_vector(symbol)
+        if vector is None:
             return None
-        
-        bar = df.loc[self.current_datetime]
-        return bar[self.trade_on]
+        return vector[0]
+
+    def get_prices(self, symbols, times=None) -> np.ndarray:
+        """
+        Returns the prices of all symbols at the current bar, or at every one of times with shape
+        (len(times), len(symbols)), NaN where a symbol has no bar
+        """
+        current = times is None
+        if current:
+            times = np.array([-1 if self.current_datetime is None else self.current_datetime], dtype=np.int64)
+            positions = np.array([self.clock.cursor])
+        else:
+            times = np.array([utils.to_unix(t) for t in times], dtype=np.int64)
+            positions = self.clock.calendar.positions(times)
+        on_calendar = positions >= 0
+        prices = np.full((len(times), len(symbols)), np.nan)
+        for i, symbol in enumerate(symbols):
+            vector = self._price_vector(symbol)
+            if vector is None:
+                continue
+            [symbol_prices, _, df] = vector
+            prices[on_calendar, i] = symbol_prices[positions[on_calendar]]
+            if not on_calendar.all():
+                # Off the market calendar, fall back to the bars themselves
+                prices[~on_calendar, i] = df[self.trade_on].reindex(times[~on_calendar]).to_numpy(dtype=np.float64)
+        return prices[0] if current else prices
     
 def get_market_info():
+    import yfinance as yf
+
     fetcher = utils.DataFetcher(os.path.join(".", "data", "historical"), "1h", "2023-01-01", None)
     top_companies = yf.Sector("basic-materials").top_companies.index.to_list()
     # fetcher.bulk_download(top_companies)
@@ -104,5 +170,6 @@ def get_market_info():
     
     sorted_datetimes = list(total)
     sorted_datetimes.sort()
+    sorted_datetimes = [utils.fmt_datetime(d) for d in sorted_datetimes]
     df = pd.DataFrame(sorted_datetimes, columns=["market_datetimes"])
     df.to_csv(os.path.join(".", "market", "info.csv"))
@@ -0,0 +1,255 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+
+
+@dataclass
+class PairsBacktest:
+    """
+    Outcome of backtest_pairs over n bars.
+        entries / exits: bar indices at which positions were opened / closed
+        sides: +1 when the spread was sold (z > z_enter), -1 when it was bought (z < -z_enter)
+        positions: (n, 2) shares held of symbol1 and symbol2 after each bar
+        short_bank: (n, 2) short sale proceeds held for symbol1 and symbol2 after each bar
+        equity: (n,) buying power plus the value realized by exiting at that bar
+        record: [[time, buying_power], ...] as PairsStrategy.record would hold it
+    The remaining fields are the state PairsStrategy ends in.
+    """
+
+    entries: np.ndarray
+    exits: np.ndarray
+    sides: np.ndarray
+    positions: np.ndarray
+    short_bank: np.ndarray
+    equity: np.ndarray
+    record: list = field(default_factory=list)
+    buying_power: float = 0
+    final_short_bank: tuple = (0, 0)
+    final_positions: tuple = (0, 0)
+    has_position: bool = False
+    continue_trading: bool = True
+
+    @property
+    def stopped_out(self) -> bool:
+        return not self.continue_trading
+
+    def apply_to(self, strategy):
+        """
+        Leaves strategy (a fresh PairsStrategy) and its trader as if they had run the bars themselves
+        """
+        assert not strategy.has_position and len(strategy.record) == 0
+        strategy.buying_power = self.buying_power
+        strategy.short_bank[strategy.symbol1] = self.final_short_bank[0]
+        strategy.short_bank[strategy.symbol2] = self.final_short_bank[1]
+        strategy.has_position = self.has_position
+        strategy.continue_trading = self.continue_trading
+        strategy.record.extend(self.record)
+        if len(self.entries) > 0:
+            strategy.trader.positions[strategy.symbol1] = self.final_positions[0]
+            strategy.trader.positions[strategy.symbol2] = self.final_positions[1]
+
+
+def _leg_values(prices, position, short_bank):
+    """
+    Value released by closing a leg at prices, the same arithmetic as PairsStrategy._exit
+    """
+    cost = prices * abs(position)
+    if position < 0:
+        return 2 * short_bank - cost
+    return cost
+
+
+def backtest_pairs(
+    times: np.ndarray,
+    z_score: np.ndarray,
+    beta: np.ndarray,
+    price1: np.ndarray,
+    price2: np.ndarray,
+    buying_power=1000,
+    capital_per_trade=None,
+    z_enter=2,
+    z_exit=0.5,
+    max_dd_pct=100,
+    resume: PairsBacktest = None,
+) -> PairsBacktest:
+    """
+    Runs PairsStrategy over whole series at once, as PairsDriver does with strategy.update(z, -beta, 1)
+    on every bar. All inputs are aligned arrays of length n, prices are those the trader would fill at.
+    Entries and exits are located with array searches and a trade's stop-out check is evaluated over
+    its whole holding period in one pass, so only the (few) trades are visited in Python.
+    Results match the object path bar for bar, including the floating point arithmetic.
+    Pass the result of a previous run as resume to continue from the state it ended in
+    (buying power, open position, stop-out), the returned record then only holds the new entries.
+    """
+    z_score = np.asarray(z_score, dtype=np.float64)
+    beta = np.broadcast_to(np.asarray(beta, dtype=np.float64), z_score.shape)
+    price1 = np.asarray(price1, dtype=np.float64)
+    price2 = np.asarray(price2, dtype=np.float64)
+    n = len(z_score)
+    assert len(times) == n and len(price1) == n and len(price2) == n
+    if capital_per_trade is None:
+        capital_per_trade = buying_power
+
+    entry_bars = np.flatnonzero((z_score > z_enter) | (z_score < -z_enter))
+    exit_bars = np.flatnonzero(np.abs(z_score) < z_exit)
+
+    positions = np.zeros((n, 2))
+    short_bank = np.zeros((n, 2))
+    equity = np.full(n, np.nan)
+    entries, exits, sides, record = [], [], [], []
+    position = (0, 0)
+    bank = (0, 0)
+    has_position = False
+    continue_trading = True
+    if resume is not None:
+        buying_power = resume.buying_power
+        position = resume.final_positions
+        bank = resume.final_short_bank
+        has_position = resume.has_position
+        continue_trading = resume.continue_trading
+    if not continue_trading:
+        equity[:] = buying_power
+
+    t = 0
+    while t < n and continue_trading:
+        if has_position:
+            # Resumed with an open position
+            e = t - 1
+            entry_value = None
+        else:
+            # Next entry
+            k = np.searchsorted(entry_bars, t)
+            if k == len(entry_bars):
+                equity[t:] = buying_power
+                break
+            e = entry_bars[k]
+            equity[t:e] = buying_power
+            record.append([int(times[e]), buying_power])
+
+            side = 1 if z_score[e] > z_enter else -1
+            coeffs = (beta[e], -1) if side == 1 else (-beta[e], 1)
+            p1 = price1[e]
+            p2 = price2[e]
+            multiple = abs(coeffs[0]) * p1 + abs(coeffs[1]) * p2
+            num_multiples = capital_per_trade / multiple
+            position = (num_multiples * coeffs[0], num_multiples * coeffs[1])
+            cost1 = p1 * abs(position[0])
+            cost2 = p2 * abs(position[1])
+            buying_power -= cost1 + cost2
+            bank = (cost1 if position[0] < 0 else 0, cost2 if position[1] < 0 else 0)
+            has_position = True
+            entry_value = cost1 + cost2
+            entries.append(e)
+            sides.append(side)
+
+        # Holding period: from the bar after entry up to the next exit signal, which is checked
+        # before the stop-out on its bar
+        k = np.searchsorted(exit_bars, e + 1)
+        signalled = k < len(exit_bars)
+        last = exit_bars[k] if signalled else n - 1
+        held = slice(e + 1, last + 1)
+        realized = _leg_values(price1[held], position[0], bank[0]) + _leg_values(price2[held], position[1], bank[1])
+        pct_change = ((realized / capital_per_trade) - 1) * 100
+        if signalled:
+            pct_change = pct_change[:-1]
+        stop = np.flatnonzero((pct_change < 0) & (np.abs(pct_change) > max_dd_pct))
+
+        positions[max(e, 0) : last + 1] = position
+        short_bank[max(e, 0) : last + 1] = bank
+        if entry_value is not None:
+            equity[e] = buying_power + entry_value
+        equity[held] = buying_power + realized
+
+        if len(stop) > 0:
+            x = e + 1 + stop[0]
+            continue_trading = False
+        elif signalled:
+            x = last
+        else:
+            # Still holding at the end of the series
+            break
+
+        for leg, prices in enumerate([price1, price2]):
+            buying_power += _leg_values(prices[x], position[leg], bank[leg])
+        position = (0.0, 0.0)
+        bank = (0, 0)
+        has_position = False
+        positions[x:] = 0
+        short_bank[x:] = 0
+        equity[x] = buying_power
+        record.append([int(times[x]), buying_power])
+        exits.append(x)
+
+        if not continue_trading:
+            equity[x:] = buying_power
+            break
+        t = x + 1
+
+    return PairsBacktest(
+        entries=np.array(entries, dtype=np.int64),
+        exits=np.array(exits, dtype=np.int64),
+        sides=np.array(sides, dtype=np.int64),
+        positions=positions,
+        short_bank=short_bank,
+        equity=equity,
+        record=record,
+        buying_power=buying_power,
+        final_short_bank=bank,
+        final_positions=position,
+        has_position=has_position,
+        continue_trading=continue_trading,
+    )
+
+
+@dataclass
+class DSBacktest:
+    """
+    Outcome of backtest_ds for S symbols over T bars.
+        final_index: (S,) bar at which each symbol's position was sold
+        final_capital: (S,) buying power after selling, NaN where the run failed
+        positions / buying_power / equity: (S, T) shares held, cash and cash plus the position's value
+            after each bar, constant past final_index
+        errors: (S,) True where DSDriver would have stopped with an error (a missing price)
+    """
+
+    final_index: np.ndarray
+    final_capital: np.ndarray
+    positions: np.ndarray
+    buying_power: np.ndarray
+    equity: np.ndarray
+    errors: np.ndarray
+
+
+def backtest_ds(prices: np.ndarray, last: np.ndarray, buying_power=1000, update_interval=10, num_intervals=10) -> DSBacktest:
+    """
+    Runs DSStrategy for many symbols at once, as DSDriver does for each of them.
+    prices is (S, T) with the fill prices of every bar from the start on (NaN where a symbol has no bar),
+    last[s] is the index of the last bar of symbol s, runs stop there or at the last bar otherwise.
+    Every update_interval-th bar buys buying_power / num_intervals worth and the position is sold at the end.
+    The cash and position are accumulated in bar order so results match the object path exactly.
+    """
+    prices = np.atleast_2d(np.asarray(prices, dtype=np.float64))
+    [n_symbols, n_bars] = prices.shape
+    last = np.asarray(last)
+    final_index = np.where((last >= 0) & (last < n_bars), last, n_bars - 1)
+    capital_per_trade = buying_power / num_intervals
+
+    bars = np.arange(n_bars)
+    buys = (bars % update_interval == 0) & (bars < final_index[:, np.newaxis])
+    quantity = np.zeros(prices.shape)
+    np.divide(capital_per_trade, prices, out=quantity, where=buys)
+    cost = np.where(buys, prices * quantity, 0.0)
+    positions = np.cumsum(quantity, axis=1)
+    cash = np.subtract.accumulate(np.concatenate([np.full((n_symbols, 1), buying_power, dtype=np.float64), cost], axis=1), axis=1)[:, 1:]
+
+    rows = np.arange(n_symbols)
+    exit_prices = prices[rows, final_index]
+    final_capital = cash[rows, final_index] + exit_prices * positions[rows, final_index]
+    errors = (buys & np.isnan(prices)).any(axis=1) | np.isnan(exit_prices) | (final_index == 0)
+    final_capital[errors] = np.nan
+
+    after = bars > final_index[:, np.newaxis]
+    equity = np.where(after, final_capital[:, np.newaxis], cash + positions * prices)
+    positions[after] = 0
+    cash = np.where(after, final_capital[:, np.newaxis], cash)
+    return DSBacktest(final_index, final_capital, positions, cash, equity, errors)
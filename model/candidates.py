@@ -0,0 +1,76 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class CandidatePairs:
+    """
+    Pairs of series worth a cointegration test, from candidate_pairs.
+        pairs: (candidates, 2) column indices with i < j, in combinations order
+        clusters: cluster label of every series (all 0 without clustering)
+        total_pairs: number of pairs among all series
+    """
+
+    pairs: np.ndarray
+    clusters: np.ndarray
+    total_pairs: int
+
+    @property
+    def pruned(self) -> int:
+        return self.total_pairs - len(self.pairs)
+
+    def report(self) -> str:
+        return (
+            f"{len(self.pairs)}/{self.total_pairs} candidate pairs ({self.pruned} pruned) "
+            f"in {len(np.unique(self.clusters))} clusters"
+        )
+
+
+def return_correlations(prices: np.ndarray) -> np.ndarray:
+    """
+    Correlation matrix of the percent returns of the columns of prices (bars, series),
+    bars where any series has a NaN return are left out
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    returns = np.diff(prices, axis=0) / prices[:-1]
+    returns = returns[np.all(np.isfinite(returns), axis=1)]
+    assert len(returns) > 2
+    corr = np.corrcoef(returns, rowvar=False)
+    # A constant series has no correlation with anything
+    return np.nan_to_num(np.atleast_2d(corr), nan=0.0)
+
+
+def candidate_pairs(prices: np.ndarray, neighbours: int, cluster_distance: float = None) -> CandidatePairs:
+    """
+    Keeps, for every series (column of prices), its neighbours nearest series by correlation distance
+    1 - corr of returns, a pair is a candidate when either side picks the other.
+    With cluster_distance the series are first clustered (average linkage, clusters cut at cluster_distance)
+    and neighbours are only looked for inside a series' cluster.
+    Fewer neighbours prune more pairs at the cost of missing cointegrated pairs with loosely correlated returns.
+    """
+    assert neighbours > 0
+    n = np.asarray(prices).shape[1]
+    distance = 1 - return_correlations(prices)
+    np.fill_diagonal(distance, np.inf)
+
+    clusters = np.zeros(n, dtype=np.int64)
+    if cluster_distance is not None and n > 1:
+        from scipy.cluster.hierarchy import fcluster, linkage
+        from scipy.spatial.distance import squareform
+
+        condensed = squareform(np.where(np.isinf(distance), 0.0, np.clip(distance, 0.0, None)), checks=False)
+        clusters = fcluster(linkage(condensed, method="average"), t=cluster_distance, criterion="distance")
+        distance = np.where(clusters[:, np.newaxis] == clusters[np.newaxis, :], distance, np.inf)
+
+    k = min(neighbours, n - 1)
+    selected = np.zeros((n, n), dtype=bool)
+    if k > 0:
+        nearest = np.argpartition(distance, k - 1, axis=1)[:, :k]
+        rows = np.repeat(np.arange(n), k)
+        cols = nearest.ravel()
+        keep = np.isfinite(distance[rows, cols])
+        selected[rows[keep], cols[keep]] = True
+    selected |= selected.T
+    [i, j] = np.nonzero(np.triu(selected, k=1))
+    return CandidatePairs(pairs=np.stack([i, j], axis=1), clusters=clusters, total_pairs=n * (n - 1) // 2)
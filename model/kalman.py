@@ -0,0 +1,93 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+# Default state noise delta of KalmanHedge, small enough that the hedge ratio of price level pairs drifts slowly
+DEFAULT_DELTA = 1e-7
+
+
+@dataclass
+class KalmanOutput:
+    """
+    Per bar results of KalmanHedge.filter, every array has shape (bars, pairs).
+        alpha / beta: hedge estimates after seeing the bar
+        error: forecast error y - (alpha + beta * x) with the estimates from before the bar
+        variance: forecast error variance, error / sqrt(variance) is the spread's z-score
+    """
+
+    alpha: np.ndarray
+    beta: np.ndarray
+    error: np.ndarray
+    variance: np.ndarray
+
+    @property
+    def zscore(self) -> np.ndarray:
+        return self.error / np.sqrt(self.variance)
+
+
+class KalmanHedge(object):
+    """
+    Kalman filter tracking y_t = alpha_t + beta_t * x_t + v_t for many pairs at once, where
+    (alpha, beta) follow a random walk with covariance delta / (1 - delta) * I and v_t ~ N(0, observation_var).
+    State is kept in arrays over pairs, so each step costs a handful of vectorized operations
+    whatever the number of pairs. The 2x2 algebra is written out instead of calling np.linalg.
+    """
+
+    def __init__(self, n_pairs=1, delta=DEFAULT_DELTA, observation_var=1e-3, initial_var=1.0):
+        self.n_pairs = n_pairs
+        self.q = delta / (1 - delta)
+        self.r = observation_var
+        self.alpha = np.zeros(n_pairs)
+        self.beta = np.zeros(n_pairs)
+        # Covariance of (alpha, beta), symmetric so only three entries are stored
+        self.p00 = np.full(n_pairs, initial_var)
+        self.p01 = np.zeros(n_pairs)
+        self.p11 = np.full(n_pairs, initial_var)
+
+    def step(self, x, y):
+        """
+        Folds in one bar for every pair (x, y of shape (pairs,) or scalars for a single pair).
+        Returns the forecast error and its variance. Pairs with a NaN input keep their state.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        p00 = self.p00 + self.q
+        p01 = self.p01
+        p11 = self.p11 + self.q
+
+        ph0 = p00 + x * p01
+        ph1 = p01 + x * p11
+        variance = ph0 + x * ph1 + self.r
+        error = y - (self.alpha + self.beta * x)
+        k0 = ph0 / variance
+        k1 = ph1 / variance
+
+        valid = ~(np.isnan(x) | np.isnan(y))
+        self.alpha = np.where(valid, self.alpha + k0 * error, self.alpha)
+        self.beta = np.where(valid, self.beta + k1 * error, self.beta)
+        self.p00 = np.where(valid, p00 - k0 * ph0, self.p00)
+        self.p01 = np.where(valid, p01 - k0 * ph1, self.p01)
+        self.p11 = np.where(valid, p11 - k1 * ph1, self.p11)
+        return error, variance
+
+    def filter(self, x: np.ndarray, y: np.ndarray) -> KalmanOutput:
+        """
+        Runs the filter over whole histories, x and y of shape (bars, pairs) or (bars,) for one pair
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        squeeze = x.ndim == 1
+        if squeeze:
+            x = x[:, np.newaxis]
+            y = y[:, np.newaxis]
+        assert x.shape == y.shape and x.shape[1] == self.n_pairs
+
+        shape = x.shape
+        out = KalmanOutput(np.empty(shape), np.empty(shape), np.empty(shape), np.empty(shape))
+        for t in range(shape[0]):
+            out.error[t], out.variance[t] = self.step(x[t], y[t])
+            out.alpha[t] = self.alpha
+            out.beta[t] = self.beta
+        if squeeze:
+            out = KalmanOutput(out.alpha[:, 0], out.beta[:, 0], out.error[:, 0], out.variance[:, 0])
+        return out
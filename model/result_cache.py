@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+import numpy as np
+
+STAT_TEST_CACHE_FILE = os.path.join(".", "pipelines", "stat_tests.sqlite")
+
+
+class StatTestCache(object):
+    """
+    Disk-backed memo of statistical test results (statistics, p-values...) stored as JSON in sqlite.
+    Keys are hashes of the test name, its parameters and the content of the input series, so a result
+    is reused as long as the same test runs on the same data and computed again when any bar changes.
+    Series are hashed once with digest and the digests combined per test with key.
+    """
+
+    def __init__(self, path=STAT_TEST_CACHE_FILE):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(series: np.ndarray) -> str:
+        series = np.ascontiguousarray(series, dtype=np.float64)
+        h = hashlib.sha256(str(series.shape).encode())
+        h.update(series.tobytes())
+        return h.hexdigest()
+
+    @staticmethod
+    def key(test: str, params: dict, digests: list[str]) -> str:
+        h = hashlib.sha256(test.encode())
+        h.update(json.dumps(params, sort_keys=True).encode())
+        for d in digests:
+            h.update(d.encode())
+        return h.hexdigest()
+
+    def get(self, key: str):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: list[str]) -> dict:
+        """
+        Returns the cached values of those keys that are present
+        """
+        found = dict()
+        keys = list(keys)
+        # Stay under sqlite's limit on query parameters
+        for start in range(0, len(keys), 500):
+            chunk = keys[start : start + 500]
+            rows = self.connection.execute(
+                f"SELECT key, value FROM results WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            )
+            found.update((key, json.loads(value)) for key, value in rows)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, key: str, value):
+        self.put_many({key: value})
+
+    def put_many(self, items: dict):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)",
+            [(key, json.dumps(value)) for key, value in items.items()],
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
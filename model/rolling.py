@@ -0,0 +1,346 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+
+class RollingStats(object):
+    """
+    Mean and sample standard deviation (ddof=1) of the last window values pushed, in O(1) time and
+    O(window) memory per push. Values are kept in a ring buffer and the moments are updated with
+    Welford's algorithm (adding the new value and removing the one leaving the window), which stays
+    accurate where running sums of squares cancel. The moments are recomputed from the buffer once
+    per window to stop rounding errors from accumulating.
+    NaN values take a place in the window but are left out of the moments, like pandas' skipna.
+    complete tells whether the window is full and free of NaN (pandas' rolling with min_periods=window).
+    """
+
+    def __init__(self, window: int, values=None):
+        assert window > 1
+        self.window = window
+        self.buffer = np.zeros(window)
+        self.count = 0
+        self.head = 0
+        self.valid = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._since_refresh = 0
+        if values is not None:
+            for value in np.asarray(values, dtype=np.float64)[-window:]:
+                self.push(value)
+
+    def _add(self, value):
+        self.valid += 1
+        delta = value - self._mean
+        self._mean += delta / self.valid
+        self._m2 += delta * (value - self._mean)
+
+    def _remove(self, value):
+        self.valid -= 1
+        if self.valid == 0:
+            self._mean = 0.0
+            self._m2 = 0.0
+            return
+        delta = value - self._mean
+        self._mean -= delta / self.valid
+        self._m2 -= delta * (value - self._mean)
+
+    def push(self, value: float):
+        value = float(value)
+        if self.count < self.window:
+            self.buffer[self.count] = value
+            self.count += 1
+        else:
+            old = self.buffer[self.head]
+            self.buffer[self.head] = value
+            self.head = (self.head + 1) % self.window
+            if not np.isnan(old):
+                self._remove(old)
+        if not np.isnan(value):
+            self._add(value)
+
+        self._since_refresh += 1
+        if self._since_refresh >= self.window:
+            self._refresh()
+
+    def _refresh(self):
+        values = self.buffer[: self.count]
+        values = values[~np.isnan(values)]
+        if len(values) > 0:
+            self._mean = values.mean()
+            self._m2 = ((values - self._mean) ** 2).sum()
+        self._since_refresh = 0
+
+    @property
+    def complete(self) -> bool:
+        return self.valid == self.window
+
+    @property
+    def mean(self) -> float:
+        if self.valid == 0:
+            return np.nan
+        return self._mean
+
+    @property
+    def std(self) -> float:
+        if self.valid < 2:
+            return np.nan
+        return np.sqrt(max(self._m2, 0.0) / (self.valid - 1))
+
+    def zscore(self, value: float) -> float:
+        """
+        Returns the z-score of value against the current window
+        """
+        return (value - self.mean) / self.std
+
+
+class RollingRegression(object):
+    """
+    Ordinary least squares y = alpha + beta * x over the last window (x, y) pairs, updated in O(1) per push
+    from windowed co-moments (means, Sxx, Sxy) with Welford add / remove steps.
+    With forgetting (0 < forgetting < 1) there is no window, instead every older observation is
+    down-weighted by forgetting per push (exponentially weighted least squares), non-finite
+    observations are skipped.
+    alpha and beta are NaN until a full window (or, with forgetting, two observations) has been seen.
+    """
+
+    def __init__(self, window: int, forgetting: float = None, x=None, y=None):
+        assert window > 1
+        assert forgetting is None or 0 < forgetting < 1
+        self.window = window
+        self.forgetting = forgetting
+        self.buffer = np.zeros((window, 2))
+        self.count = 0
+        self.head = 0
+        self.weight = 0.0
+        self._mean_x = 0.0
+        self._mean_y = 0.0
+        self._sxx = 0.0
+        self._sxy = 0.0
+        self._since_refresh = 0
+        if x is not None:
+            x = np.asarray(x, dtype=np.float64)
+            y = np.asarray(y, dtype=np.float64)
+            start = 0 if forgetting is not None else max(len(x) - window, 0)
+            for i in range(start, len(x)):
+                self.push(x[i], y[i])
+
+    def _add(self, x, y, weight=1.0):
+        self.weight += weight
+        dx = x - self._mean_x
+        self._mean_x += weight * dx / self.weight
+        self._mean_y += weight * (y - self._mean_y) / self.weight
+        self._sxx += weight * dx * (x - self._mean_x)
+        self._sxy += weight * dx * (y - self._mean_y)
+
+    def _remove(self, x, y):
+        self.weight -= 1
+        dx = x - self._mean_x
+        self._mean_x -= dx / self.weight
+        self._mean_y -= (y - self._mean_y) / self.weight
+        self._sxx -= dx * (x - self._mean_x)
+        self._sxy -= dx * (y - self._mean_y)
+
+    def push(self, x: float, y: float):
+        x = float(x)
+        y = float(y)
+        if self.forgetting is not None:
+            # Nothing ever leaves the weighted sums, so a NaN bar would poison them for good
+            if not (np.isfinite(x) and np.isfinite(y)):
+                return
+            self.weight *= self.forgetting
+            self._sxx *= self.forgetting
+            self._sxy *= self.forgetting
+            self._add(x, y)
+            self.count += 1
+            return
+
+        if self.count < self.window:
+            self.buffer[self.count] = [x, y]
+            self.count += 1
+        else:
+            [old_x, old_y] = self.buffer[self.head]
+            self.buffer[self.head] = [x, y]
+            self.head = (self.head + 1) % self.window
+            self._remove(old_x, old_y)
+        self._add(x, y)
+
+        self._since_refresh += 1
+        if self._since_refresh >= self.window:
+            self._refresh()
+
+    def _refresh(self):
+        [x, y] = self.buffer[: self.count].T
+        self._mean_x = x.mean()
+        self._mean_y = y.mean()
+        self._sxx = ((x - self._mean_x) ** 2).sum()
+        self._sxy = ((x - self._mean_x) * (y - self._mean_y)).sum()
+        self._since_refresh = 0
+
+    @property
+    def ready(self) -> bool:
+        if self.forgetting is not None:
+            return self.count >= 2
+        return self.count == self.window
+
+    @property
+    def beta(self) -> float:
+        if not self.ready:
+            return np.nan
+        return self._sxy / self._sxx
+
+    @property
+    def alpha(self) -> float:
+        if not self.ready:
+            return np.nan
+        return self._mean_y - self.beta * self._mean_x
+
+
+@dataclass
+class RollingCointegrationResult:
+    """
+    Engle-Granger tests of the windows ending (inclusive) at positions ends, arrays of shape (windows,)
+    """
+
+    ends: np.ndarray
+    t_stat: np.ndarray
+    p_value: np.ndarray
+    cointegrated: np.ndarray
+
+
+class RollingCointegration(object):
+    """
+    Engle-Granger tests of y0 against y1 (like statsmodels' coint(y0, y1)) over sliding windows of window bars,
+    one every stride bars.
+    Both the hedge regression and the ADF regression on its residuals only need sums of products of a few
+    base series (1, y0_{t-1}, y1_{t-1}, Δy0_{t-k}, Δy1_{t-k}) over the window's rows: with prefix sums of
+    their outer products, the Gram matrix of any window is the difference of two prefix sums, and the
+    regressions of every window come from small batched solves instead of refitting each window.
+    Windows are processed in chunks of chunk_size on a thread pool of max_workers threads.
+    lags / autolag are as in coint's maxlag / autolag, lags=None is coint's default maximum lag.
+    The normal equations are less accurate than coint's QR, expect differences around 1e-8.
+    """
+
+    def __init__(self, window: int, stride: int = 1, lags: int = None, autolag: str = "aic", cutoff: float = 0.05, max_workers: int = None, chunk_size: int = 256):
+        assert window > 4 and stride > 0
+        assert autolag is None or autolag.lower() == "aic"
+        if lags is None:
+            lags = min(window // 2 - 1, int(np.ceil(12.0 * np.power(window / 100.0, 1 / 4.0))))
+        assert 0 <= lags and window > lags + 3
+        self.window = window
+        self.stride = stride
+        self.lags = lags
+        self.autolag = autolag
+        self.cutoff = cutoff
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+
+    def run(self, y0, y1, ends=None) -> RollingCointegrationResult:
+        """
+        Tests the windows ending at ends (positions in y0 / y1), every stride bars from the first full window by default
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        from model.statistics import mackinnon_pvalues
+
+        y0 = np.asarray(y0, dtype=np.float64)
+        y1 = np.asarray(y1, dtype=np.float64)
+        assert y0.shape == y1.shape and len(y0.shape) == 1
+        if ends is None:
+            ends = np.arange(self.window - 1, len(y0), self.stride)
+        ends = np.asarray(ends, dtype=np.int64)
+        assert len(ends) == 0 or (ends.min() >= self.window - 1 and ends.max() < len(y0))
+        # Shifting the series changes neither test, centering keeps the sums of products small
+        y0 = y0 - y0.mean() if len(y0) > 0 else y0
+        y1 = y1 - y1.mean() if len(y1) > 0 else y1
+
+        t_stat = np.empty(len(ends))
+        # Bound the rows a chunk spans as well, their prefix sums take rows * (2 * lags + 5)^2 floats
+        chunk_size = max(1, min(self.chunk_size, 2048 // self.stride))
+        chunks = [slice(i, i + chunk_size) for i in range(0, len(ends), chunk_size)]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for chunk, chunk_t_stat in zip(chunks, executor.map(lambda c: self._t_stats(y0, y1, ends[c]), chunks)):
+                t_stat[chunk] = chunk_t_stat
+        p_value = mackinnon_pvalues(t_stat, regression="c", N=2)
+        return RollingCointegrationResult(ends=ends, t_stat=t_stat, p_value=p_value, cointegrated=p_value < self.cutoff)
+
+    def _t_stats(self, y0: np.ndarray, y1: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        lags = self.lags
+        first = int(ends.min()) - self.window + 1
+        y0 = y0[first : ends.max() + 1]
+        y1 = y1[first : ends.max() + 1]
+        starts = ends - first - self.window + 1
+        stops = ends - first + 1
+
+        # Hedge regressions y0 = alpha + beta * y1 over every window
+        levels = np.stack([y0, y1, y0 * y0, y0 * y1, y1 * y1], axis=1)
+        prefix = np.concatenate([np.zeros((1, 5)), np.cumsum(levels, axis=0)])
+        [s0, s1, s00, s01, s11] = (prefix[stops] - prefix[starts]).T / self.window
+        var1 = s11 - s1 * s1
+        cov01 = s01 - s0 * s1
+        beta = cov01 / var1
+        alpha = s0 - beta * s1
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r_squared = cov01 * cov01 / ((s00 - s0 * s0) * var1)
+
+        # Row t holds 1, y0_{t-1}, y1_{t-1}, Δy0_t, Δy1_t, Δy0_{t-1}, Δy1_{t-1}, ..., zero where t - k < 1
+        diff = np.diff(np.stack([y0, y1], axis=1), axis=0)
+        base = [np.ones(len(diff)), y0[:-1], y1[:-1]]
+        for k in range(0, lags + 1):
+            lagged = np.zeros((len(diff), 2))
+            lagged[k:] = diff[: len(diff) - k]
+            base += [lagged[:, 0], lagged[:, 1]]
+        base = np.stack(base, axis=1)
+        m = base.shape[1]
+        # grams[r] = sum of outer products of rows before r, row r of base is bar r + 1
+        grams = np.concatenate([np.zeros((1, m, m)), np.cumsum(np.einsum("ri,rj->rij", base, base), axis=0)])
+
+        # Coefficients of the ADF regressors on the base: e_{t-1} and Δe_{t-k} = Δy0_{t-k} - beta * Δy1_{t-k}
+        n = len(ends)
+        A = np.zeros((n, m, lags + 2))
+        A[:, 0, 0] = -alpha
+        A[:, 1, 0] = 1
+        A[:, 2, 0] = -beta
+        for k in range(0, lags + 1):
+            A[:, 3 + 2 * k, k + 1] = 1
+            A[:, 4 + 2 * k, k + 1] = -beta
+
+        def moments(lag_first):
+            # Moments of [e_{t-1}, Δe_t, Δe_{t-1}, ...] over the rows t from start + lag_first + 1 to the window's end
+            gram = grams[stops - 1] - grams[starts + lag_first]
+            return A.transpose(0, 2, 1) @ gram @ A
+
+        if self.autolag is None:
+            chosen = np.full(n, lags)
+        else:
+            # AIC of every lag on the sample of the largest one
+            common = moments(lags)
+            nobs = self.window - lags - 1
+            aic = np.empty((n, lags + 1))
+            for lag in range(lags + 1):
+                aic[:, lag] = nobs * (np.log(2 * np.pi) + np.log(self._ssr(common, lag) / nobs) + 1) + 2 * (lag + 1)
+            chosen = np.argmin(aic, axis=1)
+
+        t_stat = np.empty(n)
+        for lag in np.unique(chosen):
+            windows = chosen == lag
+            moment = moments(int(lag))[windows]
+            ssr = self._ssr(moment, lag)
+            xx = self._design(moment, lag)
+            xy = moment[:, [0] + list(range(2, lag + 2)), 1]
+            nobs = self.window - lag - 1
+            sigma2 = ssr / (nobs - lag - 1)
+            xx_inv = np.linalg.inv(xx)
+            t_stat[windows] = np.linalg.solve(xx, xy[..., np.newaxis])[:, 0, 0] / np.sqrt(sigma2 * xx_inv[:, 0, 0])
+        # As coint does, (almost) perfectly collinear windows are taken as cointegrated
+        return np.where(r_squared >= 1 - 100 * np.sqrt(np.finfo(np.float64).eps), -np.inf, t_stat)
+
+    @staticmethod
+    def _design(moment: np.ndarray, lag: int) -> np.ndarray:
+        columns = [0] + list(range(2, lag + 2))
+        return moment[:, columns][:, :, columns]
+
+    @classmethod
+    def _ssr(cls, moment: np.ndarray, lag: int) -> np.ndarray:
+        xy = moment[:, [0] + list(range(2, lag + 2)), 1]
+        coef = np.linalg.solve(cls._design(moment, lag), xy[..., np.newaxis])[..., 0]
+        return moment[:, 1, 1] - np.sum(coef * xy, axis=1)
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+
+class IndexedSeries(object):
+    """
+    Append-only series of float values keyed by int64 unix seconds.
+    Values live in preallocated arrays that double in size when full (amortized O(1) appends),
+    and a timestamp -> position dict makes lookups O(1). As with a boolean mask lookup on a
+    DataFrame, a timestamp appended more than once resolves to its first entry.
+    """
+
+    def __init__(self, times=None, values=None, capacity=256):
+        times = np.empty(0, dtype=np.int64) if times is None else np.asarray(times, dtype=np.int64)
+        values = np.empty(0) if values is None else np.asarray(values, dtype=np.float64)
+        assert len(times) == len(values)
+        self._times = np.empty(max(capacity, len(times)), dtype=np.int64)
+        self._values = np.empty(max(capacity, len(times)), dtype=np.float64)
+        self._positions = dict()
+        self._sorted = True
+        self._length = 0
+        self.extend(times, values)
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def times(self) -> np.ndarray:
+        return self._times[: self._length]
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._values[: self._length]
+
+    def _reserve(self, size):
+        if size <= len(self._times):
+            return
+        capacity = max(size, 2 * len(self._times))
+        for name in ["_times", "_values"]:
+            grown = np.empty(capacity, dtype=getattr(self, name).dtype)
+            grown[: self._length] = getattr(self, name)[: self._length]
+            setattr(self, name, grown)
+
+    def append(self, timestamp, value):
+        self._reserve(self._length + 1)
+        timestamp = int(timestamp)
+        if self._length > 0 and timestamp < self._times[self._length - 1]:
+            self._sorted = False
+        self._times[self._length] = timestamp
+        self._values[self._length] = value
+        self._positions.setdefault(timestamp, self._length)
+        self._length += 1
+
+    def extend(self, times, values):
+        times = np.asarray(times, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        start = self._length
+        self._reserve(start + len(times))
+        self._times[start : start + len(times)] = times
+        self._values[start : start + len(times)] = values
+        self._length += len(times)
+        self._sorted = self._sorted and bool(np.all(np.diff(self._times[max(start - 1, 0) : self._length]) >= 0))
+        for offset, timestamp in enumerate(times.tolist()):
+            self._positions.setdefault(timestamp, start + offset)
+
+    def position(self, timestamp) -> int:
+        """
+        Returns the position of the first entry at timestamp, or -1
+        """
+        return self._positions.get(int(timestamp), -1)
+
+    def get(self, timestamp, default=np.nan):
+        ind = self._positions.get(int(timestamp), -1)
+        if ind < 0:
+            return default
+        return self._values[ind]
+
+    def asof(self, timestamp, default=np.nan):
+        """
+        Returns the value of the latest entry at or before timestamp, or default if there is none
+        """
+        timestamp = int(timestamp)
+        times = self.times
+        if self._sorted:
+            ind = int(np.searchsorted(times, timestamp, side="right")) - 1
+            if ind < 0:
+                return default
+            latest = int(times[ind])
+        else:
+            before = times[times <= timestamp]
+            if len(before) == 0:
+                return default
+            latest = int(before.max())
+        return self._values[self._positions[latest]]
+
+    def lookup(self, times) -> np.ndarray:
+        """
+        Returns the values at many times at once, NaN where there is no entry
+        """
+        times = np.asarray(times, dtype=np.int64)
+        if self._length == 0:
+            return np.full(len(times), np.nan)
+        if self._sorted:
+            inds = np.minimum(np.searchsorted(self.times, times), self._length - 1)
+        else:
+            inds = np.array([self._positions.get(t, 0) for t in times.tolist()], dtype=np.int64)
+        return np.where(self._times[inds] == times, self._values[inds], np.nan)
+
+    def to_frame(self, value_column, time_column="Datetime") -> pd.DataFrame:
+        return pd.DataFrame({time_column: self.times.copy(), value_column: self.values.copy()})
@@ -1,9 +1,22 @@
+import functools
+from dataclasses import dataclass
+
 import numpy as np
 import pandas as pd
 import os
 from loguru import logger as log
 
-ADF_CRIT_VALUES = pd.read_csv(os.path.join(".", "algo_model", "tables", "ADF_CRIT_VALUES.csv"), index_col="var")
+ADF_CRIT_VALUES_FILE = os.path.join(".", "model", "tables", "ADF_CRIT_VALUES.csv")
+MACKINNON_P_VALUES_FILE = os.path.join(".", "model", "tables", "MACKINNON_P_VALUES.csv")
+MACKINNON_CRIT_VALUES_FILE = os.path.join(".", "model", "tables", "MACKINNON_CRIT_VALUES.csv")
+
+
+@functools.cache
+def adf_crit_values() -> pd.DataFrame:
+    """
+    Response surface coefficients of the ADF critical values, read on first use
+    """
+    return pd.read_csv(ADF_CRIT_VALUES_FILE, index_col="var")
 
 def adf_crit_value(p: float, N: int, model: str):
     """
@@ -16,7 +29,7 @@ def adf_crit_value(p: float, N: int, model: str):
     allowed_p_vals = [0.01, 0.025, 0.05, 0.1]
     assert p in allowed_p_vals
     col_name = f"{model}: {p}"
-    [t, u, v, w] = ADF_CRIT_VALUES[col_name]
+    [t, u, v, w] = adf_crit_values()[col_name]
     crit = t + u/N + v/(N**2) + w/(N**3)
     return crit
 
@@ -27,31 +40,249 @@ def dickey_fuller(ts: np.ndarray):
     # Process: Subtract previous timestep
     #       y_t - y_{t-1} = β_1 + (Φ_1 - 1) * y_{t-1} + ε_t
     #       Δy_t = β_1 + δ * y_{t-1} + ε_t
-    if len(ts.shape) == 1:
-        ts = ts[:, np.newaxis]
-    assert len(ts.shape) == 2 and ts.shape[1] == 1
-    y_prev = ts[0:-1]
-    y_curr = ts[1:]
-    delta_y = y_curr - y_prev
-    N = delta_y.shape[0]
-    assert N > 1
     # Note that the null & alternative hypotheses can be rewritten as
     #       H_0: δ = 0
     #       H_1: δ < 0
     # Where, when H_0 is assumed the equation simplifies to Δy_t = β_1 + ε_t
-    # Now evaluate the t-statistic of δ by OLS
-    #       OLS of the form y = mx + b where Δy -> y, y_{t-1} -> x
-    #       Keep it in matrix form: β = (X'X)^-1 X'y, where β = [[b], [m]]
-    #       Note 'hat' means the variable is an estimator
-    X = np.array([np.ones(N), y_prev[:,0]], dtype=np.float64).T
-    X2_inv = np.linalg.inv(X.T @ X)
-    beta_hat = X2_inv @ X.T @ delta_y
-    y_hat = X @ beta_hat
-    sample_var = np.sum(np.square(y_hat - delta_y)) / (N-2)
-    var_beta_hat = np.diag(sample_var * X2_inv)[:, np.newaxis]
-    std_err_beta_hat = np.sqrt(var_beta_hat)
-
-    t_statistic = beta_hat[1,0]/std_err_beta_hat[1,0]
-    
+    # Now evaluate the t-statistic of δ by OLS, which is adf_batch's M1 model without lags
+    ts = np.asarray(ts, dtype=np.float64)
+    if len(ts.shape) == 2:
+        assert ts.shape[1] == 1
+        ts = ts[:, 0]
+    assert len(ts.shape) == 1 and len(ts) > 2
+    t_statistic = adf_batch(ts, lags=0, model="M1").t_stat[0]
+
     log.info(f"Calculated t-statistic of {t_statistic}")
     return t_statistic
+
+
+# MacKinnon's names of the regressions of the M0, M1 and M2 models
+ADF_MODELS = {"M0": "n", "M1": "c", "M2": "ct"}
+
+
+@dataclass
+class AdfBatchResult:
+    """
+    Per series results of adf_batch, arrays of shape (series,)
+        t_stat: t-statistic of δ, NaN when a series has too few observations or a singular regression
+        p_value: MacKinnon's approximate p-value of t_stat
+        nobs: number of observations in the regression
+        lags: number of lagged differences in the regression
+    """
+
+    t_stat: np.ndarray
+    p_value: np.ndarray
+    nobs: np.ndarray
+    lags: np.ndarray
+    model: str
+
+    def crit_values(self, p: float) -> np.ndarray:
+        """
+        Finite sample critical values at level p (0.01, 0.025, 0.05 or 0.1) from ADF_CRIT_VALUES.csv
+        """
+        return adf_crit_value(p, self.nobs.astype(np.float64), self.model)
+
+    def is_stationary(self, p: float = 0.05) -> np.ndarray:
+        return self.t_stat < self.crit_values(p)
+
+
+def _adf_design(series: np.ndarray, lags: int, model: str):
+    """
+    Returns the regressors (series, rows, k), ordered [constant, trend, y_{t-1}, Δy_{t-1}, ..., Δy_{t-lags}]
+    so that dropping the last columns drops the highest lags, and the targets Δy_t (series, rows)
+    """
+    [n, bars] = series.shape
+    diff = np.diff(series, axis=1)
+    target = diff[:, lags:]
+    rows = target.shape[1]
+    columns = []
+    if model in ["M1", "M2"]:
+        columns.append(np.ones((n, rows)))
+    if model == "M2":
+        columns.append(np.broadcast_to(np.arange(rows, dtype=np.float64), (n, rows)))
+    columns.append(series[:, lags:-1])
+    columns += [diff[:, lags - k : bars - 1 - k] for k in range(1, lags + 1)]
+    return np.stack(columns, axis=2), target
+
+
+def adf_batch(series: np.ndarray, lags: int = 0, model: str = "M1", autolag: str = None) -> AdfBatchResult:
+    """
+    Augmented Dickey-Fuller tests of every row of series (series, bars) at once, by OLS of
+        Δy_t = [β_1] + [β_2 * t] + δ * y_{t-1} + γ_1 * Δy_{t-1} + ... + γ_lags * Δy_{t-lags} + ε_t
+    with the constant for M1 and M2 and the trend for M2.
+    Rows may be ragged or have gaps: observations with a NaN anywhere in their regression are left out.
+    The regressions are solved together with a batched QR decomposition of the (series, nobs, k) design.
+    With fixed lags the results match statsmodels' adfuller(y, maxlag=lags, autolag=None).
+    With autolag="AIC" each row gets the number of lags up to lags (None for adfuller's default of
+    12 * (nobs / 100)^(1/4)) with the lowest AIC, like adfuller(y, maxlag=lags, autolag="AIC").
+    Rows then have to be contiguous, only leading and trailing NaN are allowed.
+    """
+    assert model in ADF_MODELS
+    series = np.asarray(series, dtype=np.float64)
+    if len(series.shape) == 1:
+        series = series[np.newaxis, :]
+    assert len(series.shape) == 2
+    if autolag is not None:
+        assert autolag.lower() == "aic"
+        return _adf_autolag(series, lags, model)
+    assert lags >= 0 and series.shape[1] > lags + 2
+
+    X, target = _adf_design(series, lags, model)
+    # Zeroed observations drop out of the least squares problem
+    valid = np.isfinite(target) & np.all(np.isfinite(X), axis=2)
+    X = np.where(valid[:, :, np.newaxis], X, 0.0)
+    y = np.where(valid, target, 0.0)
+    nobs = valid.sum(axis=1)
+    k = X.shape[2]
+    level = {"M0": 0, "M1": 1, "M2": 2}[model]
+
+    t_stat = np.full(len(series), np.nan)
+    fit = np.flatnonzero(nobs > k)
+    if len(fit) > 0:
+        q, r = np.linalg.qr(X[fit])
+        diag = np.abs(np.diagonal(r, axis1=1, axis2=2))
+        singular = np.any(diag <= 1e-12 * np.max(diag, axis=1, keepdims=True), axis=1)
+        r[singular] = np.eye(k)
+        coef = np.linalg.solve(r, np.einsum("snk,sn->sk", q, y[fit])[:, :, np.newaxis])[:, :, 0]
+        resid = y[fit] - np.einsum("snk,sk->sn", X[fit], coef)
+        sigma2 = np.sum(resid**2, axis=1) / (nobs[fit] - k)
+        # (X'X)^-1 = R^-1 R^-T, so var(δ) = sigma2 * |row of δ in R^-1|^2
+        r_inv = np.linalg.inv(r)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_fit = coef[:, level] / np.sqrt(sigma2 * np.sum(r_inv[:, level, :] ** 2, axis=1))
+        t_stat[fit] = np.where(singular, np.nan, t_fit)
+
+    p_value = mackinnon_pvalues(t_stat, regression=ADF_MODELS[model], N=1)
+    return AdfBatchResult(t_stat=t_stat, p_value=p_value, nobs=nobs, lags=np.full(len(series), lags), model=model)
+
+
+def _adf_autolag(series: np.ndarray, maxlag: int, model: str) -> AdfBatchResult:
+    n = len(series)
+    finite = np.isfinite(series)
+    lengths = finite.sum(axis=1)
+    starts = np.argmax(finite, axis=1)
+    t_stat = np.full(n, np.nan)
+    nobs = np.zeros(n, dtype=np.int64)
+    lags = np.zeros(n, dtype=np.int64)
+    deterministic = {"M0": 0, "M1": 1, "M2": 2}[model]
+
+    # Rows of one length share the lag search sample
+    for length in np.unique(lengths):
+        rows = np.flatnonzero(lengths == length)
+        compact = np.stack([series[i, starts[i] : starts[i] + length] for i in rows])
+        assert np.all(np.isfinite(compact)), "autolag needs rows without gaps"
+        group_maxlag = maxlag
+        if group_maxlag is None:
+            group_maxlag = min(length // 2 - deterministic - 1, int(np.ceil(12.0 * np.power(length / 100.0, 1 / 4.0))))
+        if group_maxlag < 0 or length <= group_maxlag + deterministic + 2:
+            continue
+
+        # Every lag is fitted on the sample of the largest one. The regressors are nested, so one QR
+        # gives them all: the sum of squared residuals without the columns from j on grows by (Q'y)_j^2
+        X, y = _adf_design(compact, group_maxlag, model)
+        q, r = np.linalg.qr(X)
+        qty = np.einsum("snk,sn->sk", q, y)
+        ssr_full = np.sum((y - np.einsum("snk,sk->sn", q, qty)) ** 2, axis=1)
+        dropped = np.cumsum(qty[:, ::-1] ** 2, axis=1)[:, ::-1]
+        dropped = np.concatenate([dropped, np.zeros((len(rows), 1))], axis=1)
+        k = deterministic + 1 + np.arange(group_maxlag + 1)
+        ssr = ssr_full[:, np.newaxis] + dropped[:, k]
+        m = y.shape[1]
+        with np.errstate(divide="ignore"):
+            aic = m * (np.log(2 * np.pi) + np.log(ssr / m) + 1) + 2 * k
+        best = np.argmin(aic, axis=1)
+
+        for lag in np.unique(best):
+            chosen = best == lag
+            result = adf_batch(compact[chosen], lags=int(lag), model=model)
+            t_stat[rows[chosen]] = result.t_stat
+            nobs[rows[chosen]] = result.nobs
+            lags[rows[chosen]] = lag
+
+    p_value = mackinnon_pvalues(t_stat, regression=ADF_MODELS[model], N=1)
+    return AdfBatchResult(t_stat=t_stat, p_value=p_value, nobs=nobs, lags=lags, model=model)
+
+
+@functools.cache
+def mackinnon_p_coefficients() -> pd.DataFrame:
+    """
+    MacKinnon (1994) p-value approximation coefficients per regression and number of series N, read on first use
+    """
+    return pd.read_csv(MACKINNON_P_VALUES_FILE, index_col=["regression", "N"]).sort_index()
+
+
+@functools.cache
+def mackinnon_crit_coefficients() -> pd.DataFrame:
+    """
+    MacKinnon (2010) critical value response surface coefficients per regression, N and level, read on first use
+    """
+    return pd.read_csv(MACKINNON_CRIT_VALUES_FILE, index_col=["regression", "N", "level"]).sort_index()
+
+
+def mackinnon_pvalues(stats: np.ndarray, regression: str = "c", N: int = 1) -> np.ndarray:
+    """
+    MacKinnon (1994) approximate p-values of (augmented) Dickey-Fuller t-statistics, vectorized
+    over stats. Matches statsmodels' mackinnonp, N is the number of I(1) series (2 for a pair).
+    """
+    from scipy.special import ndtr
+
+    row = mackinnon_p_coefficients().loc[(regression, N)]
+    stats = np.asarray(stats, dtype=np.float64)
+    small = np.polyval(row[["small_2", "small_1", "small_0"]].to_numpy(dtype=np.float64), stats)
+    large = np.polyval(row[["large_3", "large_2", "large_1", "large_0"]].to_numpy(dtype=np.float64), stats)
+    pvalues = ndtr(np.where(stats <= row["star"], small, large))
+    pvalues = np.where(stats > row["max"], 1.0, pvalues)
+    return np.where(stats < row["min"], 0.0, pvalues)
+
+
+def mackinnon_crit_values(N: int = 1, regression: str = "c", nobs: float = np.inf) -> np.ndarray:
+    """
+    Critical values at the 1%, 5% and 10% levels for N series and nobs observations, like statsmodels' mackinnoncrit
+    """
+    coefficients = mackinnon_crit_coefficients().loc[(regression, N)].to_numpy(dtype=np.float64)
+    if np.isinf(nobs):
+        return coefficients[:, 0]
+    return np.polyval(coefficients[:, ::-1].T, 1.0 / nobs)
+
+
+def engle_granger_screen(Y: np.ndarray, pairs: np.ndarray, lags: int = 1, chunk_size: int = 512, autolag: str = None):
+    """
+    Engle-Granger tests of many pairs of columns of Y (bars, series) at once.
+    For each pair (i, j) column i is regressed on a constant and column j, and the residuals get an
+    ADF regression without constant, like statsmodels' coint(Y[:, i], Y[:, j], maxlag=lags, autolag=autolag):
+    with a fixed number of lags by default, or with autolag="AIC" the best number up to lags (None for the default).
+    The hedge ratios come from one Gram matrix of Y and the ADF regressions of a chunk of pairs
+    are solved together by adf_batch. Returns the t-statistics and p-values, shape (pairs,).
+    """
+    Y = np.asarray(Y, dtype=np.float64)
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    bars = Y.shape[0]
+    assert autolag is not None or bars > lags + 2
+    Yc = Y - Y.mean(axis=0)
+    gram = Yc.T @ Yc
+    betas = gram[pairs[:, 0], pairs[:, 1]] / gram[pairs[:, 1], pairs[:, 1]]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r_squared = gram[pairs[:, 0], pairs[:, 1]] ** 2 / (gram[pairs[:, 0], pairs[:, 0]] * gram[pairs[:, 1], pairs[:, 1]])
+
+    t_stats = np.empty(len(pairs))
+    for start in range(0, len(pairs), chunk_size):
+        chunk = pairs[start : start + chunk_size]
+        # Residuals of the hedge regressions, (pairs, bars)
+        resid = Yc[:, chunk[:, 0]].T - betas[start : start + chunk_size, np.newaxis] * Yc[:, chunk[:, 1]].T
+        t_stats[start : start + chunk_size] = adf_batch(resid, lags=lags, model="M0", autolag=autolag).t_stat
+    # As coint does, (almost) perfectly collinear series are taken as cointegrated
+    t_stats = np.where(r_squared >= 1 - 100 * np.sqrt(np.finfo(np.float64).eps), -np.inf, t_stats)
+    return t_stats, mackinnon_pvalues(t_stats, regression="c", N=2)
+
+
+def engle_granger(y0: np.ndarray, y1: np.ndarray, trend="c", method="aeg", maxlag=None, autolag="aic"):
+    """
+    Augmented Engle-Granger test of y0 against y1, a drop-in for statsmodels' coint with a constant
+    in the cointegrating regression: returns the t-statistic, its p-value and the 1%, 5%, 10% critical values
+    """
+    assert trend == "c" and method == "aeg"
+    Y = np.stack([np.asarray(y0, dtype=np.float64), np.asarray(y1, dtype=np.float64)], axis=1)
+    if autolag is None:
+        maxlag = min(len(Y) // 2 - 1, int(np.ceil(12.0 * np.power(len(Y) / 100.0, 1 / 4.0)))) if maxlag is None else maxlag
+    t_stats, p_values = engle_granger_screen(Y, [(0, 1)], lags=maxlag, autolag=autolag)
+    return t_stats[0], p_values[0], mackinnon_crit_values(N=2, regression="c", nobs=len(Y) - 1)
@@ -3,26 +3,23 @@ import numpy as np
 import sys
 import os
 from loguru import logger
-import statsmodels.api as sm
-from statsmodels.regression.rolling import RollingOLS
-from statsmodels.tsa.stattools import adfuller, coint
-import matplotlib.pyplot as plt
-from datetime import datetime
-from data.utils import to_np
+from data.utils import fmt_datetime, to_np, to_unix
+from model.rolling import RollingRegression, RollingStats
+from model.series import IndexedSeries
+from model.kalman import DEFAULT_DELTA, KalmanHedge
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning) 
 
 class PairsTraderStatic(object):
-    def __init__(self, df_series_x: pd.DataFrame, df_series_y: pd.DataFrame):
+    def __init__(self, df_series_x: pd.DataFrame, df_series_y: pd.DataFrame, window_size=210):
         self.key = "Open"
-        self.window_size = 210
+        self.window_size = window_size
         self.df_x = pd.DataFrame()
         self.df_y = pd.DataFrame()
         self.series_x = pd.Series()
         self.series_y = pd.Series()
         self.spread = pd.Series()
-        self.rolling_zscore = pd.DataFrame()
-        self.rolling_beta = pd.DataFrame()
+        self.zscores = IndexedSeries()
         self.alpha = 0
         self.beta = 0
 
@@ -31,6 +28,8 @@ class PairsTraderStatic(object):
         logger.info("Successfully initialized PairsTraderStatic object.")
 
     def _run_initialization(self, df_series_x: pd.DataFrame, df_series_y: pd.DataFrame):
+        import statsmodels.api as sm
+
         self.df_y = df_series_y
         self.df_x = df_series_x
         self.series_x = self.df_x[self.key]
@@ -43,76 +42,171 @@ class PairsTraderStatic(object):
         #results_ols.params is a pd.Series
         self.beta = results_ols.params.iloc[1]
         self.alpha = results_ols.params.iloc[0]
-        for idx, data_point in enumerate(self.series_x):
-            val = self.series_y.iloc[idx] - self.alpha - self.beta * data_point
-            self.spread = pd.concat([self.spread, pd.Series([val])])
-        
+        spread = self.series_y.to_numpy(dtype=np.float64) - self.alpha - self.beta * self.series_x.to_numpy(dtype=np.float64)
+        self.spread = pd.Series(spread)
+        self.spread_stats = RollingStats(self.window_size, spread)
+
         spread_mavg = self.spread.rolling(window=self.window_size).mean()
         std_moving = self.spread.rolling(window=self.window_size).std()
         # print(f"std_moving: {std_moving}")
         self.zscore = (self.spread - spread_mavg)/std_moving
+        self.zscores = IndexedSeries(self.df_y.index.values, self.zscore.values)
 
-        self.rolling_zscore = pd.DataFrame()
-
-        self.rolling_zscore["Datetime"] = self.df_y.index.values
-        self.rolling_zscore["Zscore"] = self.zscore.values
+    @property
+    def rolling_zscore(self) -> pd.DataFrame:
+        return self.zscores.to_frame("Zscore")
 
 
     def update(self, data_row_x: pd.DataFrame, data_row_y: pd.DataFrame):
-        self.df_x = pd.concat([self.df_x, data_row_x])
-        self.df_y = pd.concat([self.df_y, data_row_y])
-
-        self.series_x = self.df_x[self.key]
-        self.series_y = self.df_y[self.key]
-
-        assert(len(self.series_y) == len(self.series_x))
-        spread_val =  self.series_y.tail(1).iloc[0] - self.alpha - self.beta * self.series_x.tail(1).iloc[0]
-        self.spread = pd.concat([self.spread, pd.Series([spread_val])])         
-        spread_mavg = self.spread.tail(self.window_size).mean()
-        std_moving = self.spread.tail(self.window_size).std()
-        current_zscore = (spread_val - spread_mavg)/std_moving
-        self.rolling_zscore.loc[len(self.rolling_zscore)] = pd.DataFrame({"Datetime" : [data_row_x.tail(1).index.values[0]], "Zscore": [current_zscore]}).iloc[0]
+        """
+        Adds the latest bar. Only the rolling window of the spread is kept (spread_stats),
+        so the cost does not grow with the history.
+        """
+        assert(len(data_row_y) == len(data_row_x))
+        spread_val = data_row_y[self.key].iloc[-1] - self.alpha - self.beta * data_row_x[self.key].iloc[-1]
+        self.spread_stats.push(spread_val)
+        current_zscore = self.spread_stats.zscore(spread_val)
+        self.zscores.append(data_row_x.index[-1], current_zscore)
         
-    def get_zscore(self, date_str: str):
+    def get_zscore(self, timestamp):
         """
-        Asserts the datetime format is correct.
+        Accepts unix seconds (or a datetime string).
         Returns the float value of the zscore at that date.
         Returns nan if the date is not found OR the value is nan
         """
-        try:
-            datetime.fromisoformat(date_str)
-        except ValueError:
-            raise AssertionError(f"{date_str}")
+        timestamp = to_unix(timestamp)
         
-        selected_row = self.rolling_zscore[self.rolling_zscore["Datetime"] == date_str]
-        if selected_row.empty:
-            logger.error(f"Selected row for {date_str} is not found!")
+        ind = self.zscores.position(timestamp)
+        if ind < 0:
+            logger.error(f"Selected row for {fmt_datetime(timestamp)} is not found!")
             return np.nan
-        val = selected_row["Zscore"].iloc[0]
-        return val
+        return self.zscores.values[ind]
     
-    def get_beta(self, date_str: str):
+    def get_beta(self, timestamp):
         """
-        Asserts the datetime format is correct.
+        Accepts unix seconds (or a datetime string).
         Returns the float value of the beta at that date.
         Returns nan if the date is not found OR the value is nan
         """
-        try:
-            datetime.fromisoformat(date_str)
-        except ValueError:
-            raise AssertionError(f"{date_str}")
+        timestamp = to_unix(timestamp)
         
         return self.beta
 
+    def get_betas(self, times) -> np.ndarray:
+        return np.full(len(times), self.beta)
+
+
+class PairsTraderKalman(object):
+    """
+    Pairs analyzer with a Kalman filtered, continuously adapting hedge ratio (see model.kalman).
+    The z-score of a bar is the filter's standardized forecast error, NaN for the first burn_in bars.
+    observation_var defaults to the residual variance of a static OLS fit on the initial history.
+    The history is filtered in one pass at init, update() folds in a bar in O(1).
+    """
+    def __init__(self, df_series_x: pd.DataFrame, df_series_y: pd.DataFrame, delta=DEFAULT_DELTA, observation_var=None, burn_in=20):
+        self.key = "Open"
+        self.burn_in = burn_in
+        self.delta = delta
+        self.observation_var = observation_var
+        self.filter = None
+        self.zscores = IndexedSeries()
+        self.betas = IndexedSeries()
+        self.alphas = IndexedSeries()
+        self.alpha = np.nan
+        self.beta = np.nan
+
+        logger.info("Initializing PairsTraderKalman object:")
+        self._run_initialization(df_series_x, df_series_y)
+        logger.info("Successfully initialized PairsTraderKalman object.")
+
+    def _run_initialization(self, df_series_x: pd.DataFrame, df_series_y: pd.DataFrame):
+        series_x = df_series_x[self.key].to_numpy(dtype=np.float64)
+        series_y = df_series_y[self.key].to_numpy(dtype=np.float64)
+        assert(len(series_y) == len(series_x))
+        if self.observation_var is None:
+            design = np.stack([np.ones(len(series_x)), series_x], axis=1)
+            params = np.linalg.lstsq(design, series_y, rcond=None)[0]
+            self.observation_var = np.var(series_y - design @ params)
+        self.filter = KalmanHedge(1, self.delta, self.observation_var)
+        out = self.filter.filter(series_x, series_y)
+        zscore = out.zscore
+        zscore[:self.burn_in] = np.nan
+
+        times = df_series_y.index.values
+        self.zscores = IndexedSeries(times, zscore)
+        self.betas = IndexedSeries(times, out.beta)
+        self.alphas = IndexedSeries(times, out.alpha)
+        self.alpha = self.filter.alpha[0]
+        self.beta = self.filter.beta[0]
+
+    def update(self, data_row_x: pd.DataFrame, data_row_y: pd.DataFrame):
+        assert(len(data_row_y) == len(data_row_x))
+        x = data_row_x[self.key].iloc[-1]
+        y = data_row_y[self.key].iloc[-1]
+        timestamp = data_row_y.index[-1]
+
+        error, variance = self.filter.step(x, y)
+        self.alpha = self.filter.alpha[0]
+        self.beta = self.filter.beta[0]
+        zscore = error[0] / np.sqrt(variance[0]) if len(self.zscores) >= self.burn_in else np.nan
+        self.zscores.append(timestamp, zscore)
+        self.betas.append(timestamp, self.beta)
+        self.alphas.append(timestamp, self.alpha)
+
+    def get_zscore(self, timestamp):
+        """
+        Accepts unix seconds (or a datetime string).
+        Returns the float value of the zscore at that date.
+        Returns nan if the date is not found OR the value is nan
+        """
+        timestamp = to_unix(timestamp)
+
+        ind = self.zscores.position(timestamp)
+        if ind < 0:
+            logger.error(f"Selected row for {fmt_datetime(timestamp)} is not found!")
+            return np.nan
+        return self.zscores.values[ind]
+
+    def get_beta(self, timestamp):
+        """
+        Accepts unix seconds (or a datetime string).
+        Returns the float value of the beta at that date.
+        Returns nan if the date is not found OR the value is nan
+        """
+        timestamp = to_unix(timestamp)
+
+        ind = self.betas.position(timestamp)
+        if ind < 0:
+            logger.error(f"Selected row for {fmt_datetime(timestamp)} is not found!")
+            return np.nan
+        return self.betas.values[ind]
+
+    def get_betas(self, times) -> np.ndarray:
+        return self.betas.lookup(times)
+
+    @property
+    def rolling_zscore(self) -> pd.DataFrame:
+        return self.zscores.to_frame("Zscore")
+
+    @property
+    def rolling_beta(self) -> pd.DataFrame:
+        return self.betas.to_frame("Beta")
+
 
 class PairsTrader(object):
-    def __init__(self, df_series_x: pd.DataFrame, df_series_y: pd.DataFrame):
+    """
+    Pairs analyzer with a rolling (window_size) OLS hedge ratio.
+    With forgetting set, live updates use an exponentially weighted hedge ratio instead.
+    """
+    def __init__(self, df_series_x: pd.DataFrame, df_series_y: pd.DataFrame, window_size=210, forgetting=None):
         self.key = "Open"
-        self.window_size = 210
+        self.window_size = window_size
+        self.forgetting = forgetting
         self.do_plots = False
         self.is_initialized = False
-        self.cointegration_cutoff: float = 0.05,
-        self.rolling_coint = pd.DataFrame(columns=["Datetime", "Cointegrated"]).set_index("Datetime")
+        self.cointegration_cutoff: float = 0.05
+        # Engle-Granger p-value of the window ending at each checked bar
+        self.coint_pvalues = IndexedSeries()
         self.df_x = pd.DataFrame()
         self.df_y = pd.DataFrame()
         self.series_x = pd.Series()
@@ -128,8 +222,10 @@ class PairsTrader(object):
         self.series_y_chart = []
         self.rolling_zscore_chart = []
 
-        self.rolling_zscore = pd.DataFrame()
-        self.rolling_beta = pd.DataFrame()
+        self.zscores = IndexedSeries()
+        self.betas = IndexedSeries()
+        # After an update every bar reports the latest beta
+        self.live_beta = None
 
         logger.info("Initializing PairsTrader object:")
         self._run_initialization(df_series_x, df_series_y)
@@ -137,6 +233,9 @@ class PairsTrader(object):
 
     #comput the rolling zscore from the cointegrated pair
     def _run_initialization(self, df_series_x: pd.DataFrame, df_series_y: pd.DataFrame):
+        import statsmodels.api as sm
+        from statsmodels.regression.rolling import RollingOLS
+
         self.df_y = df_series_y
         self.df_x = df_series_x
         self.series_x = self.df_x[self.key]
@@ -170,21 +269,21 @@ class PairsTrader(object):
         roll_ols_model = RollingOLS(self.series_y,  series_x_const , window=self.window_size)
         rolling_results = roll_ols_model.fit(params_only=True)
 
-        self.rolling_beta = pd.DataFrame()
-        self.rolling_beta["Datetime"] = self.df_y.index.values
-        self.rolling_beta["Beta"] = rolling_results.params[self.key].reset_index(drop=True)
+        self.betas = IndexedSeries(self.df_y.index.values, rolling_results.params[self.key].to_numpy())
         self.spread = self.series_y - rolling_results.params['const'] - rolling_results.params[self.key] *  self.series_x 
 
         spread_mavg1 = self.spread.rolling(window=1).mean()
         spread_mavg30 = self.spread.rolling(self.window_size).mean()
         std_30 = self.spread.rolling(window=self.window_size).std()
         self.zscore_30_1 = (spread_mavg1 - spread_mavg30)/std_30
+        self.zscores = IndexedSeries(self.df_y.index.values, self.zscore_30_1.values)
 
-        self.rolling_zscore = pd.DataFrame()
-        self.rolling_zscore["Datetime"] = self.df_y.index.values
-        self.rolling_zscore["Zscore"] = self.zscore_30_1.values
+        self.regression = RollingRegression(self.window_size, self.forgetting, self.series_x.to_numpy(), self.series_y.to_numpy())
+        self.spread_stats = RollingStats(self.window_size, self.spread.to_numpy(dtype=np.float64))
 
         if self.do_plots:
+            import matplotlib.pyplot as plt
+
             plt.plot(self.zscore_30_1.index, self.zscore_30_1)  # Use the index for x-values and the values for y
             plt.ylabel("zscore")
             data_folder = os.path.join(".", "pairs_zscores")
@@ -193,112 +292,151 @@ class PairsTrader(object):
             plt.close()
             logger.info("Plotted rolling_zscore.")
     
-    def get_zscore(self, date_str: str):
+    def get_zscore(self, timestamp):
         """
-        Asserts the datetime format is correct.
+        Accepts unix seconds (or a datetime string).
         Returns the float value of the zscore at that date.
         Returns nan if the date is not found OR the value is nan
         """
-        try:
-            datetime.fromisoformat(date_str)
-        except ValueError:
-            raise AssertionError(f"{date_str}")
+        timestamp = to_unix(timestamp)
         
-        fast_selected_row = self.rolling_zscore[self.rolling_zscore["Datetime"] == date_str]
-        if fast_selected_row.empty:
-            logger.error(f"Selected row for {date_str} is not found!")
+        ind = self.zscores.position(timestamp)
+        if ind < 0:
+            logger.error(f"Selected row for {fmt_datetime(timestamp)} is not found!")
             return np.nan
-        val = fast_selected_row["Zscore"].iloc[0]
-        return val
+        return self.zscores.values[ind]
 
-    def get_beta(self, date_str: str):
+    def get_beta(self, timestamp):
         """
-        Asserts the datetime format is correct.
+        Accepts unix seconds (or a datetime string).
         Returns the float value of the beta at that date.
         Returns nan if the date is not found OR the value is nan
         """
-        try:
-            datetime.fromisoformat(date_str)
-        except ValueError:
-            raise AssertionError(f"{date_str}")
+        timestamp = to_unix(timestamp)
         
-        fast_selected_row = self.rolling_beta[self.rolling_beta["Datetime"] == date_str]
-        if fast_selected_row.empty:
-            logger.error(f"Selected row for {date_str} is not found!")
+        ind = self.betas.position(timestamp)
+        if ind < 0:
+            logger.error(f"Selected row for {fmt_datetime(timestamp)} is not found!")
             return np.nan
-        val = fast_selected_row["Beta"].iloc[0]
-        return val
+        if self.live_beta is not None:
+            return self.live_beta
+        return self.betas.values[ind]
+
+    @property
+    def rolling_zscore(self) -> pd.DataFrame:
+        return self.zscores.to_frame("Zscore")
+
+    @property
+    def rolling_beta(self) -> pd.DataFrame:
+        rolling_beta = self.betas.to_frame("Beta")
+        if self.live_beta is not None:
+            rolling_beta["Beta"] = self.live_beta
+        return rolling_beta
     
     def update(self, data_row_x: pd.DataFrame, data_row_y: pd.DataFrame):
-        # TODO: optimization only rolling OLS on the end
-        self.df_x = pd.concat([self.df_x, data_row_x])
-        self.df_y = pd.concat([self.df_y, data_row_y])
-
-        # if self.do_static_beta:
-        #     val = self.alpha + self.series_y.tail(1) - self.beta * self.series_x.tail(1)
-        #     self.series_x = self.df_x[self.key]
-        #     self.series_y = self.df_y[self.key]
-        #     assert(len(self.series_y) == len(self.series_x))
-        #     self.spread = pd.concat([self.spread, pd.Series([val])])
-
-        #     spread_mavg30 = float((self.spread.rolling(self.window_size).mean().tail(1)).iloc[0])
-        #     std_30 = float((self.spread.rolling(window=self.window_size).std().tail(1)).iloc[0])
-        #     # print(f"type {type((self.spread.rolling(window=self.window_size).std().tail(1)).iloc[0])}")
-        #     self.zscore_30_1 = (self.spread.tail(1).iloc[0].iloc[0] - spread_mavg30)/std_30
-        #     self.rolling_zscore = pd.DataFrame()
-        #     self.rolling_zscore["Datetime"] = self.df_y.index.values
-        #     self.rolling_zscore["Zscore"] = self.zscore_30_1
-        # else:
-        self.series_x = self.df_x[self.key].tail(self.window_size)
-        self.series_y = self.df_y[self.key].tail(self.window_size)
-
-        assert(len(self.series_y) == len(self.series_x))
-
-        series_x_const = sm.add_constant(self.series_x)
-
-        roll_ols_model = RollingOLS(self.series_y,  series_x_const , window=self.window_size)
-        rolling_results = roll_ols_model.fit(params_only=True)
-        self.rolling_beta = pd.DataFrame()
-        self.rolling_beta["Datetime"] = self.df_y.index.values
-        self.rolling_beta["Beta"] = rolling_results.params[self.key].tail(1).iloc[0]
-        
-        fast_temp_spread = self.series_y - rolling_results.params['const'] - rolling_results.params[self.key] *  self.series_x 
-
-        self.spread = pd.concat([self.spread, fast_temp_spread.tail(1)])
-
-        spread_mavg1 = self.spread.rolling(window=1).mean()
-        spread_mavg30 = self.spread.rolling(self.window_size).mean()
-        std_30 = self.spread.rolling(window=self.window_size).std()
-        self.zscore_30_1 = (spread_mavg1 - spread_mavg30)/std_30
+        """
+        Adds the latest bar. The hedge ratio of the last window and the spread's rolling stats are
+        updated incrementally (see model.rolling), so the cost does not grow with the history.
+        """
+        self._pending_x.append(data_row_x)
+        self._pending_y.append(data_row_y)
+        x = data_row_x[self.key].iloc[-1]
+        y = data_row_y[self.key].iloc[-1]
+        timestamp = data_row_y.index[-1]
+
+        self.regression.push(x, y)
+        self.alpha = self.regression.alpha
+        self.live_beta = self.regression.beta
+        spread_val = y - self.alpha - self.live_beta * x
+        self.spread_stats.push(spread_val)
+        current_zscore = self.spread_stats.zscore(spread_val) if self.spread_stats.complete else np.nan
+
+        self.betas.append(timestamp, self.live_beta)
+        self.zscores.append(timestamp, current_zscore)
+
+    @property
+    def df_x(self) -> pd.DataFrame:
+        if len(self._pending_x) > 0:
+            self._df_x = pd.concat([self._df_x] + self._pending_x)
+            self._pending_x = []
+        return self._df_x
+
+    @df_x.setter
+    def df_x(self, value: pd.DataFrame):
+        self._df_x = value
+        self._pending_x = []
+
+    @property
+    def df_y(self) -> pd.DataFrame:
+        if len(self._pending_y) > 0:
+            self._df_y = pd.concat([self._df_y] + self._pending_y)
+            self._pending_y = []
+        return self._df_y
+
+    @df_y.setter
+    def df_y(self, value: pd.DataFrame):
+        self._df_y = value
+        self._pending_y = []
+
+    @property
+    def rolling_coint(self) -> pd.DataFrame:
+        rolling_coint = self.coint_pvalues.to_frame("PValue").set_index("Datetime")
+        rolling_coint["Cointegrated"] = rolling_coint["PValue"] < self.cointegration_cutoff
+        return rolling_coint
+
+    def is_cointegrated_on_date(self, date):
+        """
+        Uses the latest window checked at or before date, so bars between two strided checks report the earlier one
+        """
+        return bool(self.coint_pvalues.asof(to_unix(date)) < self.cointegration_cutoff)
 
-        self.rolling_zscore = pd.DataFrame()
-        self.rolling_zscore["Datetime"] = self.df_y.index.values
-        self.rolling_zscore["Zscore"] = self.zscore_30_1.values
+    def _set_coint_pvalue(self, timestamp, p_value):
+        ind = self.coint_pvalues.position(timestamp)
+        if ind >= 0:
+            self.coint_pvalues.values[ind] = p_value
+        else:
+            self.coint_pvalues.append(timestamp, p_value)
 
-    def is_cointegrated_on_date(self, date: str):
-        coint_data_row = self.rolling_coint[self.rolling_coint.index == date]
-        if not coint_data_row.empty and coint_data_row['Cointegrated'].iloc[0]:
-            return True
-        return False
+    def _check_cointegration_over_window(self, date_start, date_end):
+        from model.statistics import engle_granger
 
-    def _check_cointegration_over_window(self, date_start: str, date_end: str):
+        date_start = to_unix(date_start)
+        date_end = to_unix(date_end)
         df_slice_x = self.df_x.loc[date_start:date_end]
         df_slice_y = self.df_y.loc[date_start:date_end]
 
         # logger.info("Inside cointegration check")
         series_x = df_slice_x[self.key].to_numpy()
         series_y = df_slice_y[self.key].to_numpy()
-        coint_output = coint(series_x, series_y, trend='c', method='aeg', maxlag=None, autolag='aic', return_results=None)
+        coint_output = engle_granger(series_x, series_y, trend='c', method='aeg', maxlag=None, autolag='aic')
         col_date = df_slice_x.index[-1]
-        bool_val = np.float64(coint_output[1]) < self.cointegration_cutoff
-        self.rolling_coint.loc[col_date] = {'Cointegrated' : bool_val}
-        # coint_data_row = pd.Series({'Datetime': col_date, 'Cointegrated': bool_val})
-        # print(f"before: {self.rolling_coint}")
-        # self.rolling_coint = pd.concat([self.rolling_coint, coint_data_row])c
-        # print(f"after {self.rolling_coint}")
-        # return np.float64(coint_output[1]) < self.cointegration_cutoff
+        self._set_coint_pvalue(col_date, np.float64(coint_output[1]))
+
+    def check_cointegration(self, window=None, stride=1, lags=None, autolag="aic", max_workers=None):
+        """
+        Tests cointegration over the window bars ending at every stride-th bar of the history that has not
+        been checked yet, with model.rolling.RollingCointegration. Results are read with is_cointegrated_on_date.
+        """
+        from model.rolling import RollingCointegration
+
+        window = self.window_size if window is None else window
+        series_x = self.df_x[self.key].to_numpy(dtype=np.float64)
+        series_y = self.df_y[self.key].to_numpy(dtype=np.float64)
+        times = self.df_x.index.to_numpy()
+        first_end = window - 1
+        if len(self.coint_pvalues) > 0:
+            last = int(np.searchsorted(times, self.coint_pvalues.times.max()))
+            first_end = max(first_end, last + stride)
+        ends = np.arange(first_end, len(times), stride)
+        if len(ends) == 0:
+            return
+        rolling = RollingCointegration(window, stride, lags, autolag, self.cointegration_cutoff, max_workers)
+        result = rolling.run(series_x, series_y, ends)
+        self.coint_pvalues.extend(times[ends], result.p_value)
 
     def output_primary_charts(self):
+        import matplotlib.pyplot as plt
+
         plt.figure()
         fig, ax = plt.subplots(4, figsize=(30, 15))
         x_range = list(range(0, len(self.p_value_series_chart)))
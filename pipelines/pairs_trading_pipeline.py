@@ -1,18 +1,21 @@
 import os
-import statsmodels.api as sm
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dataclasses import dataclass
-from typing import Any, Callable, Dict, List
+from multiprocessing import shared_memory
+from typing import Any, Dict, List
 
 import numpy as np
 import pandas as pd
 from loguru import logger as log
-from matplotlib import pyplot as plt
-from statsmodels.tsa.stattools import adfuller, coint
-from statsmodels.regression.rolling import RollingOLS
 import itertools
 
 #NOTE: Implemented from this lecture: https://www.youtube.com/watch?v=JTucMRYMOyY
 
+# Parameters of the adf (model.statistics.adf_batch, same as statsmodels' adfuller) and coint tests,
+# also part of the StatTestCache keys
+ADF_PARAMS = {"maxlag": None, "regression": "c", "autolag": "AIC"}
+COINT_PARAMS = {"trend": "c", "method": "aeg", "maxlag": None, "autolag": "aic"}
+
 @dataclass
 class StationarityStruct:
     p_value: float
@@ -32,6 +35,15 @@ class PairsTradingPipeline(object):
         integrator_function_key: str = "pct_change_integrator",
         adf_cutoff: float = 0.01,
         cointegration_cutoff: float = 0.01,
+        max_workers: int = None,
+        use_processes: bool = False,
+        chunk_size: int = None,
+        screen_cutoff: float = None,
+        screen_lags: int = 1,
+        candidate_neighbours: int = None,
+        cluster_distance: float = None,
+        cache=None,
+        adf_lags: int = None,
     ):
         # for now only accept 1 time series
         self.input_data_set = input_data_set
@@ -46,6 +58,26 @@ class PairsTradingPipeline(object):
         self.save_res_plots = False 
         self.integrator_cutoff = 1  # max number of attempts to integrate
         self.cointegration_cutoff = cointegration_cutoff
+        # use_processes shards the pair tests over a process pool of max_workers workers,
+        # chunk_size pairs per task (defaults to a few tasks per worker)
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+        self.chunk_size = chunk_size
+        # With a screen_cutoff, pairs are first screened by batched Engle-Granger tests with screen_lags
+        # fixed lags and only those with a p-value below screen_cutoff get the full coint test.
+        # The screen's p-values differ from the AIC lag search ones, so it should be looser than cointegration_cutoff
+        self.screen_cutoff = screen_cutoff
+        self.screen_lags = screen_lags
+        # With candidate_neighbours, only pairs where one series is among the other's candidate_neighbours
+        # most correlated (by returns, within its cluster when cluster_distance is set) are tested,
+        # see model.candidates.candidate_pairs. The pruning is reported in candidate_report
+        self.candidate_neighbours = candidate_neighbours
+        self.cluster_distance = cluster_distance
+        self.candidate_report = None
+        # Optional model.result_cache.StatTestCache, adf and coint results are looked up there first
+        self.cache = cache
+        # Stationarity is tested with an AIC lag search, or at adf_lags fixed lags when set
+        self.adf_lags = adf_lags
         log.info(
             f"Generated PairsTradingPipeline Object with {len(input_data_set)} time series."
         )
@@ -88,84 +120,219 @@ class PairsTradingPipeline(object):
             self.cleaned_data_set[ticker] = all_data[:, index]
         log.info("Cleaned data")
 
-    def _check_stationarity(
-        self, ticker: str, data: np.ndarray, int_order: int
-    ) -> StationarityStruct:
-        log.info(f"\t\tChecking stationarity for time series: {ticker}")
-        adf_result = adfuller(data)
-        p_value = adf_result[1]
-        validate = True if p_value < self.adf_cutoff else False
-        integrator_order = int_order
-        log.info(
-            f"\t\ttime series: {ticker} p_value: {p_value} is_stationary: {validate}"
-        )
-        return StationarityStruct(
-            p_value=p_value, is_stationary=validate, integrator_order=integrator_order
-        )
-
-    def _generate_stationary_series(
-        self, data: np.ndarray, integrator_type: Callable[[np.ndarray], np.ndarray]
-    ) -> np.ndarray:
-        log.info(f"Integrating data")
-        return integrator_type(data)
-
     def _find_cointegrated_pairs(self):
         #create an array of tickers of order 1 integrated time series
         order_1_series = []
         for ticker, stationarity_obj in self.stationarity_set.items():
             if stationarity_obj.integrator_order == 1:
                 order_1_series.append(ticker)
-        result = [(a, b) for a, b in itertools.combinations(order_1_series, 2)]
-        for pair in result:
-            y0 = self.cleaned_data_set[pair[0]]
-            y1 = self.cleaned_data_set[pair[1]]
-            # assert( len(y0) == len(y1))
-            if len(y0) == len(y1):
-                coint_output = coint(y0, y1, trend='c', method='aeg', maxlag=None, autolag='aic', return_results=None)
-                coint_pvalue = coint_output[1]
-                if coint_pvalue < self.cointegration_cutoff:
-                    # log.error(f"Found cointegrated pair! {pair}, pvalue: {coint_pvalue}, tstat: {coint_output[0]}")
-                    log.error(f"Found cointegrated pair! {pair}, coint_out: {coint_output}")
-                    self.cointegrated_pairs_set.add(pair)
-                    log.warning(self.cointegrated_pairs_set)
-            else:
-                log.error(f'Incompatible lengths of time series: {pair[0]} : {len(y0)} vs {pair[1]} : {len(y1)}')
+        if self.candidate_neighbours is not None:
+            result = self._candidate_pairs(order_1_series)
+        else:
+            result = []
+            for pair in itertools.combinations(order_1_series, 2):
+                y0 = self.cleaned_data_set[pair[0]]
+                y1 = self.cleaned_data_set[pair[1]]
+                # assert( len(y0) == len(y1))
+                if len(y0) == len(y1):
+                    result.append(pair)
+                else:
+                    log.error(f'Incompatible lengths of time series: {pair[0]} : {len(y0)} vs {pair[1]} : {len(y1)}')
+        if self.screen_cutoff is not None:
+            result = self._screen_pairs(result)
+
+        cached = dict()
+        if self.cache is not None:
+            digests = {ticker: self.cache.digest(self.cleaned_data_set[ticker]) for ticker in order_1_series}
+            keys = {pair: self.cache.key("coint", COINT_PARAMS, [digests[pair[0]], digests[pair[1]]]) for pair in result}
+            found = self.cache.get_many(keys.values())
+            cached = {pair: _coint_from_json(found[keys[pair]]) for pair in result if keys[pair] in found}
+            log.info(f"Cointegration tests cached for {len(cached)}/{len(result)} pairs")
+        pending = [pair for pair in result if pair not in cached]
+
+        if self.use_processes:
+            computed = self._coint_parallel(order_1_series, pending)
+        else:
+            positions = {ticker: i for i, ticker in enumerate(order_1_series)}
+            series = [self.cleaned_data_set[ticker] for ticker in order_1_series]
+            index_pairs = [(positions[a], positions[b]) for a, b in pending]
+            computed = (((order_1_series[i], order_1_series[j]), out) for (i, j), out in _coint_many(series, index_pairs))
+        new_results = dict()
+        for pair, coint_output in itertools.chain(cached.items(), computed):
+            if self.cache is not None and pair not in cached:
+                new_results[keys[pair]] = _coint_to_json(coint_output)
+            coint_pvalue = coint_output[1]
+            if coint_pvalue < self.cointegration_cutoff:
+                # log.error(f"Found cointegrated pair! {pair}, pvalue: {coint_pvalue}, tstat: {coint_output[0]}")
+                log.error(f"Found cointegrated pair! {pair}, coint_out: {coint_output}")
+                self.cointegrated_pairs_set.add(pair)
+                log.warning(self.cointegrated_pairs_set)
+        if len(new_results) > 0:
+            self.cache.put_many(new_results)
+
+    def _candidate_pairs(self, tickers: List[str]) -> List[tuple]:
+        """
+        Returns the candidate pairs among tickers of the same length, in the order of itertools.combinations(tickers, 2).
+        Only the candidates are built, never the full list of pairs
+        """
+        from model.candidates import candidate_pairs
+
+        by_length = dict()
+        for ticker in tickers:
+            by_length.setdefault(len(self.cleaned_data_set[ticker]), []).append(ticker)
+        if len(by_length) > 1:
+            log.error(f"Incompatible lengths of time series {sorted(by_length)}, only series of equal length are paired")
+        candidates = []
+        report = {"pairs": 0, "candidates": 0, "pruned": 0, "clusters": 0}
+        for group in by_length.values():
+            n = len(group)
+            report["pairs"] += n * (n - 1) // 2
+            if n < 2:
+                continue
+            prices = np.stack([self.cleaned_data_set[ticker] for ticker in group], axis=1)
+            group_candidates = candidate_pairs(prices, self.candidate_neighbours, self.cluster_distance)
+            log.info(f"Candidate pairs of {n} series: {group_candidates.report()}")
+            candidates.extend((group[i], group[j]) for i, j in group_candidates.pairs.tolist())
+            report["clusters"] += len(np.unique(group_candidates.clusters))
+        positions = {ticker: i for i, ticker in enumerate(tickers)}
+        candidates.sort(key=lambda pair: (positions[pair[0]], positions[pair[1]]))
+        report["candidates"] = len(candidates)
+        report["pruned"] = report["pairs"] - len(candidates)
+        self.candidate_report = report
+        log.info(f"Candidate pre-filter kept {len(candidates)}/{report['pairs']} pairs ({report['pruned']} pruned)")
+        return candidates
+
+    def _screen_pairs(self, pairs: List[tuple]) -> List[tuple]:
+        """
+        Returns the pairs whose batched Engle-Granger p-value is below screen_cutoff, in the same order.
+        Series are stacked into one matrix per length.
+        """
+        from model.statistics import engle_granger_screen
+
+        by_length = dict()
+        for pair in pairs:
+            by_length.setdefault(len(self.cleaned_data_set[pair[0]]), []).append(pair)
+        survivors = set()
+        for group in by_length.values():
+            tickers = list(dict.fromkeys(itertools.chain.from_iterable(group)))
+            positions = {ticker: i for i, ticker in enumerate(tickers)}
+            Y = np.stack([self.cleaned_data_set[ticker] for ticker in tickers], axis=1)
+            _, pvalues = engle_granger_screen(Y, [(positions[a], positions[b]) for a, b in group], lags=self.screen_lags)
+            survivors.update(pair for pair, pvalue in zip(group, pvalues) if pvalue < self.screen_cutoff)
+        log.info(f"Engle-Granger screen kept {len(survivors)}/{len(pairs)} pairs")
+        return [pair for pair in pairs if pair in survivors]
+
+    def _coint_parallel(self, tickers: List[str], pairs: List[tuple]):
+        """
+        Runs the cointegration tests of pairs over a process pool, yielding (pair, coint output) in completion order.
+        The series of tickers are copied once into a shared memory block that every worker maps,
+        so tasks only carry the indices of their pairs.
+        """
+        if len(pairs) == 0:
+            return
+        series = [np.asarray(self.cleaned_data_set[ticker], dtype=np.float64) for ticker in tickers]
+        offsets = np.concatenate([[0], np.cumsum([len(s) for s in series])])
+        shm = shared_memory.SharedMemory(create=True, size=max(int(offsets[-1]) * 8, 1))
+        try:
+            flat = np.ndarray((offsets[-1],), dtype=np.float64, buffer=shm.buf)
+            for i, s in enumerate(series):
+                flat[offsets[i] : offsets[i + 1]] = s
+            del flat
+
+            positions = {ticker: i for i, ticker in enumerate(tickers)}
+            index_pairs = [(positions[a], positions[b]) for a, b in pairs]
+            max_workers = self.max_workers or os.cpu_count() or 1
+            chunk_size = self.chunk_size or max(1, len(index_pairs) // (4 * max_workers))
+            chunks = [index_pairs[i : i + chunk_size] for i in range(0, len(index_pairs), chunk_size)]
+
+            done = 0
+            with ProcessPoolExecutor(
+                max_workers=max_workers, initializer=_attach_series, initargs=(shm.name, offsets)
+            ) as executor:
+                futures = [executor.submit(_coint_chunk, chunk) for chunk in chunks]
+                for future in as_completed(futures):
+                    chunk_outputs = future.result()
+                    done += len(chunk_outputs)
+                    log.info(f"Cointegration tests: {done}/{len(index_pairs)} pairs")
+                    for (i, j), coint_output in chunk_outputs:
+                        yield (tickers[i], tickers[j]), coint_output
+        finally:
+            shm.close()
+            shm.unlink()
 
     def _generate_stationary_set(self):
-        for ticker, time_series in self.cleaned_data_set.items():
-            count = 0
-            temp_time_series = np.copy(time_series)
-            stationarity_obj = self._check_stationarity(ticker, temp_time_series, count)
-            #Note: What we really want to do is see for which IntegratorTypes do we get an
-            # integrator of order 1 time series. 
-            # Then we match all integrator of order 1 series for that specific IntegratorType
-            # Then we can perform cointegration
-            #TODO: FIX! see above
-            while not stationarity_obj.is_stationary or (
-                count > self.integrator_cutoff
-            ):
-                count += 1
-                temp_time_series = self._generate_stationary_series(
-                    temp_time_series, self.integrator.integrator_dict[self.integrator_function_key]
+        """
+        Integrates every series until it tests stationary. Each round tests all the series that are
+        not stationary yet with one model.statistics.adf_batch call (rows NaN padded to a common length)
+        """
+        from model.statistics import adf_batch
+
+        # Without adf_lags the lags are searched by AIC as in adfuller(**ADF_PARAMS)
+        if self.adf_lags is None:
+            params = ADF_PARAMS
+        else:
+            params = {"maxlag": self.adf_lags, "regression": "c", "autolag": None}
+        integrator_type = self.integrator.integrator_dict[self.integrator_function_key]
+        pending = {ticker: np.asarray(time_series, dtype=np.float64) for ticker, time_series in self.cleaned_data_set.items()}
+        count = 0
+        while len(pending) > 0:
+            if count > 0:
+                log.info(f"Integrating {len(pending)} series")
+                pending = {ticker: integrator_type(time_series) for ticker, time_series in pending.items()}
+            tickers = list(pending)
+            keys = dict()
+            p_values = dict()
+            if self.cache is not None:
+                keys = {ticker: self.cache.key("adfuller", params, [self.cache.digest(pending[ticker])]) for ticker in tickers}
+                found = self.cache.get_many(keys.values())
+                p_values = {ticker: found[keys[ticker]][1] for ticker in tickers if keys[ticker] in found}
+            computed = [ticker for ticker in tickers if ticker not in p_values]
+            if len(computed) > 0:
+                padded = np.full((len(computed), max(len(pending[ticker]) for ticker in computed)), np.nan)
+                for i, ticker in enumerate(computed):
+                    padded[i, : len(pending[ticker])] = pending[ticker]
+                result = adf_batch(padded, lags=self.adf_lags, model="M1", autolag=params["autolag"])
+                p_values.update(zip(computed, result.p_value.tolist()))
+                if self.cache is not None:
+                    self.cache.put_many(
+                        {keys[ticker]: [t_stat, p_value] for ticker, t_stat, p_value in zip(computed, result.t_stat.tolist(), result.p_value.tolist())}
+                    )
+            log.info(f"\t\tChecked stationarity of {len(tickers)} time series at order {count}, {len(tickers) - len(computed)} cached")
+
+            still_pending = dict()
+            for ticker in tickers:
+                p_value = p_values[ticker]
+                is_stationary = bool(p_value < self.adf_cutoff)
+                self.stationarity_set[ticker] = StationarityStruct(
+                    p_value=p_value, is_stationary=is_stationary, integrator_order=count
                 )
-                stationarity_obj = self._check_stationarity(ticker, temp_time_series, count)
-            self.stationarity_set[ticker] = stationarity_obj
-            if self.save_plots:
-                # TODO make this a function
-                plt.plot(list(range(0, len(temp_time_series))), temp_time_series)
-                plt.ylabel("Pct Change Returns - time delta is 1d")
-                plt.legend([ticker])
-                data_folder = os.path.join(".", "pipelines", "pairs_pipeline_images")
-                output_img_path = os.path.join(data_folder, f"{ticker}-stationary.png")
-                plt.savefig(output_img_path)
-                plt.close()
-                log.info(f"Saving image to {output_img_path}")
+                if not is_stationary or (count > self.integrator_cutoff):
+                    still_pending[ticker] = pending[ticker]
+                elif self.save_plots:
+                    self._plot_stationary_series(ticker, pending[ticker])
+            pending = still_pending
+            count += 1
+
+    def _plot_stationary_series(self, ticker, time_series):
+        from matplotlib import pyplot as plt
+
+        plt.plot(list(range(0, len(time_series))), time_series)
+        plt.ylabel("Pct Change Returns - time delta is 1d")
+        plt.legend([ticker])
+        data_folder = os.path.join(".", "pipelines", "pairs_pipeline_images")
+        output_img_path = os.path.join(data_folder, f"{ticker}-stationary.png")
+        plt.savefig(output_img_path)
+        plt.close()
+        log.info(f"Saving image to {output_img_path}")
     
     def _remove_confounding_pairs(self):
         #TODO check and remove confounded pairs
         pass
 
     def _run_ols_and_plot_residuals(self, data_y, data_x, ticker_y, ticker_x):
+        import statsmodels.api as sm
+        from statsmodels.tsa.stattools import adfuller
+
         data_x = data_x.reshape(-1, 1)
         xconst = sm.add_constant(data_x)
         model = sm.OLS(data_y, xconst)
@@ -184,6 +351,8 @@ class PairsTradingPipeline(object):
         zscore_series = self._zscore(residuals)
         #TODO: establish weights to compute s1 and s2 shares
         if self.save_res_plots:
+            from matplotlib import pyplot as plt
+
             time_series = list(range(0, len(residuals)))
             #plt.plot(time_series, residuals)
             plt.plot(time_series, zscore_series)
@@ -205,6 +374,8 @@ class PairsTradingPipeline(object):
         return (series - series.mean()) / np.std(series)
 
     def _run_moving_average_regression(self, data_y, data_x, window_size):
+        from statsmodels.regression.rolling import RollingOLS
+
         #This is currently a moving average (simple, and prevents look ahead bias)
         #seed for reproducibility
         #TODO this needs to be understood more...
@@ -218,6 +389,58 @@ class PairsTradingPipeline(object):
         # print(rolling_results.params)
 
 
+def _coint_many(series: List[np.ndarray], index_pairs: List[tuple]) -> List[tuple]:
+    """
+    Engle-Granger tests of the pairs (i, j) of series, equivalent to statsmodels' coint(series[i], series[j], **COINT_PARAMS).
+    Pairs are batched per series length through model.statistics.engle_granger_screen.
+    Returns ((i, j), (t-statistic, p-value, critical values)) per pair.
+    """
+    from model.statistics import engle_granger_screen, mackinnon_crit_values
+
+    assert COINT_PARAMS["trend"] == "c" and COINT_PARAMS["method"] == "aeg"
+    by_length = dict()
+    for i, j in index_pairs:
+        by_length.setdefault(len(series[i]), []).append((i, j))
+    outputs = []
+    for length, group in by_length.items():
+        columns = list(dict.fromkeys(itertools.chain.from_iterable(group)))
+        positions = {index: c for c, index in enumerate(columns)}
+        Y = np.stack([series[index] for index in columns], axis=1)
+        t_stats, p_values = engle_granger_screen(
+            Y,
+            [(positions[i], positions[j]) for i, j in group],
+            lags=COINT_PARAMS["maxlag"],
+            autolag=COINT_PARAMS["autolag"],
+        )
+        crit = mackinnon_crit_values(N=2, regression=COINT_PARAMS["trend"], nobs=length - 1)
+        outputs += [(pair, (t_stat, p_value, crit)) for pair, t_stat, p_value in zip(group, t_stats, p_values)]
+    return outputs
+
+
+def _coint_to_json(coint_output) -> list:
+    return [float(coint_output[0]), float(coint_output[1]), np.asarray(coint_output[2], dtype=np.float64).tolist()]
+
+
+def _coint_from_json(value: list) -> tuple:
+    return (value[0], value[1], np.array(value[2]))
+
+
+# Series shared with a worker process by PairsTradingPipeline._coint_parallel
+_shared_series = None
+
+
+def _attach_series(shm_name: str, offsets: np.ndarray):
+    global _shared_series
+    shm = shared_memory.SharedMemory(name=shm_name)
+    flat = np.ndarray((offsets[-1],), dtype=np.float64, buffer=shm.buf)
+    # Keep the block referenced so the mapping lives as long as the worker
+    _shared_series = (shm, [flat[offsets[i] : offsets[i + 1]] for i in range(len(offsets) - 1)])
+
+
+def _coint_chunk(index_pairs: List[tuple]) -> List[tuple]:
+    return _coint_many(_shared_series[1], index_pairs)
+
+
 class IntegratorTypes(object):
     """
     A collection of custom (or not) integrator functions for data
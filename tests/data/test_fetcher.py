@@ -0,0 +1,262 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data.cache import BarCache
+from data.catalog import Catalog
+from data.providers import DataProvider, ReplayProvider, SyntheticProvider
+from data.store import ColumnarBarStore, CsvBarStore, migrate_csv_folder, normalize_index
+from data.utils import DataFetcher, fmt_datetime, to_unix
+
+
+def _bars(n, start="2024-01-02 09:30:00"):
+    index = pd.date_range(start, periods=n, freq="h").strftime("%Y-%m-%d %H:%M:%S")
+    data = pd.DataFrame(
+        {
+            "Open": range(n),
+            "High": range(n),
+            "Low": range(n),
+            "Close": range(n),
+            "Volume": range(n),
+        },
+        index=pd.Index(index, name="Datetime"),
+        dtype="float64",
+    )
+    return data
+
+
+def _add_symbols(data_folder, prefix, n):
+    catalog = Catalog(data_folder, ".csv")
+    for i in range(n):
+        catalog.add("1h$2024-01-01$2024-02-01", [f"{prefix}{i}"])
+
+
+class TestBarCache:
+    def test_lru_eviction(self):
+        one = _bars(10)
+        cache = BarCache(max_bytes=int(2.5 * one.memory_usage(index=True, deep=True).sum()))
+        cache.put(("f", "A"), one)
+        cache.put(("f", "B"), _bars(10))
+        assert cache.get(("f", "A")) is one
+        cache.put(("f", "C"), _bars(10))
+        assert cache.get(("f", "B")) is None
+        assert cache.get(("f", "A")) is one
+        stats = cache.stats()
+        assert stats["evictions"] == 1
+        assert stats["hits"] == 2
+        assert stats["misses"] == 1
+
+    def test_invalidate_symbol(self):
+        cache = BarCache()
+        cache.put(("f", "A"), _bars(3))
+        cache.put(("g", "A"), _bars(3))
+        cache.put(("f", "B"), _bars(3))
+        cache.invalidate(symbol="A")
+        assert len(cache) == 1
+        assert cache.get(("f", "B")) is not None
+
+
+class TestDataFetcher:
+    def test_get_bars_cached(self, tmp_path):
+        DataFetcher.invalidate_cache()
+        fetcher = DataFetcher(str(tmp_path), "1h", "2024-01-01", "2024-02-01")
+        fetcher._save_history("AAA", _bars(5))
+        first = fetcher.get_bars("AAA")
+        second = fetcher.get_bars("AAA")
+        assert first is second
+        fetcher._save_history("AAA", _bars(7))
+        assert len(fetcher.get_bars("AAA")) == 7
+
+    def test_cache_keyed_on_provider(self, tmp_path):
+        DataFetcher.invalidate_cache()
+        first = DataFetcher(str(tmp_path), "1h", "2024-01-01", "2024-02-01", provider=SyntheticProvider(seed=1))
+        same = DataFetcher(str(tmp_path), "1h", "2024-01-01", "2024-02-01", provider=SyntheticProvider(seed=1))
+        other = DataFetcher(str(tmp_path), "1h", "2024-01-01", "2024-02-01", provider=SyntheticProvider(seed=2))
+        bars = first.get_bars("SYN0001")
+        assert same.get_bars("SYN0001") is bars
+        DataFetcher.invalidate_cache()
+        other_bars = other.get_bars("SYN0001")
+        assert other.data_folder != first.data_folder
+        assert other_bars.index.equals(bars.index)
+        assert not np.allclose(other_bars["Close"].to_numpy(), bars["Close"].to_numpy())
+        # The real market data folder never holds provider bars
+        assert not os.path.exists(os.path.join(str(tmp_path), first.marked_dir))
+
+    def test_get_many_reports_failures(self, tmp_path):
+        DataFetcher.invalidate_cache()
+        fetcher = DataFetcher(str(tmp_path), "1h", "2024-01-01", "2024-02-01")
+        fetcher._save_history("AAA", _bars(5))
+        fetcher._save_history("BBB", _bars(6))
+        fetcher._get_from_api = lambda symbol: None
+        results = {r.symbol: r for r in fetcher.get_many(["AAA", "BBB", "MISSING"], max_workers=2)}
+        assert len(results["AAA"].bars) == 5
+        assert len(results["BBB"].bars) == 6
+        assert results["MISSING"].bars is None
+        assert results["MISSING"].error is not None
+
+    def test_series_layout_fills_gaps(self, tmp_path):
+        DataFetcher.invalidate_cache()
+        requested = []
+
+        def fake_api(symbol, start, end):
+            requested.append((start, end))
+            bars = _bars(24 * 40, start="2024-01-01 00:30:00")
+            return bars[(bars.index >= start) & (bars.index < end)]
+
+        fetcher = DataFetcher(str(tmp_path), "1h", "2024-01-10", "2024-01-20", layout="series")
+        fetcher._get_from_api = fake_api
+        assert fetcher.get_bars("AAA").index[0] == to_unix("2024-01-10 00:30:00")
+
+        wider = DataFetcher(str(tmp_path), "1h", "2024-01-05", "2024-01-25", layout="series")
+        wider._get_from_api = fake_api
+        bars = wider.get_bars("AAA")
+        assert requested == [("2024-01-10", "2024-01-20"), ("2024-01-05", "2024-01-10"), ("2024-01-20", "2024-01-25")]
+        assert bars.index.is_unique and bars.index.is_monotonic_increasing
+        assert len(bars) == 24 * 20
+
+        DataFetcher.invalidate_cache()
+        inner = DataFetcher(str(tmp_path), "1h", "2024-01-06", "2024-01-07", layout="series")
+        inner._get_from_api = fake_api
+        assert len(inner.get_bars("AAA")) == 24
+        assert len(requested) == 3
+
+    def test_series_layout_records_empty_gaps(self, tmp_path):
+        DataFetcher.invalidate_cache()
+        requested = []
+
+        def fake_api(symbol, start, end):
+            requested.append((start, end))
+            if start >= "2024-01-20":
+                return None
+            bars = _bars(24 * 40, start="2024-01-01 00:30:00")
+            return bars[(bars.index >= start) & (bars.index < end)]
+
+        fetcher = DataFetcher(str(tmp_path), "1h", "2024-01-10", "2024-01-20", layout="series")
+        fetcher._get_from_api = fake_api
+        fetcher.get_bars("AAA")
+        wider = DataFetcher(str(tmp_path), "1h", "2024-01-10", "2024-01-25", layout="series")
+        wider._get_from_api = fake_api
+        assert len(wider.get_bars("AAA")) == 24 * 10
+        DataFetcher.invalidate_cache()
+        assert len(wider.get_bars("AAA")) == 24 * 10
+        assert requested == [("2024-01-10", "2024-01-20"), ("2024-01-20", "2024-01-25")]
+
+    def test_series_bulk_download_only_missing_ranges(self, tmp_path):
+        DataFetcher.invalidate_cache()
+        requested = []
+
+        class RecordingProvider(SyntheticProvider):
+            def download(self, symbols, interval, start, end):
+                requested.append((sorted(symbols), start, end))
+                return super().download(symbols, interval, start, end)
+
+        provider = RecordingProvider(seed=1)
+        DataFetcher(str(tmp_path), "1h", "2024-01-10", "2024-01-20", layout="series", provider=provider).bulk_download(["AAA"])
+        wider = DataFetcher(str(tmp_path), "1h", "2024-01-05", "2024-01-20", layout="series", provider=provider)
+        assert sorted(wider.bulk_download(["AAA", "BBB"])) == ["AAA", "BBB"]
+        assert requested[1:] == [(["AAA"], "2024-01-05", "2024-01-10"), (["BBB"], "2024-01-05", "2024-01-20")]
+
+
+class TestProviders:
+    def test_synthetic_is_deterministic(self, tmp_path):
+        DataFetcher.invalidate_cache()
+        provider = SyntheticProvider(seed=3, gap_prob=0.02)
+        fetcher = DataFetcher(str(tmp_path), "1h", "2024-01-01", "2024-04-01", provider=provider)
+        bars = fetcher.get_bars("COI0000Y")
+        again = SyntheticProvider(seed=3, gap_prob=0.02).history("COI0000Y", "1h", "2024-02-01", "2024-04-01")
+        np.testing.assert_allclose(bars.loc[to_unix("2024-02-01"):].to_numpy(), again.to_numpy())
+        assert fetcher._has_symbol("COI0000Y")
+
+    def test_incomplete_provider_fails_on_construction(self):
+        class HistoryOnly(DataProvider):
+            def history(self, symbol, interval, start, end):
+                return None
+
+        with pytest.raises(TypeError):
+            HistoryOnly()
+
+    def test_replay_provider(self, tmp_path):
+        DataFetcher.invalidate_cache()
+        recording = tmp_path / "recording"
+        recording.mkdir()
+        CsvBarStore().write(str(recording), "AAA", _bars(24 * 10))
+        fetcher = DataFetcher(str(tmp_path / "cache"), "1h", "2024-01-03", "2024-01-05", provider=ReplayProvider(str(recording)))
+        assert len(fetcher.get_bars("AAA")) == 48
+        assert fetcher.get_bars("BBB") is None
+
+
+class TestColumnarBarStore:
+    def test_round_trip(self, tmp_path):
+        store = ColumnarBarStore()
+        data = _bars(6)
+        store.write(str(tmp_path), "AAA", data)
+        assert store.symbols(str(tmp_path)) == ["AAA"]
+        loaded = store.read(str(tmp_path), "AAA")
+        pd.testing.assert_frame_equal(loaded, normalize_index(data))
+        columns = store.read_columns(str(tmp_path), "AAA")
+        assert columns["Datetime"].dtype == np.int64
+        assert columns["Close"][-1] == 5.0
+
+    def test_read_is_memory_mapped(self, tmp_path):
+        DataFetcher.invalidate_cache()
+        store = ColumnarBarStore()
+        mapped = []
+        original = store._map
+
+        def capture(folder, symbol):
+            mapped.append(original(folder, symbol))
+            return mapped[-1]
+
+        store._map = capture
+        store.write(str(tmp_path), "AAA", _bars(6))
+        data = store.read(str(tmp_path), "AAA")
+        assert np.shares_memory(data["Close"].to_numpy(), mapped[-1])
+
+        fetcher = DataFetcher(str(tmp_path), "1h", "2024-01-01", "2024-02-01", storage="columnar")
+        fetcher.store = store
+        fetcher._save_history("BBB", _bars(6))
+        assert np.shares_memory(fetcher.get_bars("BBB")["Close"].to_numpy(), mapped[-1])
+
+    def test_migrate_csv_folder(self, tmp_path):
+        CsvBarStore().write(str(tmp_path), "AAA", _bars(4))
+        assert migrate_csv_folder(str(tmp_path)) == ["AAA"]
+        loaded = ColumnarBarStore().read(str(tmp_path), "AAA")
+        pd.testing.assert_frame_equal(loaded, normalize_index(_bars(4)))
+
+
+class TestCatalog:
+    def test_adjacent_folder_lookup(self, tmp_path):
+        DataFetcher.invalidate_cache()
+        wide = DataFetcher(str(tmp_path), "1h", "2024-01-01", "2024-03-01")
+        wide._save_history("AAA", _bars(24 * 40))
+        narrow = DataFetcher(str(tmp_path), "1h", "2024-01-10", "2024-01-20")
+        assert narrow._adjacent_folder_with_symbol("AAA") == wide.data_folder
+        bars = narrow.get_bars("AAA")
+        assert bars.index.dtype == np.int64
+        assert fmt_datetime(bars.index[0]) == "2024-01-10 00:30:00"
+
+        reopened = Catalog(str(tmp_path), ".csv")
+        assert reopened.has(wide.marked_dir, "AAA")
+        assert reopened.find_covering("AAA", "1d", "2024-01-10", "2024-01-20") is None
+
+    def test_sees_migrated_folders(self, tmp_path):
+        DataFetcher.invalidate_cache()
+        fetcher = DataFetcher(str(tmp_path), "1h", "2024-01-01", "2024-03-01")
+        fetcher._save_history("AAA", _bars(24))
+        columnar = Catalog(str(tmp_path), ColumnarBarStore.extension)
+        assert not columnar.has(fetcher.marked_dir, "AAA")
+
+        migrate_csv_folder(fetcher.data_folder)
+        assert Catalog(str(tmp_path), ColumnarBarStore.extension).has(fetcher.marked_dir, "AAA")
+        assert Catalog(str(tmp_path), ".csv").has(fetcher.marked_dir, "AAA")
+
+    def test_concurrent_writers_keep_entries(self, tmp_path):
+        from concurrent.futures import ProcessPoolExecutor
+
+        Catalog(str(tmp_path), ".csv")
+        with ProcessPoolExecutor(max_workers=3) as executor:
+            list(executor.map(_add_symbols, [str(tmp_path)] * 3, ["A", "B", "C"], [30] * 3))
+        catalog = Catalog(str(tmp_path), ".csv")
+        assert len(catalog.symbols("1h$2024-01-01$2024-02-01")) == 90
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from data.panel import Panel, build_panel
+
+
+def _bars(n):
+    index = pd.date_range("2024-01-02 09:30:00", periods=n, freq="h").strftime("%Y-%m-%d %H:%M:%S")
+    values = {c: np.arange(n, dtype=np.float64) for c in ["Open", "High", "Low", "Close", "Volume"]}
+    return pd.DataFrame(values, index=pd.Index(index, name="Datetime"))
+
+
+class TestPanel:
+    def test_alignment_and_mask(self, tmp_path):
+        a = _bars(5)
+        b = _bars(5).iloc[[0, 1, 3, 4]]
+        panel = build_panel({"A": a, "B": b}, path=str(tmp_path))
+        assert panel.values.shape == (2, 5, 5)
+        assert panel.times.dtype == np.int64
+        assert panel.mask[0].all()
+        assert panel.mask[1].tolist() == [True, True, False, True, True]
+        assert panel.common_mask().tolist() == [True, True, False, True, True]
+        assert panel.series("B", "Close")[3] == 3.0
+        assert panel.position(panel.times[2]) == 2
+        assert panel.until(panel.times[1]).values.shape == (2, 2, 5)
+
+        reopened = Panel.open(str(tmp_path))
+        assert reopened.symbols == ["A", "B"]
+        np.testing.assert_array_equal(reopened.mask, panel.mask)
+        np.testing.assert_array_equal(reopened.field("Open"), panel.field("Open"))
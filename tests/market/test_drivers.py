@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from data.providers import SyntheticProvider
+from data.utils import DataFetcher
+from market.drivers import DSBatchDriver, DSDriver, PairsDriver
+from market.traders import SimulatedTrader
+from model.strategy import DSStrategy, PairsStrategy
+
+START = "2024-06-03 09:30:00"
+LIVE_START = "2024-10-01 09:30:00"
+
+
+class TestDSBatchDriver:
+    @pytest.mark.parametrize("gap_prob", [0.0, 0.02])
+    def test_matches_driver(self, tmp_path, gap_prob):
+        provider = SyntheticProvider(seed=3, gap_prob=gap_prob)
+        fetcher = DataFetcher(str(tmp_path), "1h", "2024-06-03", "2024-09-01", provider=provider)
+        symbols = SyntheticProvider.universe(n_walks=6)
+        results = DSBatchDriver(symbols, START, fetcher, 1000, update_interval=16, num_intervals=50).simulate()
+
+        for symbol in symbols:
+            trader = SimulatedTrader(fetcher, START)
+            strategy = DSStrategy(symbol, trader, 1000, update_interval=16, num_intervals=50)
+            error = DSDriver(symbol, strategy, trader, fetcher).simulate()
+            assert bool(error) == results.at[symbol, "error"]
+            if not error:
+                assert results.at[symbol, "final_capital"] == strategy.record[-1][1]
+        if gap_prob == 0:
+            assert not results["error"].any()
+
+
+class TestPairsDriver:
+    @pytest.mark.parametrize("analyzer", ["static", "kalman"])
+    def test_engines_match(self, tmp_path, analyzer):
+        fetcher = DataFetcher(str(tmp_path), "1h", "2024-06-03", "2024-11-01", provider=SyntheticProvider(seed=7))
+        pair = ("COI0001X", "COI0001Y")
+        runs = []
+        for engine in ["object", "vectorized"]:
+            trader = SimulatedTrader(fetcher, START)
+            strategy = PairsStrategy(*pair, trader, buying_power=1000, z_enter=1, z_exit=0.5)
+            driver = PairsDriver(*pair, LIVE_START, strategy, trader, fetcher, engine=engine, analyzer=analyzer)
+            assert not driver.simulate()
+            runs.append((strategy.record, driver.sharpe_ratio, strategy.max_dd_pct))
+        assert len(runs[0][0]) > 2
+        assert runs[0] == runs[1]
@@ -0,0 +1,31 @@
+from data.providers import SyntheticProvider
+from data.utils import DataFetcher
+from market.drivers import PairsDriver
+from market.sweep import PairsSweep
+from market.traders import SimulatedTrader
+from model.strategy import PairsStrategy
+
+TRADER_START = "2024-06-03 09:30:00"
+LIVE_START = "2024-10-01 09:30:00"
+
+
+class TestPairsSweep:
+    def test_matches_driver(self, tmp_path):
+        fetcher = DataFetcher(str(tmp_path), "1h", "2024-06-03", "2024-11-01", provider=SyntheticProvider(seed=7))
+        pair = ("COI0001X", "COI0001Y")
+        results = PairsSweep(fetcher, TRADER_START, LIVE_START).run([pair], [1, 2], [0.25, 0.5], [None, 5])
+        assert len(results) == 2 * 2 * 2
+
+        for z_enter in [1, 2]:
+            trader = SimulatedTrader(fetcher, TRADER_START)
+            strategy = PairsStrategy(*pair, trader, buying_power=1000, z_enter=z_enter, z_exit=0.5)
+            driver = PairsDriver(*pair, LIVE_START, strategy, trader, fetcher)
+            driver.simulate()
+
+            row = results[(results["z_enter"] == z_enter) & (results["z_exit"] == 0.5) & results["max_dd_pct"].isna()]
+            assert len(row) == 1
+            row = row.iloc[0]
+            assert row["sharpe_ratio"] == driver.sharpe_ratio
+            assert row["live_max_dd_pct"] == strategy.max_dd_pct
+            assert row["buying_power"] == strategy.buying_power
+            assert row["has_position"] == strategy.has_position
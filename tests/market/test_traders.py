@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from data.providers import SyntheticProvider
+from data.utils import DataFetcher, to_unix
+from market.clock import MarketCalendar, MarketClock
+from market.traders import SimulatedTrader
+
+
+class TestSimulatedTrader:
+    def test_daily_bars_at_midnight(self, tmp_path):
+        fetcher = DataFetcher(str(tmp_path), "1d", "2024-06-03", "2024-07-01", provider=SyntheticProvider(seed=3))
+        bars = fetcher.get_bars("SYN0001")
+        assert bars.index[0] == to_unix("2024-06-03")
+
+        trader = SimulatedTrader(fetcher, "2024-06-03 09:30:00")
+        assert trader.get_price("SYN0001") == bars.at[to_unix("2024-06-03"), "Open"]
+        trader.go_next_trading_hour()
+        assert trader.current_datetime == to_unix("2024-06-04")
+        assert trader.get_price("SYN0001") == bars.at[to_unix("2024-06-04"), "Open"]
+        # Synthetic business days include Juneteenth, which is not a market session
+        assert np.isfinite(trader.get_price_series("SYN0001")).sum() == len(bars) - 1
+
+    def test_unsupported_interval_uses_hourly_calendar(self):
+        assert MarketCalendar.get("30m") is MarketCalendar.get("1h")
+
+    def test_shared_clock_is_not_rewound(self, tmp_path):
+        fetcher = DataFetcher(str(tmp_path), "1h", "2024-06-03", "2024-07-01", provider=SyntheticProvider(seed=3))
+        clock = MarketClock(MarketCalendar.get("1h"), "2024-06-03 09:30:00")
+        first = SimulatedTrader(fetcher, "2024-06-03 09:30:00", clock=clock)
+        first.go_next_trading_hour()
+        now = clock.now
+        with pytest.raises(AssertionError):
+            SimulatedTrader(fetcher, "2024-06-03 09:30:00", clock=clock)
+        second = SimulatedTrader(fetcher, now, clock=clock)
+        assert first.current_datetime == second.current_datetime == now
+
+    def test_get_prices(self, tmp_path):
+        fetcher = DataFetcher(str(tmp_path), "1h", "2024-06-03", "2024-07-01", provider=SyntheticProvider(seed=3, gap_prob=0.1))
+        symbols = ["SYN0001", "SYN0002", "NOPE"]
+        trader = SimulatedTrader(fetcher, "2024-06-03 09:30:00")
+        times = trader.clock.times[trader.clock.cursor : trader.clock.cursor + 50].tolist() + [to_unix("2024-06-08 10:00:00")]
+
+        expected = np.full((len(times), len(symbols)), np.nan)
+        for i, t in enumerate(times):
+            trader.current_datetime = t
+            for j, symbol in enumerate(symbols):
+                price = trader.get_price(symbol)
+                if price is not None:
+                    expected[i, j] = price
+            np.testing.assert_array_equal(trader.get_prices(symbols), expected[i])
+        np.testing.assert_array_equal(trader.get_prices(symbols, times), expected)
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from model.backtest import backtest_pairs
+from model.strategy import PairsStrategy
+
+
+class _ArrayTrader:
+    """
+    Minimal stand-in for SimulatedTrader filling at precomputed price arrays
+    """
+
+    def __init__(self, times, prices):
+        self.times = times
+        self.prices = prices
+        self.positions = dict()
+        self.bar = 0
+
+    @property
+    def current_datetime(self):
+        return int(self.times[self.bar])
+
+    def get_price(self, symbol):
+        return self.prices[symbol][self.bar]
+
+    def trade(self, symbol, action, quantity):
+        self.positions.setdefault(symbol, 0)
+        if "Buy" in action:
+            self.positions[symbol] += quantity
+        else:
+            self.positions[symbol] -= quantity
+        return self.get_price(symbol) * quantity
+
+
+def _series(n, seed):
+    rng = np.random.default_rng(seed)
+    times = 1700000000 + 3600 * np.arange(n, dtype=np.int64)
+    x = 50 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    y = 10 + 1.3 * x + rng.normal(0, 0.5, n)
+    z = np.convolve(rng.normal(0, 1, n), np.ones(5) / 2, mode="same")
+    z[:3] = np.nan
+    return times, z, x, y
+
+
+class TestPairsBacktest:
+    @pytest.mark.parametrize("max_dd_pct", [100, 0.5])
+    def test_matches_strategy(self, max_dd_pct):
+        times, z, x, y = _series(2000, seed=3)
+        beta = 1.3
+        trader = _ArrayTrader(times, {"X": x, "Y": y})
+        strategy = PairsStrategy("X", "Y", trader, buying_power=1000, z_enter=1.5, z_exit=0.5)
+        strategy.max_dd_pct = max_dd_pct
+        for bar in range(len(times)):
+            trader.bar = bar
+            strategy.update(z[bar], -beta, 1)
+
+        result = backtest_pairs(times, z, beta, x, y, buying_power=1000, z_enter=1.5, z_exit=0.5, max_dd_pct=max_dd_pct)
+        assert len(result.entries) > 0
+        assert result.record == strategy.record
+        assert result.buying_power == strategy.buying_power
+        assert result.has_position == strategy.has_position
+        assert result.continue_trading == strategy.continue_trading
+        assert result.stopped_out == (max_dd_pct < 1)
+        assert result.final_short_bank == (strategy.short_bank["X"], strategy.short_bank["Y"])
+        assert result.final_positions == (trader.positions["X"], trader.positions["Y"])
+
+        applied = PairsStrategy("X", "Y", _ArrayTrader(times, {"X": x, "Y": y}), buying_power=1000)
+        result.apply_to(applied)
+        assert applied.record == strategy.record
+        assert applied.trader.positions == trader.positions
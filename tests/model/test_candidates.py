@@ -0,0 +1,25 @@
+import itertools
+
+import numpy as np
+
+from model.candidates import candidate_pairs
+
+
+class TestCandidatePairs:
+    def test_nearest_neighbours(self):
+        rng = np.random.default_rng(1)
+        common = rng.normal(size=(400, 2))
+        # Series 0-2 follow the first factor, 3-5 the second
+        returns = 0.01 * (np.repeat(common, 3, axis=1) + 0.3 * rng.normal(size=(400, 6)))
+        prices = 100 * np.cumprod(1 + returns, axis=0)
+
+        candidates = candidate_pairs(prices, neighbours=2)
+        assert sorted(map(tuple, candidates.pairs.tolist())) == [(0, 1), (0, 2), (1, 2), (3, 4), (3, 5), (4, 5)]
+        assert candidates.total_pairs == 15 and candidates.pruned == 9
+
+        clustered = candidate_pairs(prices, neighbours=5, cluster_distance=0.5)
+        assert len(np.unique(clustered.clusters)) == 2
+        assert np.array_equal(clustered.pairs, candidates.pairs)
+
+        everything = candidate_pairs(prices, neighbours=10)
+        assert everything.pairs.tolist() == [list(pair) for pair in itertools.combinations(range(6), 2)]
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+from model.kalman import KalmanHedge
+from pipelines.PairsTrader import PairsTraderKalman
+
+
+def _pairs(n=600, n_pairs=3):
+    rng = np.random.default_rng(5)
+    x = 50 + np.cumsum(rng.normal(0, 0.5, (n, n_pairs)), axis=0)
+    betas = np.array([0.8, 1.2, 2.0])[:n_pairs]
+    y = 3 + betas * x + rng.normal(0, 0.2, (n, n_pairs))
+    return x, y, betas
+
+
+class TestKalmanHedge:
+    def test_batched_matches_single(self):
+        x, y, betas = _pairs()
+        batched = KalmanHedge(3, delta=1e-6, observation_var=0.04).filter(x, y)
+        for i in range(3):
+            single = KalmanHedge(1, delta=1e-6, observation_var=0.04).filter(x[:, i], y[:, i])
+            assert np.allclose(batched.beta[:, i], single.beta)
+            assert np.allclose(batched.zscore[:, i], single.zscore)
+        assert np.allclose(batched.beta[-1], betas, atol=0.05)
+
+    def test_analyzer_update_matches_init(self):
+        x, y, _ = _pairs(n_pairs=1)
+        times = 1700000000 + 3600 * np.arange(len(x))
+        df_x = pd.DataFrame({"Open": x[:, 0]}, index=times)
+        df_y = pd.DataFrame({"Open": y[:, 0]}, index=times)
+
+        full = PairsTraderKalman(df_x, df_y, observation_var=0.04)
+        live = PairsTraderKalman(df_x.iloc[:400], df_y.iloc[:400], observation_var=0.04)
+        for i in range(400, len(times)):
+            live.update(df_x.iloc[[i]], df_y.iloc[[i]])
+        for t in times[[100, 450, -1]]:
+            assert np.isclose(live.get_zscore(t), full.get_zscore(t))
+            assert np.isclose(live.get_beta(t), full.get_beta(t))
+        assert np.isnan(full.get_zscore(times[5]))
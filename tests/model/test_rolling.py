@@ -0,0 +1,88 @@
+import numpy as np
+
+from model.rolling import RollingCointegration, RollingRegression, RollingStats
+
+
+class TestRollingStats:
+    def test_matches_window(self):
+        rng = np.random.default_rng(0)
+        values = 1e6 + np.cumsum(rng.normal(0, 1, 3000))
+        window = 210
+
+        stats = RollingStats(window, values[:100])
+        for i in range(100, len(values)):
+            stats.push(values[i])
+            expected = values[max(0, i + 1 - window) : i + 1]
+            assert np.isclose(stats.mean, expected.mean(), rtol=1e-12)
+            assert np.isclose(stats.std, expected.std(ddof=1), rtol=1e-8)
+        assert stats.buffer.shape == (window,)
+
+
+class TestRollingRegression:
+    def _data(self, n=1500):
+        rng = np.random.default_rng(1)
+        x = 100 + np.cumsum(rng.normal(0, 1, n))
+        y = 5 + (1.2 + 0.1 * np.sin(np.arange(n) / 200)) * x + rng.normal(0, 0.5, n)
+        return x, y
+
+    def test_window_matches_ols(self):
+        x, y = self._data()
+        window = 210
+        regression = RollingRegression(window, x=x[:300], y=y[:300])
+        for i in range(300, len(x)):
+            regression.push(x[i], y[i])
+            [beta, alpha] = np.polyfit(x[i + 1 - window : i + 1], y[i + 1 - window : i + 1], 1)
+            assert np.isclose(regression.beta, beta, rtol=1e-9)
+            assert np.isclose(regression.alpha, alpha, rtol=1e-9, atol=1e-9)
+
+    def test_forgetting_matches_weighted_ols(self):
+        x, y = self._data(400)
+        forgetting = 0.99
+        regression = RollingRegression(210, forgetting=forgetting, x=x, y=y)
+        weights = forgetting ** np.arange(len(x))[::-1]
+        [beta, alpha] = np.polyfit(x, y, 1, w=np.sqrt(weights))
+        assert np.isclose(regression.beta, beta, rtol=1e-9)
+        assert np.isclose(regression.alpha, alpha, rtol=1e-9)
+
+    def test_forgetting_skips_nan(self):
+        x, y = self._data(400)
+        forgetting = 0.99
+        expected = RollingRegression(210, forgetting=forgetting, x=x, y=y)
+        x[[50, 120]] = np.nan
+        y[200] = np.inf
+        regression = RollingRegression(210, forgetting=forgetting, x=x, y=y)
+        assert np.isfinite(regression.beta) and np.isfinite(regression.alpha)
+        valid = np.isfinite(x) & np.isfinite(y)
+        weights = forgetting ** np.arange(valid.sum())[::-1]
+        [beta, alpha] = np.polyfit(x[valid], y[valid], 1, w=np.sqrt(weights))
+        assert np.isclose(regression.beta, beta, rtol=1e-9)
+        assert np.isclose(regression.alpha, alpha, rtol=1e-9)
+        assert regression.count == expected.count - 3
+
+    def test_not_ready(self):
+        regression = RollingRegression(10, x=np.arange(5.0), y=np.arange(5.0))
+        assert np.isnan(regression.beta) and np.isnan(regression.alpha)
+
+
+class TestRollingCointegration:
+    def test_matches_coint(self):
+        import warnings
+
+        from statsmodels.tsa.stattools import coint
+
+        rng = np.random.default_rng(2)
+        base = 100 + np.cumsum(rng.normal(size=800))
+        y0 = 1.5 * base + 3 * np.convolve(rng.normal(size=803), [1, 0.5, 0.3, 0.2], "valid")
+        y1 = base + rng.normal(size=800)
+        # The relation breaks in the second half
+        y1[400:] = y1[400] + np.cumsum(rng.normal(size=400))
+        for kwargs in [dict(lags=1, autolag=None), dict(lags=3), dict()]:
+            result = RollingCointegration(150, stride=29, chunk_size=4, max_workers=2, **kwargs).run(y0, y1)
+            assert list(result.ends) == list(range(149, 800, 29))
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                expected = np.array([coint(y0[e - 149 : e + 1], y1[e - 149 : e + 1], maxlag=kwargs.get("lags"), autolag=kwargs.get("autolag", "aic"))[:2] for e in result.ends])
+            assert np.allclose(result.t_stat, expected[:, 0], rtol=1e-8)
+            assert np.allclose(result.p_value, expected[:, 1], rtol=1e-8, atol=1e-12)
+            assert np.array_equal(result.cointegrated, expected[:, 1] < 0.05)
+        assert result.cointegrated[0] and not result.cointegrated.all()
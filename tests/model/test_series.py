@@ -0,0 +1,30 @@
+import numpy as np
+
+from model.series import IndexedSeries
+
+
+class TestIndexedSeries:
+    def test_append_and_lookup(self):
+        series = IndexedSeries([10, 20, 30], [1.0, 2.0, 3.0], capacity=2)
+        for t in range(40, 1000, 10):
+            series.append(t, t / 10)
+        series.append(30, -1.0)
+
+        assert len(series) == 100
+        assert series.get(30) == 3.0
+        assert series.position(20) == 1
+        assert np.isnan(series.get(35))
+        assert series.position(35) == -1
+        assert np.array_equal(series.lookup([10, 15, 990]), [1.0, np.nan, 99.0], equal_nan=True)
+        frame = series.to_frame("Zscore")
+        assert list(frame.columns) == ["Datetime", "Zscore"]
+        assert frame["Zscore"].iloc[-1] == -1.0
+
+    def test_asof(self):
+        series = IndexedSeries([10, 20, 30], [1.0, 2.0, 3.0])
+        assert np.isnan(series.asof(5))
+        assert series.asof(20) == 2.0
+        assert series.asof(25) == 2.0
+        assert series.asof(100) == 3.0
+        series.append(15, 1.5)
+        assert series.asof(17) == 1.5
@@ -1,4 +1,4 @@
-from algo_model import statistics
+from model import statistics
 import numpy as np
 import math
 
@@ -8,3 +8,70 @@ class TestStatisticsClass:
         expected_t_stat = -1.9161322448371003
         t_stat = statistics.dickey_fuller(points)
         assert math.isclose(t_stat, expected_t_stat)
+
+    def test_engle_granger_screen(self):
+        from statsmodels.tsa.stattools import coint
+
+        rng = np.random.default_rng(0)
+        base = np.cumsum(rng.normal(size=300))
+        Y = np.stack([base + rng.normal(size=300), 2 * base + rng.normal(size=300), np.cumsum(rng.normal(size=300))], axis=1)
+        pairs = [(0, 1), (1, 0), (0, 2), (2, 1)]
+        for lags in [0, 2]:
+            t_stats, p_values = statistics.engle_granger_screen(Y, pairs, lags=lags)
+            for (i, j), t_stat, p_value in zip(pairs, t_stats, p_values):
+                expected = coint(Y[:, i], Y[:, j], maxlag=lags, autolag=None)
+                assert math.isclose(t_stat, expected[0], rel_tol=1e-9)
+                assert math.isclose(p_value, expected[1], rel_tol=1e-9, abs_tol=1e-12)
+
+    def test_adf_batch(self):
+        from statsmodels.tsa.stattools import adfuller
+
+        rng = np.random.default_rng(2)
+        series = np.cumsum(rng.normal(size=(3, 200)), axis=1)
+        series[1] = rng.normal(size=200)
+        ragged = series.copy()
+        ragged[2, :40] = np.nan
+        for model, regression in statistics.ADF_MODELS.items():
+            result = statistics.adf_batch(ragged, lags=2, model=model)
+            for row, t_stat, p_value in zip([series[0], series[1], series[2, 40:]], result.t_stat, result.p_value):
+                expected = adfuller(row, maxlag=2, autolag=None, regression=regression, result_object=False)
+                assert math.isclose(t_stat, expected[0], rel_tol=1e-9)
+                assert math.isclose(p_value, expected[1], rel_tol=1e-9, abs_tol=1e-12)
+            assert list(result.nobs) == [197, 197, 157]
+            assert result.is_stationary(0.01)[1]
+            assert np.array_equal(result.is_stationary(0.05), result.t_stat < result.crit_values(0.05))
+
+    def test_adf_batch_autolag(self):
+        from statsmodels.tsa.stattools import adfuller
+
+        rng = np.random.default_rng(3)
+        series = np.cumsum(rng.normal(size=(3, 300)), axis=1)
+        # An MA process that needs a few lags
+        series[1] = np.convolve(rng.normal(size=305), [1, 0.8, 0.6, 0.4, 0.2, 0.1], "valid")
+        ragged = series.copy()
+        ragged[2, -50:] = np.nan
+        result = statistics.adf_batch(ragged, lags=None, model="M1", autolag="AIC")
+        for row, t_stat, p_value, lags in zip([series[0], series[1], series[2, :-50]], result.t_stat, result.p_value, result.lags):
+            expected = adfuller(row, autolag="AIC", result_object=False)
+            assert math.isclose(t_stat, expected[0], rel_tol=1e-9)
+            assert math.isclose(p_value, expected[1], rel_tol=1e-9, abs_tol=1e-12)
+            assert lags == expected[2]
+
+    def test_engle_granger(self):
+        from statsmodels.tsa.adfvalues import mackinnoncrit
+        from statsmodels.tsa.stattools import coint
+
+        rng = np.random.default_rng(4)
+        base = np.cumsum(rng.normal(size=400))
+        y0 = 1.5 * base + rng.normal(size=400)
+        y1 = base + np.convolve(rng.normal(size=403), [1, 0.5, 0.3, 0.2], "valid")
+        y2 = np.cumsum(rng.normal(size=400))
+        for a, b in [(y0, y1), (y1, y0), (y0, y2)]:
+            for kwargs in [dict(), dict(maxlag=3), dict(maxlag=2, autolag=None)]:
+                t_stat, p_value, crit = statistics.engle_granger(a, b, **kwargs)
+                expected = coint(a, b, **kwargs)
+                assert math.isclose(t_stat, expected[0], rel_tol=1e-9)
+                assert math.isclose(p_value, expected[1], rel_tol=1e-9, abs_tol=1e-12)
+                assert np.allclose(crit, expected[2], rtol=1e-12)
+        for N in [1, 2, 5]:
+            assert np.allclose(statistics.mackinnon_crit_values(N, "ct", 250), mackinnoncrit(N, "ct", 250), rtol=1e-12)
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from pipelines.PairsTrader import PairsTrader
+
+
+def _frames(bars=400, seed=3):
+    rng = np.random.default_rng(seed)
+    x = 100 + np.cumsum(rng.normal(size=bars))
+    # Cointegrated for the first half only
+    y = np.concatenate([1.5 * x[: bars // 2] + rng.normal(size=bars // 2), 100 + np.cumsum(rng.normal(size=bars - bars // 2))])
+    index = pd.Index(1704205800 + 3600 * np.arange(bars), name="Datetime")
+    return pd.DataFrame({"Open": x}, index=index), pd.DataFrame({"Open": y}, index=index)
+
+
+class TestPairsTrader:
+    def test_check_cointegration(self):
+        df_x, df_y = _frames()
+        trader = PairsTrader(df_x, df_y, window_size=100)
+        trader.check_cointegration(stride=10)
+        rolling = trader.rolling_coint
+        assert list(rolling.columns) == ["PValue", "Cointegrated"]
+        assert list(rolling.index) == list(df_x.index[99::10])
+        assert rolling["Cointegrated"].iloc[0] and not rolling["Cointegrated"].all()
+
+        # Bars between two checks report the latest check before them, bars before the first check are not cointegrated
+        for i in range(99, 400):
+            checked = df_x.index[99 + (i - 99) // 10 * 10]
+            assert trader.is_cointegrated_on_date(df_x.index[i]) == bool(rolling.at[checked, "Cointegrated"])
+        assert not trader.is_cointegrated_on_date(df_x.index[98])
+
+    def test_incremental_check_cointegration(self):
+        df_x, df_y = _frames()
+        full = PairsTrader(df_x, df_y, window_size=100)
+        full.check_cointegration(stride=10)
+
+        trader = PairsTrader(df_x.iloc[:250], df_y.iloc[:250], window_size=100)
+        trader.check_cointegration(stride=10)
+        trader.df_x = df_x
+        trader.df_y = df_y
+        trader.check_cointegration(stride=10)
+        trader.check_cointegration(stride=10)
+        pd.testing.assert_frame_equal(trader.rolling_coint, full.rolling_coint)
@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+
+from pipelines.pairs_trading_pipeline import PairsTradingPipeline, StationarityStruct
+
+
+def _data_set(n_tickers=6, bars=300, seed=3):
+    rng = np.random.default_rng(seed)
+    base = 100 + np.cumsum(rng.normal(size=bars))
+    data_set = {}
+    for i in range(n_tickers):
+        if i % 2 == 0:
+            # Cointegrated with base
+            series = (1 + 0.1 * i) * base + rng.normal(size=bars)
+        else:
+            series = 100 + np.cumsum(rng.normal(size=bars))
+        # Columns as loaded by Portfolio.find_pairs, Open is the second one
+        data_set[f"T{i}"] = np.stack([np.zeros(bars), series], axis=1)
+    return data_set
+
+
+def _pipeline(data_set, **kwargs):
+    pipeline = PairsTradingPipeline(data_set, cointegration_cutoff=0.05, **kwargs)
+    pipeline._clean_data()
+    pipeline.stationarity_set = {ticker: StationarityStruct(0.0, True, 1) for ticker in data_set}
+    pipeline._find_cointegrated_pairs()
+    return pipeline.cointegrated_pairs_set
+
+
+class TestPairsTradingPipeline:
+    @pytest.mark.parametrize("chunk_size", [None, 1, 4])
+    def test_processes_match_serial(self, chunk_size):
+        data_set = _data_set()
+        serial = _pipeline(data_set)
+        parallel = _pipeline(data_set, max_workers=2, use_processes=True, chunk_size=chunk_size)
+        assert len(serial) > 0
+        assert parallel == serial
+
+    def test_screen_keeps_cointegrated_pairs(self):
+        data_set = _data_set()
+        full = _pipeline(data_set)
+        screened = _pipeline(data_set, screen_cutoff=0.2)
+        assert screened == full
+
+    def test_candidates_prune_pairs(self):
+        data_set = _data_set()
+        full = _pipeline(data_set)
+        pipeline = PairsTradingPipeline(data_set, cointegration_cutoff=0.05, candidate_neighbours=2)
+        pipeline._clean_data()
+        pipeline.stationarity_set = {ticker: StationarityStruct(0.0, True, 1) for ticker in data_set}
+        pipeline._find_cointegrated_pairs()
+        report = pipeline.candidate_report
+        assert report["pairs"] == 15 and report["pruned"] > 0
+        assert report["candidates"] + report["pruned"] == report["pairs"]
+        assert pipeline.cointegrated_pairs_set <= full
+
+    def test_cache_reuses_results(self, tmp_path):
+        from model.result_cache import StatTestCache
+
+        data_set = _data_set()
+        expected = PairsTradingPipeline(data_set, cointegration_cutoff=0.05).run()
+        cache = StatTestCache(str(tmp_path / "tests.sqlite"))
+        first = PairsTradingPipeline(data_set, cointegration_cutoff=0.05, cache=cache).run()
+        # Two stationarity tests per series and one cointegration test per pair
+        assert cache.hits == 0 and cache.misses == 6 * 2 + 15
+
+        # Changing one series only recomputes the tests that involve it
+        data_set["T5"] = data_set["T5"] * 1.01
+        second = PairsTradingPipeline(data_set, cointegration_cutoff=0.05, cache=cache).run()
+        assert cache.hits == 4 + 10 + 6 and cache.misses == 27 + 2 + 5
+        again = PairsTradingPipeline(data_set, cointegration_cutoff=0.05, cache=cache).run()
+        assert set(first) == set(expected) and set(again) == set(second)
+
+    def test_stationarity_matches_adfuller(self):
+        from statsmodels.tsa.stattools import adfuller
+
+        from pipelines.pairs_trading_pipeline import ADF_PARAMS
+
+        data_set = _data_set()
+        data_set["T1"] = data_set["T1"][50:]
+        pipeline = PairsTradingPipeline(data_set)
+        pipeline._clean_data()
+        pipeline._generate_stationary_set()
+        integrator = pipeline.integrator.integrator_dict[pipeline.integrator_function_key]
+        for ticker, stationarity_obj in pipeline.stationarity_set.items():
+            series = pipeline.cleaned_data_set[ticker]
+            for _ in range(stationarity_obj.integrator_order):
+                series = integrator(series)
+            expected = adfuller(series, **ADF_PARAMS)[1]
+            assert stationarity_obj.p_value == pytest.approx(expected, rel=1e-9)
+            assert stationarity_obj.integrator_order == 1
+
+    def test_fixed_lags_stationarity(self):
+        from statsmodels.tsa.stattools import adfuller
+
+        data_set = _data_set()
+        data_set["T1"] = data_set["T1"][50:]
+        pipeline = PairsTradingPipeline(data_set, adf_lags=1)
+        pipeline._clean_data()
+        pipeline._generate_stationary_set()
+        integrator = pipeline.integrator.integrator_dict[pipeline.integrator_function_key]
+        for ticker, stationarity_obj in pipeline.stationarity_set.items():
+            series = pipeline.cleaned_data_set[ticker]
+            for _ in range(stationarity_obj.integrator_order):
+                series = integrator(series)
+            expected = adfuller(series, maxlag=1, autolag=None, result_object=False)[1]
+            assert stationarity_obj.p_value == pytest.approx(expected, rel=1e-9)
+            assert stationarity_obj.is_stationary == (expected < pipeline.adf_cutoff)
+            assert stationarity_obj.integrator_order == 1
+
+    def test_stationarity_cached(self, tmp_path):
+        from model.result_cache import StatTestCache
+
+        data_set = _data_set()
+        cache = StatTestCache(str(tmp_path / "tests.sqlite"))
+        stationarity_sets = []
+        for _ in range(2):
+            pipeline = PairsTradingPipeline(data_set, adf_lags=1, cache=cache)
+            pipeline._clean_data()
+            pipeline._generate_stationary_set()
+            stationarity_sets.append(pipeline.stationarity_set)
+        assert cache.misses == 6 * 2 and cache.hits == 6 * 2
+        assert stationarity_sets[0] == stationarity_sets[1]
+
+        # The lags are part of the key
+        pipeline = PairsTradingPipeline(data_set, adf_lags=2, cache=cache)
+        pipeline._clean_data()
+        pipeline._generate_stationary_set()
+        assert cache.misses == 6 * 2 * 2